@@ -1,32 +1,54 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
-from sqlmodel import Session
-import json
+from starlette.websockets import WebSocketState
+from sqlmodel.ext.asyncio.session import AsyncSession
+from pydantic import BaseModel
+from contextlib import aclosing
 import asyncio
-from typing import Dict
-from concurrent.futures import ThreadPoolExecutor
+import json
+import math
+from typing import Optional, AsyncIterator
 
-from db import get_session
-from services.chat_service import ChatService
+from db import get_async_session, get_async_read_session, async_session_from_generator
+from services.chat_service import ChatService, GenerationCancelled
+from services.scheduler import SchedulerBusy
+from services.session_archiver import session_archiver
+from services.metadata_cache import metadata_cache
+from services.connection_registry import connection_registry
+from lib.resilience import CircuitOpenError, RetryableGeminiError
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
-# Store active WebSocket connections
-active_connections: Dict[str, WebSocket] = {}
 chat_service = ChatService()
-executor = ThreadPoolExecutor(max_workers=4)
+
+
+class ChatMessageRequest(BaseModel):
+    content: str
 
 
 @router.websocket("/ws/{session_id}")
 async def websocket_chat(websocket: WebSocket, session_id: str):
-    """WebSocket endpoint for real-time chat communication."""
+    """
+    WebSocket endpoint for real-time chat communication.
+    
+    The receive loop only reads frames. Chat messages go onto an ordered
+    per-session queue that a separate task works through, so pings, cancel
+    frames and follow-up messages are handled while a reply is generating.
+    When the generation queue is full the message is answered with a "busy"
+    frame instead of being queued.
+    
+    The socket is claimed in the connection registry, so a session has at
+    most one socket across all workers, and frames published for the session
+    from any worker reach it.
+    """
+    connection = ChatConnection(websocket, session_id)
     
     # Prevent multiple connections per session
-    if session_id in active_connections:
+    if not await connection_registry.claim(session_id, connection.send):
         await websocket.close(code=4000, reason="Session already has active connection")
         return
     
     await websocket.accept()
-    active_connections[session_id] = websocket
+    connection.start()
     
     try:
         while True:
@@ -38,47 +60,145 @@ async def websocket_chat(websocket: WebSocket, session_id: str):
                 user_message = message_data.get("content", "")
                 
                 if user_message.strip():
-                    # Process message and get both user and AI data
-                    try:
-                        response_data = await _process_message_async(session_id, user_message)
-                        
-                        # Send user message confirmation with real ID
-                        await websocket.send_text(json.dumps({
-                            "type": "user_message",
-                            "content": response_data["user_message"]["content"],
-                            "payload_id": response_data["user_message"]["id"],
-                            "timestamp": response_data["user_message"]["created_at"].isoformat()
-                        }))
-                        
-                        # Send AI response
-                        await websocket.send_text(json.dumps({
-                            "type": "ai_response",
-                            "content": response_data["ai_response"]["content"],
-                            "payload_id": response_data["ai_response"]["id"],
-                            "timestamp": response_data["ai_response"]["created_at"].isoformat()
-                        }))
-                    except Exception as e:
-                        await websocket.send_text(json.dumps({
-                            "type": "error",
-                            "message": f"Failed to generate response: {str(e)}"
-                        }))
+                    connection.queue.put_nowait(user_message)
+            
+            elif message_data.get("type") == "cancel":
+                connection.cancel()
             
             elif message_data.get("type") == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+                await connection.send({"type": "pong"})
                 
     except WebSocketDisconnect:
-        if session_id in active_connections:
-            del active_connections[session_id]
+        pass
+    except Exception as e:
+        pass
+    finally:
+        # Closing the socket aborts any in-flight generation; the session is released
+        # even if the server cancels us while the partial reply is being stored
+        try:
+            await connection.close()
+        finally:
+            await connection_registry.release(session_id)
+
+
+class ChatConnection:
+    """Per-socket state: the ordered message queue and the reply currently being generated."""
+    
+    def __init__(self, websocket: WebSocket, session_id: str):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.current: Optional[asyncio.Task] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.closed = False
+        # Set by a client cancel frame; any other cancellation of a reply is the socket closing
+        self.cancel_requested = False
+        self._send_lock = asyncio.Lock()
+    
+    async def send(self, frame: dict):
+        """Send a frame; serialized so the receive loop and the worker never interleave writes."""
+        async with self._send_lock:
+            # Frames produced after the client went away (e.g. "cancelled") are dropped
+            if self.websocket.client_state != WebSocketState.CONNECTED:
+                return
+            await self.websocket.send_text(json.dumps(frame))
+    
+    def cancel(self) -> bool:
+        """Abort the reply currently being generated, if any, at the client's request."""
+        if self.current and not self.current.done():
+            self.cancel_requested = True
+            self.current.cancel()
+            return True
+        return False
+    
+    def start(self):
+        """Start the worker that replies to queued messages."""
+        self.worker = asyncio.create_task(self.process_messages())
+    
+    async def close(self):
+        """Stop taking messages and abort the reply in flight; returns once the worker has exited."""
+        self.closed = True
+        if self.current:
+            # The worker exits when the cancellation reaches it; cancelling the worker as well
+            # would interrupt the reply again while it stores the partial text
+            self.current.cancel()
+        else:
+            self.worker.cancel()
+        await asyncio.wait({self.worker})
+    
+    async def process_messages(self):
+        """Work through queued messages one at a time, in the order they arrived, until closed."""
+        while not self.closed:
+            user_message = await self.queue.get()
+            self.cancel_requested = False
+            self.current = asyncio.create_task(self._reply(user_message))
+            try:
+                await self.current
+            finally:
+                self.current = None
+    
+    async def _reply(self, user_message: str):
+        # Forward user confirmation, AI deltas and the final AI response as they arrive
+        try:
+            events = _stream_message_async(self.session_id, user_message)
+            async with aclosing(events):
+                async for event in events:
+                    await self.send(_event_to_frame(event))
+        except GenerationCancelled as e:
+            if not self.cancel_requested:
+                raise asyncio.CancelledError() from e
+            await self.send({
+                "type": "cancelled",
+                "content": e.payload.content,
+                "payload_id": e.payload.id,
+                "timestamp": e.payload.created_at.isoformat()
+            })
+        except SchedulerBusy as e:
+            await self.send({"type": "busy", "message": str(e)})
+        except asyncio.CancelledError:
+            if not self.cancel_requested:
+                raise
+            # Cancelled while sending a frame; the partial reply was stored by the chat service
+            asyncio.current_task().uncancel()
+            await self.send({"type": "cancelled"})
+        except Exception as e:
+            await self.send({
+                "type": "error",
+                "message": f"Failed to generate response: {str(e)}"
+            })
+
+
+@router.post("/{session_id}/messages")
+async def post_chat_message(session_id: str, request: ChatMessageRequest, db_session: AsyncSession = Depends(get_async_session)):
+    """
+    Send a message via HTTP and wait for the complete reply; 503 when the server is busy or Gemini is down.
+    
+    Both messages are also published to the session's WebSocket, on whichever
+    worker holds it, so an open chat window shows them.
+    """
+    try:
+        result = await chat_service.send_message(session_id, request.content, db_session)
+    except SchedulerBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    except RetryableGeminiError as e:
+        # Still failing after the client's own retries
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        if session_id in active_connections:
-            del active_connections[session_id]
+        raise HTTPException(status_code=500, detail=str(e))
+    for event_type, message in (("user_message", result["user_message"]), ("ai_response", result["ai_response"])):
+        await connection_registry.publish(session_id, _event_to_frame({"type": event_type, **message}))
+    return result
 
 
 @router.get("/{session_id}/history")
-async def get_chat_history(session_id: str, db_session: Session = Depends(get_session)):
+async def get_chat_history(session_id: str, db_session: AsyncSession = Depends(get_async_read_session)):
     """Get chat history for a session via HTTP."""
     try:
-        messages = chat_service.get_session_messages(session_id, db_session)
+        messages = await chat_service.get_session_messages(session_id, db_session)
         return {"messages": messages}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -89,17 +209,47 @@ async def get_chat_history(session_id: str, db_session: Session = Depends(get_se
 
 @router.get("/active-connections")
 async def get_active_connections():
-    """Get list of active WebSocket connections (for debugging)."""
-    return {"active_sessions": list(active_connections.keys())}
+    """Get list of active WebSocket connections across all workers (for debugging)."""
+    return {"active_sessions": await connection_registry.sessions()}
 
 
-# Helper function for async processing
-async def _process_message_async(session_id: str, message: str) -> dict:
-    """Process a chat message asynchronously using thread pool."""
-    loop = asyncio.get_event_loop()
-    
-    def _send_message():
-        with next(get_session()) as db_session:
-            return chat_service.send_message(session_id, message, db_session)
-    
-    return await loop.run_in_executor(executor, _send_message) 
\ No newline at end of file
+@router.get("/stats")
+async def get_chat_stats():
+    """Get cache statistics for the chat pipeline (for debugging)."""
+    response_cache = chat_service.gemini_client.response_cache
+    single_flight = chat_service.gemini_client.single_flight
+    return {
+        "history_cache": chat_service.history_cache.stats(),
+        "response_cache": response_cache.stats() if response_cache else None,
+        "single_flight": single_flight.stats() if single_flight else None,
+        "payload_writer": chat_service.payload_writer.stats(),
+        "scheduler": chat_service.scheduler.stats(),
+        "circuit_breaker": chat_service.gemini_client.circuit_breaker.stats(),
+        "session_archiver": session_archiver.stats(),
+        "metadata_cache": metadata_cache.stats(),
+        "connection_registry": await connection_registry.stats(),
+        "retrieval": chat_service.retriever.stats(),
+        "stage_timings": chat_service.timings.stats(),
+    }
+
+
+# Helper functions for async processing
+async def _stream_message_async(session_id: str, message: str) -> AsyncIterator[dict]:
+    """Run the streaming chat pipeline, yielding its events as they arrive."""
+    async with async_session_from_generator() as db_session:
+        events = chat_service.stream_message(session_id, message, db_session)
+        async with aclosing(events):
+            async for event in events:
+                yield event
+
+
+def _event_to_frame(event: dict) -> dict:
+    """Convert a chat service event into the WebSocket frame sent to the client."""
+    if event["type"] == "ai_delta":
+        return {"type": "ai_delta", "content": event["content"]}
+    return {
+        "type": event["type"],
+        "content": event["content"],
+        "payload_id": event["id"],
+        "timestamp": event["created_at"].isoformat()
+    }
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session
-from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import AsyncIterator, List, Optional
 
-from db import get_session
+from db import get_async_session, get_async_read_session, async_session_from_generator
+from lib._utils import logger
 from data.models import (
     InteractionSessionCreate,
     InteractionSessionRead,
@@ -14,79 +16,129 @@ from data.models import (
     InteractionPayloadWithSession,
     InteractionFrom,
 )
-from services.interaction_service import InteractionService
+from services.interaction_service import AsyncInteractionService, InteractionService
 
-interaction_service = InteractionService()
+interaction_service = AsyncInteractionService()
 
 # Session router
 session_router = APIRouter(prefix="/interaction-sessions", tags=["Interaction Sessions"])
 
 @session_router.post("/", response_model=InteractionSessionRead)
-def create_interaction_session(
+async def create_interaction_session(
     session_data: InteractionSessionCreate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Create a new interaction session"""
-    return interaction_service.create_session(session, session_data)
+    return await interaction_service.create_session(session, session_data)
 
 @session_router.get("/", response_model=List[InteractionSessionRead])
-def get_interaction_sessions(
+async def get_interaction_sessions(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    session: Session = Depends(get_session)
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: return the rows after it"),
+    before: Optional[str] = Query(None, description="Cursor from X-Prev-Cursor: return the rows before it"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get all interaction sessions"""
-    return interaction_service.get_sessions(session, skip=skip, limit=limit)
+    try:
+        sessions = await interaction_service.get_sessions(session, skip=skip, limit=limit, after=after, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(InteractionService.session_pages.headers(sessions, limit, after, before))
+    return sessions
 
 @session_router.get("/recent", response_model=List[InteractionSessionRead])
-def get_recent_interaction_sessions(
+async def get_recent_interaction_sessions(
     limit: int = Query(10, ge=1, le=100),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get recent interaction sessions"""
-    return interaction_service.get_recent_sessions(session, limit=limit)
+    return await interaction_service.get_recent_sessions(session, limit=limit)
 
 @session_router.get("/{session_id}", response_model=InteractionSessionRead)
-def get_interaction_session(
+async def get_interaction_session(
     session_id: str,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get a specific interaction session by ID"""
-    interaction_session = interaction_service.get_session(session, session_id)
+    interaction_session = await interaction_service.get_session(session, session_id)
     if not interaction_session:
         raise HTTPException(status_code=404, detail="Interaction session not found")
     return interaction_session
 
+async def _stream_session_with_payloads(
+    session: AsyncSession, interaction_session: InteractionSessionWithPayloads, chunk: int
+) -> AsyncIterator[str]:
+    # NDJSON: the session first, then one payload per line, read a page at a time
+    yield interaction_session.model_dump_json(exclude={"payloads"}) + "\n"
+    payloads = interaction_session.payloads
+    while True:
+        for payload in payloads:
+            yield InteractionPayloadRead.model_validate(payload).model_dump_json(by_alias=True) + "\n"
+        if len(payloads) < chunk:
+            return
+        after = InteractionService.session_payload_pages.cursor(payloads[-1])
+        payloads = await interaction_service.get_session_payloads(session, interaction_session.id, limit=chunk, after=after)
+
 @session_router.get("/{session_id}/with-payloads", response_model=InteractionSessionWithPayloads)
-def get_interaction_session_with_payloads(
+async def get_interaction_session_with_payloads(
     session_id: str,
-    session: Session = Depends(get_session)
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000, description="Payloads per page (per read when streaming)"),
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: continue after this payload"),
+    stream: bool = Query(False, description="Stream the session and every payload as NDJSON"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
-    """Get an interaction session with all its payloads"""
-    interaction_session = interaction_service.get_session_with_payloads(session, session_id)
+    """Get an interaction session with a page of its payloads, oldest first"""
+    try:
+        interaction_session = await interaction_service.get_session_with_payloads(session, session_id, limit=limit, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not interaction_session:
         raise HTTPException(status_code=404, detail="Interaction session not found")
+    if stream:
+        return StreamingResponse(
+            _stream_session_with_payloads(session, interaction_session, limit), media_type="application/x-ndjson"
+        )
+    response.headers.update(InteractionService.session_payload_pages.headers(interaction_session.payloads, limit, after))
     return interaction_session
 
 @session_router.put("/{session_id}", response_model=InteractionSessionRead)
-def update_interaction_session(
+async def update_interaction_session(
     session_id: str,
     session_update: InteractionSessionUpdate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Update an interaction session"""
-    interaction_session = interaction_service.update_session(session, session_id, session_update)
+    interaction_session = await interaction_service.update_session(session, session_id, session_update)
     if not interaction_session:
         raise HTTPException(status_code=404, detail="Interaction session not found")
     return interaction_session
 
+async def _purge_session(session_id: str):
+    try:
+        async with async_session_from_generator() as session:
+            await interaction_service.purge_session(session, session_id)
+    except Exception as e:
+        logger.error(f"Purging session {session_id} failed: {e}")
+
 @session_router.delete("/{session_id}")
-def delete_interaction_session(
+async def delete_interaction_session(
     session_id: str,
-    session: Session = Depends(get_session)
+    response: Response,
+    background_tasks: BackgroundTasks,
+    purge: bool = Query(False, description="Respond 202 at once and delete the payloads in the background in chunks"),
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Delete an interaction session"""
-    success = interaction_service.delete_session(session, session_id)
+    if purge:
+        if not await interaction_service.get_session(session, session_id):
+            raise HTTPException(status_code=404, detail="Interaction session not found")
+        background_tasks.add_task(_purge_session, session_id)
+        response.status_code = 202
+        return {"message": "Session purge started"}
+    success = await interaction_service.delete_session(session, session_id)
     if not success:
         raise HTTPException(status_code=404, detail="Interaction session not found")
     return {"message": "Session deleted successfully"}
@@ -95,81 +147,113 @@ def delete_interaction_session(
 payload_router = APIRouter(prefix="/interaction-payloads", tags=["Interaction Payloads"])
 
 @payload_router.post("/", response_model=InteractionPayloadRead)
-def create_interaction_payload(
+async def create_interaction_payload(
     payload_data: InteractionPayloadCreate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Create a new interaction payload"""
-    return interaction_service.create_payload(session, payload_data)
+    return await interaction_service.create_payload(session, payload_data)
 
 @payload_router.get("/", response_model=List[InteractionPayloadRead])
-def get_interaction_payloads(
+async def get_interaction_payloads(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    session: Session = Depends(get_session)
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: return the rows after it"),
+    before: Optional[str] = Query(None, description="Cursor from X-Prev-Cursor: return the rows before it"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get all interaction payloads"""
-    return interaction_service.get_payloads(session, skip=skip, limit=limit)
+    try:
+        payloads = await interaction_service.get_payloads(session, skip=skip, limit=limit, after=after, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(InteractionService.payload_pages.headers(payloads, limit, after, before))
+    return payloads
 
 @payload_router.get("/by-type/{from_type}", response_model=List[InteractionPayloadRead])
-def get_payloads_by_type(
+async def get_payloads_by_type(
     from_type: InteractionFrom,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    session: Session = Depends(get_session)
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: return the rows after it"),
+    before: Optional[str] = Query(None, description="Cursor from X-Prev-Cursor: return the rows before it"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get payloads filtered by sender type (user/model)"""
-    return interaction_service.get_payloads_by_type(session, from_type, skip=skip, limit=limit)
+    try:
+        payloads = await interaction_service.get_payloads_by_type(session, from_type, skip=skip, limit=limit, after=after, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(InteractionService.payload_pages.headers(payloads, limit, after, before))
+    return payloads
 
 @payload_router.get("/failed", response_model=List[InteractionPayloadRead])
-def get_failed_payloads(
+async def get_failed_payloads(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    session: Session = Depends(get_session)
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: return the rows after it"),
+    before: Optional[str] = Query(None, description="Cursor from X-Prev-Cursor: return the rows before it"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get payloads that failed (ok=False)"""
-    return interaction_service.get_failed_payloads(session, skip=skip, limit=limit)
+    try:
+        payloads = await interaction_service.get_failed_payloads(session, skip=skip, limit=limit, after=after, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(InteractionService.payload_pages.headers(payloads, limit, after, before))
+    return payloads
 
 @payload_router.get("/by-session/{session_id}", response_model=List[InteractionPayloadRead])
-def get_session_payloads(
+async def get_session_payloads(
     session_id: str,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    session: Session = Depends(get_session)
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: return the rows after it"),
+    before: Optional[str] = Query(None, description="Cursor from X-Prev-Cursor: return the rows before it"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get all payloads for a specific session"""
-    return interaction_service.get_session_payloads(session, session_id, skip=skip, limit=limit)
+    try:
+        payloads = await interaction_service.get_session_payloads(session, session_id, skip=skip, limit=limit, after=after, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(InteractionService.session_payload_pages.headers(payloads, limit, after, before))
+    return payloads
 
 @payload_router.get("/{payload_id}", response_model=InteractionPayloadRead)
-def get_interaction_payload(
+async def get_interaction_payload(
     payload_id: int,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get a specific interaction payload by ID"""
-    payload = interaction_service.get_payload(session, payload_id)
+    payload = await interaction_service.get_payload(session, payload_id)
     if not payload:
         raise HTTPException(status_code=404, detail="Interaction payload not found")
     return payload
 
 @payload_router.get("/{payload_id}/with-session", response_model=InteractionPayloadWithSession)
-def get_payload_with_session(
+async def get_payload_with_session(
     payload_id: int,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get an interaction payload with its session data"""
-    payload = interaction_service.get_payload_with_session(session, payload_id)
+    payload = await interaction_service.get_payload_with_session(session, payload_id)
     if not payload:
         raise HTTPException(status_code=404, detail="Interaction payload not found")
     return payload
 
 @payload_router.put("/{payload_id}", response_model=InteractionPayloadRead)
-def update_interaction_payload(
+async def update_interaction_payload(
     payload_id: int,
     payload_update: InteractionPayloadUpdate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Update an interaction payload"""
-    payload = interaction_service.update_payload(session, payload_id, payload_update)
+    payload = await interaction_service.update_payload(session, payload_id, payload_update)
     if not payload:
         raise HTTPException(status_code=404, detail="Interaction payload not found")
     return payload 
\ No newline at end of file
@@ -1,83 +1,126 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import AsyncIterator, List, Optional
 
-from db import get_session
+from db import get_async_session, get_async_read_session
 from data.models import (
     MemoryCollectionCreate,
     MemoryCollectionRead,
     MemoryCollectionUpdate,
     MemoryCollectionWithDocuments,
+    MemoryDocumentRead,
 )
-from services.memory_collection_service import MemoryCollectionService
+from services.memory_collection_service import AsyncMemoryCollectionService, MemoryCollectionService
+from services.memory_document_service import MemoryDocumentService
 
 router = APIRouter(prefix="/memory-collections", tags=["Memory Collections"])
-memory_collection_service = MemoryCollectionService()
+memory_collection_service = AsyncMemoryCollectionService()
 
 
 @router.post("/", response_model=MemoryCollectionRead)
-def create_memory_collection(
+async def create_memory_collection(
     collection: MemoryCollectionCreate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Create a new memory collection"""
-    return memory_collection_service.create_collection(session, collection)
+    return await memory_collection_service.create_collection(session, collection)
 
 
 @router.get("/", response_model=List[MemoryCollectionRead])
-def get_memory_collections(
+async def get_memory_collections(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    session: Session = Depends(get_session)
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: return the rows after it"),
+    before: Optional[str] = Query(None, description="Cursor from X-Prev-Cursor: return the rows before it"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get all memory collections"""
-    return memory_collection_service.get_collections(session, skip=skip, limit=limit)
+    try:
+        collections = await memory_collection_service.get_collections(session, skip=skip, limit=limit, after=after, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(MemoryCollectionService.collection_pages.headers(collections, limit, after, before))
+    return collections
 
 
 @router.get("/{collection_id}", response_model=MemoryCollectionRead)
-def get_memory_collection(
+async def get_memory_collection(
     collection_id: int,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get a specific memory collection by ID"""
-    collection = memory_collection_service.get_collection(session, collection_id)
+    collection = await memory_collection_service.get_collection(session, collection_id)
     if not collection:
         raise HTTPException(status_code=404, detail="Memory collection not found")
     return collection
 
 
+async def _stream_collection_with_documents(
+    session: AsyncSession, collection: MemoryCollectionWithDocuments, chunk: int, include_archived: bool
+) -> AsyncIterator[str]:
+    # NDJSON: the collection first, then one document per line, read a page at a time
+    yield collection.model_dump_json(exclude={"documents"}) + "\n"
+    documents = collection.documents
+    while True:
+        for document in documents:
+            yield MemoryDocumentRead.model_validate(document).model_dump_json() + "\n"
+        if len(documents) < chunk:
+            return
+        after = MemoryDocumentService.document_pages.cursor(documents[-1])
+        documents = await memory_collection_service.get_collection_documents(
+            session, collection.id, limit=chunk, after=after, include_archived=include_archived
+        )
+
+
 @router.get("/{collection_id}/with-documents", response_model=MemoryCollectionWithDocuments)
-def get_memory_collection_with_documents(
+async def get_memory_collection_with_documents(
     collection_id: int,
-    session: Session = Depends(get_session)
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000, description="Documents per page (per read when streaming)"),
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: continue after this document"),
+    include_archived: bool = Query(False),
+    stream: bool = Query(False, description="Stream the collection and every document as NDJSON"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
-    """Get a memory collection with all its documents"""
-    collection = memory_collection_service.get_collection_with_documents(session, collection_id)
+    """Get a memory collection with a page of its documents"""
+    try:
+        collection = await memory_collection_service.get_collection_with_documents(
+            session, collection_id, limit=limit, after=after, include_archived=include_archived
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not collection:
         raise HTTPException(status_code=404, detail="Memory collection not found")
+    if stream:
+        return StreamingResponse(
+            _stream_collection_with_documents(session, collection, limit, include_archived), media_type="application/x-ndjson"
+        )
+    response.headers.update(MemoryDocumentService.document_pages.headers(collection.documents, limit, after))
     return collection
 
 
 @router.put("/{collection_id}", response_model=MemoryCollectionRead)
-def update_memory_collection(
+async def update_memory_collection(
     collection_id: int,
     collection_update: MemoryCollectionUpdate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Update a memory collection"""
-    collection = memory_collection_service.update_collection(session, collection_id, collection_update)
+    collection = await memory_collection_service.update_collection(session, collection_id, collection_update)
     if not collection:
         raise HTTPException(status_code=404, detail="Memory collection not found")
     return collection
 
 
 @router.delete("/{collection_id}", response_model=MemoryCollectionRead)
-def archive_memory_collection(
+async def archive_memory_collection(
     collection_id: int,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Archive (soft delete) a memory collection"""
-    collection = memory_collection_service.archive_collection(session, collection_id)
+    collection = await memory_collection_service.archive_collection(session, collection_id)
     if not collection:
         raise HTTPException(status_code=404, detail="Memory collection not found")
     return collection 
\ No newline at end of file
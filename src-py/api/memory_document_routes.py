@@ -1,104 +1,133 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional
 
-from db import get_session
+from db import get_async_session, get_async_read_session
 from data.models import (
     MemoryDocumentCreate,
     MemoryDocumentRead,
+    MemoryDocumentSearchResult,
     MemoryDocumentUpdate,
     MemoryDocumentWithCollection,
 )
-from services.memory_document_service import MemoryDocumentService
+from services.memory_document_service import AsyncMemoryDocumentService, MemoryDocumentService
 
 router = APIRouter(prefix="/memory-documents", tags=["Memory Documents"])
-memory_document_service = MemoryDocumentService()
+memory_document_service = AsyncMemoryDocumentService()
 
 
 @router.post("/", response_model=MemoryDocumentRead)
-def create_memory_document(
+async def create_memory_document(
     document: MemoryDocumentCreate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Create a new memory document"""
-    return memory_document_service.create_document(session, document)
+    return await memory_document_service.create_document(session, document)
 
 
 @router.get("/", response_model=List[MemoryDocumentRead])
-def get_memory_documents(
+async def get_memory_documents(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    session: Session = Depends(get_session)
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: return the rows after it"),
+    before: Optional[str] = Query(None, description="Cursor from X-Prev-Cursor: return the rows before it"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get all memory documents"""
-    return memory_document_service.get_documents(session, skip=skip, limit=limit)
+    try:
+        documents = await memory_document_service.get_documents(session, skip=skip, limit=limit, after=after, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(MemoryDocumentService.document_pages.headers(documents, limit, after, before))
+    return documents
 
 
-@router.get("/search", response_model=List[MemoryDocumentRead])
-def search_memory_documents(
+@router.get("/search", response_model=List[MemoryDocumentSearchResult])
+async def search_memory_documents(
+    response: Response,
     q: str = Query(..., description="Search query for document content"),
     limit: int = Query(10, ge=1, le=100),
-    session: Session = Depends(get_session)
+    collection_id: Optional[int] = Query(None, description="Only search this collection"),
+    include_archived: bool = Query(False),
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: return the next page of results"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
-    """Search memory documents by content"""
-    return memory_document_service.search_documents(session, q, limit=limit)
+    """Full-text search memory documents, best match first"""
+    try:
+        results = await memory_document_service.search_documents(
+            session, q, limit=limit, collection_id=collection_id, include_archived=include_archived, after=after
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(results) == limit:
+        response.headers["X-Next-Cursor"] = memory_document_service.sync.search_cursor(results[-1])
+    return results
 
 
 @router.get("/by-collection/{collection_id}", response_model=List[MemoryDocumentRead])
-def get_documents_by_collection(
+async def get_documents_by_collection(
     collection_id: int,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    session: Session = Depends(get_session)
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor: return the rows after it"),
+    before: Optional[str] = Query(None, description="Cursor from X-Prev-Cursor: return the rows before it"),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get all documents in a specific collection"""
-    return memory_document_service.get_documents_by_collection(session, collection_id, skip=skip, limit=limit)
+    try:
+        documents = await memory_document_service.get_documents_by_collection(session, collection_id, skip=skip, limit=limit, after=after, before=before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(MemoryDocumentService.document_pages.headers(documents, limit, after, before))
+    return documents
 
 
 @router.get("/by-chroma-id/{chroma_id}", response_model=MemoryDocumentRead)
-def get_document_by_chroma_id(
+async def get_document_by_chroma_id(
     chroma_id: str,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get a memory document by its ChromaDB ID"""
-    document = memory_document_service.get_document_by_chroma_id(session, chroma_id)
+    document = await memory_document_service.get_document_by_chroma_id(session, chroma_id)
     if not document:
         raise HTTPException(status_code=404, detail="Memory document not found")
     return document
 
 
 @router.get("/{document_id}", response_model=MemoryDocumentRead)
-def get_memory_document(
+async def get_memory_document(
     document_id: int,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """Get a specific memory document by ID"""
-    document = memory_document_service.get_document(session, document_id)
+    document = await memory_document_service.get_document(session, document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Memory document not found")
     return document
 
 
 @router.put("/{document_id}", response_model=MemoryDocumentRead)
-def update_memory_document(
+async def update_memory_document(
     document_id: int,
     document_update: MemoryDocumentUpdate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Update a memory document"""
-    document = memory_document_service.update_document(session, document_id, document_update)
+    document = await memory_document_service.update_document(session, document_id, document_update)
     if not document:
         raise HTTPException(status_code=404, detail="Memory document not found")
     return document
 
 
 @router.delete("/{document_id}", response_model=MemoryDocumentRead)
-def archive_memory_document(
+async def archive_memory_document(
     document_id: int,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Archive (soft delete) a memory document"""
-    document = memory_document_service.archive_document(session, document_id)
+    document = await memory_document_service.archive_document(session, document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Memory document not found")
     return document 
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Versioned schema migrations.
+
+Tables are created from the models by SQLModel.metadata.create_all, which
+only adds missing tables. Everything create_all cannot do on an existing
+database (new columns, indexes, virtual tables, backfills) is a migration
+here. Applied versions are recorded in the schema_migrations table and each
+migration runs once, in its own transaction.
+
+Migrations also run on databases that create_all just built from the
+current models, so they must be idempotent: check before adding a column
+and use IF NOT EXISTS for indexes and tables.
+"""
+from dataclasses import dataclass
+from datetime import datetime, UTC
+from typing import Callable, List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+from lib._utils import logger
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+def add_column_if_missing(connection: Connection, table: str, column: str, ddl: str) -> None:
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    existing = {c["name"] for c in inspect(connection).get_columns(table)}
+    if column not in existing:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def create_index(connection: Connection, name: str, table: str, columns: List[str]) -> None:
+    connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def _context_summary_watermark(connection: Connection) -> None:
+    add_column_if_missing(connection, "interaction_sessions", "summarized_through_id", "INTEGER")
+
+
+def _hot_path_indexes(connection: Connection) -> None:
+    # Chat history: WHERE session_id = ? ORDER BY created_at
+    create_index(connection, "ix_interaction_payloads_session_id_created_at", "interaction_payloads", ["session_id", "created_at"])
+    # Documents of a collection: WHERE collection_id = ? AND archived_at IS NULL
+    create_index(connection, "ix_memory_documents_collection_id_archived_at", "memory_documents", ["collection_id", "archived_at"])
+    # Recent sessions: ORDER BY started_at DESC
+    create_index(connection, "ix_interaction_sessions_started_at", "interaction_sessions", ["started_at"])
+
+
+def _keyset_pagination_indexes(connection: Connection) -> None:
+    # Session list pages seek on (started_at, id); this supersedes the started_at index
+    create_index(connection, "ix_interaction_sessions_started_at_id", "interaction_sessions", ["started_at", "id"])
+    connection.execute(text("DROP INDEX IF EXISTS ix_interaction_sessions_started_at"))
+    # Payload list pages seek on (created_at, id); id is the rowid and comes with the index
+    create_index(connection, "ix_interaction_payloads_created_at", "interaction_payloads", ["created_at"])
+
+
+def _memory_documents_fts(connection: Connection) -> None:
+    # External-content FTS5 index over memory_documents.content, rowid = document id
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS memory_documents_fts USING fts5("
+        "content, content='memory_documents', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS memory_documents_fts_insert AFTER INSERT ON memory_documents BEGIN "
+        "INSERT INTO memory_documents_fts (rowid, content) VALUES (new.id, new.content); END"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS memory_documents_fts_delete AFTER DELETE ON memory_documents BEGIN "
+        "INSERT INTO memory_documents_fts (memory_documents_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS memory_documents_fts_update AFTER UPDATE OF content ON memory_documents BEGIN "
+        "INSERT INTO memory_documents_fts (memory_documents_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO memory_documents_fts (rowid, content) VALUES (new.id, new.content); END"
+    ))
+    # Index documents that existed before the triggers
+    connection.execute(text("INSERT INTO memory_documents_fts (memory_documents_fts) VALUES ('rebuild')"))
+
+
+def _session_archive_columns(connection: Connection) -> None:
+    add_column_if_missing(connection, "interaction_sessions", "archived_at", "DATETIME")
+    add_column_if_missing(connection, "interaction_sessions", "archive_path", "VARCHAR")
+
+
+def _memory_document_index_status(connection: Connection) -> None:
+    # Existing rows start out pending; startup reconciliation marks them indexed
+    add_column_if_missing(connection, "memory_documents", "index_status", "VARCHAR(7) NOT NULL DEFAULT 'PENDING'")
+
+
+def _interaction_payloads_autoincrement(connection: Connection) -> None:
+    # SQLite can only add AUTOINCREMENT by rebuilding the table
+    if connection.dialect.name != "sqlite":
+        return
+    ddl = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'interaction_payloads'"
+    )).scalar()
+    if "AUTOINCREMENT" in ddl.upper():
+        return
+    from data.models import InteractionPayload
+
+    table = InteractionPayload.__table__
+    for index in table.indexes:
+        connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    connection.execute(text("ALTER TABLE interaction_payloads RENAME TO interaction_payloads_old"))
+    table.create(connection)
+    columns = ", ".join(column.name for column in table.columns)
+    connection.execute(text(f"INSERT INTO interaction_payloads ({columns}) SELECT {columns} FROM interaction_payloads_old"))
+    connection.execute(text("DROP TABLE interaction_payloads_old"))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "context_summary_watermark", _context_summary_watermark),
+    Migration(2, "hot_path_indexes", _hot_path_indexes),
+    Migration(3, "keyset_pagination_indexes", _keyset_pagination_indexes),
+    Migration(4, "memory_documents_fts", _memory_documents_fts),
+    Migration(5, "session_archive_columns", _session_archive_columns),
+    Migration(6, "memory_document_index_status", _memory_document_index_status),
+    Migration(7, "interaction_payloads_autoincrement", _interaction_payloads_autoincrement),
+]
+
+
+def applied_versions(connection: Connection) -> List[int]:
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)"
+    ))
+    return [row[0] for row in connection.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+def run_migrations(engine: Engine, migrations: List[Migration] = MIGRATIONS) -> List[int]:
+    """Apply pending migrations in version order; returns the versions applied."""
+    with engine.begin() as connection:
+        done = set(applied_versions(connection))
+
+    applied = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version in done:
+            continue
+        try:
+            with engine.begin() as connection:
+                migration.upgrade(connection)
+                connection.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                    {"version": migration.version, "name": migration.name, "applied_at": datetime.now(UTC).isoformat()}
+                )
+        except IntegrityError:
+            # Another worker recorded it first; migrations are idempotent, so nothing is lost
+            continue
+        logger.info(f"Applied migration {migration.version}: {migration.name}")
+        applied.append(migration.version)
+    return applied
@@ -5,6 +5,7 @@ from ._schemas import (
     InteractionSession,
     InteractionPayload,
     InteractionFrom,
+    IndexStatus,
 )
 
 # Pydantic Models
@@ -21,6 +22,7 @@ from .memory_document_models import (
     MemoryDocumentCreate,
     MemoryDocumentRead,
     MemoryDocumentUpdate,
+    MemoryDocumentSearchResult,
     MemoryDocumentWithCollection,
 )
 
@@ -47,6 +49,7 @@ __all__ = [
     "InteractionSession", 
     "InteractionPayload",
     "InteractionFrom",
+    "IndexStatus",
     
     # Memory Collection Models
     "MemoryCollectionBase",
@@ -60,6 +63,7 @@ __all__ = [
     "MemoryDocumentCreate",
     "MemoryDocumentRead",
     "MemoryDocumentUpdate",
+    "MemoryDocumentSearchResult",
     "MemoryDocumentWithCollection",
     
     # Interaction Session Models
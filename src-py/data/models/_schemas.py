@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 from typing import Optional, List
 from datetime import datetime, UTC
 from enum import Enum
@@ -11,6 +12,12 @@ class InteractionFrom(str, Enum):
     MODEL = "model"
 
 
+class IndexStatus(str, Enum):
+    PENDING = "pending"
+    INDEXED = "indexed"
+    FAILED = "failed"
+
+
 # Database Tables
 class MemoryCollection(SQLModel, table=True):
     __tablename__ = "memory_collections"
@@ -28,12 +35,16 @@ class MemoryCollection(SQLModel, table=True):
 
 class MemoryDocument(SQLModel, table=True):
     __tablename__ = "memory_documents"
+    __table_args__ = (
+        Index("ix_memory_documents_collection_id_archived_at", "collection_id", "archived_at"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     chroma_id: str = Field(max_length=255, index=True)
     content: str
     collection_id: int = Field(foreign_key="memory_collections.id")
     metadatas: str = Field(default="{}")  # Stringified JSON
+    index_status: IndexStatus = Field(default=IndexStatus.PENDING)  # Whether the vector store has this version
     created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
     archived_at: Optional[datetime] = Field(default=None)
@@ -44,11 +55,17 @@ class MemoryDocument(SQLModel, table=True):
 
 class InteractionSession(SQLModel, table=True):
     __tablename__ = "interaction_sessions"
+    __table_args__ = (
+        Index("ix_interaction_sessions_started_at_id", "started_at", "id"),
+    )
     
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     title: str = Field(max_length=255)
     context_summary: Optional[str] = Field(default=None)
+    summarized_through_id: Optional[int] = Field(default=None)  # Last payload folded into context_summary
     started_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    archived_at: Optional[datetime] = Field(default=None)  # Set while the payloads live in cold storage
+    archive_path: Optional[str] = Field(default=None)  # Archive file holding them
     
     # Relationships
     payloads: List["InteractionPayload"] = Relationship(back_populates="session")
@@ -56,6 +73,12 @@ class InteractionSession(SQLModel, table=True):
 
 class InteractionPayload(SQLModel, table=True):
     __tablename__ = "interaction_payloads"
+    __table_args__ = (
+        Index("ix_interaction_payloads_session_id_created_at", "session_id", "created_at"),
+        Index("ix_interaction_payloads_created_at", "created_at"),
+        # Ids are never reused, so archived payloads get theirs back on rehydration
+        {"sqlite_autoincrement": True},
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     session_id: str = Field(foreign_key="interaction_sessions.id")
@@ -15,6 +15,7 @@ class InteractionSessionCreate(InteractionSessionBase):
 class InteractionSessionRead(InteractionSessionBase):
     id: str
     started_at: datetime
+    archived_at: Optional[datetime] = None
     
     model_config = ConfigDict(from_attributes=True)
 
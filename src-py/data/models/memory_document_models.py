@@ -3,6 +3,8 @@ from typing import Optional, Dict, Any
 from datetime import datetime, UTC
 import json
 
+from ._schemas import IndexStatus
+
 
 class MemoryDocumentBase(BaseModel):
     chroma_id: str = Field(max_length=255)
@@ -17,6 +19,7 @@ class MemoryDocumentCreate(MemoryDocumentBase):
 
 class MemoryDocumentRead(MemoryDocumentBase):
     id: int
+    index_status: IndexStatus = IndexStatus.PENDING
     created_at: datetime
     updated_at: datetime
     archived_at: Optional[datetime] = None
@@ -43,6 +46,11 @@ class MemoryDocumentUpdate(BaseModel):
     archived_at: Optional[datetime] = None
 
 
+class MemoryDocumentSearchResult(MemoryDocumentRead):
+    rank: float  # BM25 score, lower is a better match
+    snippet: str  # Matching excerpt with terms wrapped in <mark></mark>
+
+
 class MemoryDocumentWithCollection(MemoryDocumentRead):
     collection: Optional["MemoryCollectionRead"] = None
 
@@ -1,10 +1,16 @@
 from sqlmodel import SQLModel, create_engine, Session
-from typing import Generator
-from contextlib import contextmanager
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import AsyncGenerator, Dict, Generator, List, Union
+from contextlib import asynccontextmanager, contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 import os
 from dotenv import load_dotenv
 
+from data.migrations import run_migrations
+
 # Import all models to register them with SQLModel
 from data.models import (
     MemoryCollection,
@@ -23,13 +29,90 @@ if DATABASE_URL.startswith("sqlite:///"):
     if db_dir:
         os.makedirs(db_dir, exist_ok=True)
 
+# "production" tunes SQLite for concurrent readers plus one writer; "default" leaves SQLite's defaults
+DB_PROFILE = (os.getenv("DB_PROFILE") or "production").lower()
+
+# Statement logging is opt-in
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+
+
+def sqlite_pragmas(read_only: bool = False) -> List[str]:
+    """PRAGMAs run on every new SQLite connection for the configured profile."""
+    pragmas = []
+    if DB_PROFILE == "production":
+        pragmas += [
+            # WAL lets readers proceed while the writer commits, and vice versa
+            "PRAGMA journal_mode=WAL",
+            # Durable across application crashes in WAL mode; only an OS crash can lose the last commits
+            "PRAGMA synchronous=NORMAL",
+            f"PRAGMA mmap_size={int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+            # Negative values are KiB, so the default is a 64 MiB page cache per connection
+            f"PRAGMA cache_size={int(os.getenv('DB_CACHE_SIZE', '-65536'))}",
+            f"PRAGMA busy_timeout={int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))}",
+        ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def configure_sqlite(engine: Union[Engine, AsyncEngine], read_only: bool = False) -> Union[Engine, AsyncEngine]:
+    """Apply the storage profile's PRAGMAs to every connection the engine opens."""
+    if engine.dialect.name != "sqlite":
+        return engine
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(engine.sync_engine if isinstance(engine, AsyncEngine) else engine, "connect")
+    def _apply_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+def engine_options(url: str) -> Dict:
+    """Keyword arguments for create_engine / create_async_engine under the configured profile."""
+    options = {"echo": DB_ECHO}
+    # In-memory SQLite uses a single shared connection, so there is no pool to size
+    if DB_PROFILE == "production" and ":memory:" not in url:
+        options.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        )
+    return options
+
+
+def to_async_url(url: str) -> str:
+    """Swap a sync SQLAlchemy URL for its asyncio driver (aiosqlite for SQLite)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgresql:"):
+        return "postgresql+asyncpg:" + url[len("postgresql:"):]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
 
-engine = create_engine(DATABASE_URL, echo=True)
+engine = configure_sqlite(create_engine(DATABASE_URL, **engine_options(DATABASE_URL)))
+
+# Same database through an asyncio driver; used by the routes and the chat pipeline
+async_engine = configure_sqlite(create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL)))
+
+# Separate read-only pool for GET routes, so reads never queue behind connections held by writers
+async_read_engine = configure_sqlite(
+    create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL)),
+    read_only=True
+)
 
 
 def create_db_and_tables():
+    """Create missing tables from the models, then apply pending schema migrations."""
     try:
         SQLModel.metadata.create_all(engine)
+        run_migrations(engine)
     except OperationalError as e:
         print("OperationalError while creating DB and tables:", e)
         print("Check if the database file path is valid and the directory exists.")
@@ -53,6 +136,28 @@ def session_from_generator():
             pass
 
 
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    # Objects stay usable after commit, e.g. when FastAPI serializes them after the session closes
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_async_read_session() -> AsyncGenerator[AsyncSession, None]:
+    """Session on the read-only pool, for routes that never write."""
+    async with AsyncSession(async_read_engine, expire_on_commit=False) as session:
+        yield session
+
+
+@asynccontextmanager
+async def async_session_from_generator():
+    gen = get_async_session()
+    db = await anext(gen)
+    try:
+        yield db
+    finally:
+        await gen.aclose()
+
+
 def reset_database():
     SQLModel.metadata.drop_all(bind=engine)
     SQLModel.metadata.create_all(bind=engine)
\ No newline at end of file
@@ -1,23 +1,47 @@
 import chromadb
+import os
 from datetime import datetime
-from chromadb.utils import embedding_functions
+from functools import lru_cache
 from typing import List, Dict, Optional, Union
 
-chroma_client = chromadb.Client()
-# chroma_client = chromadb.PersistentClient(path="../data/memory/chroma_db")
+from lib.embedding_model import EmbeddingModel, embedding_model
 
-sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-mpnet-base-v2"
-)
+
+def chroma_client_from_env():
+	"""Persistent client at CHROMA_PATH unless CHROMA_CLIENT=memory (vectors lost on restart)"""
+	if (os.getenv("CHROMA_CLIENT") or "").lower() == "memory":
+		return chromadb.Client()
+	return chromadb.PersistentClient(path=os.getenv("CHROMA_PATH") or "../data/memory/chroma_db")
+
+
+@lru_cache(maxsize=None)
+def shared_chroma_client():
+	"""The process-wide client, opened on first use"""
+	return chroma_client_from_env()
+
+
+class CachedEmbeddingFunction(chromadb.EmbeddingFunction):
+	"""Embeds through the lazily loaded model, encoding only texts missing from the embedding cache"""
+
+	def __init__(self, model: Optional[EmbeddingModel] = None):
+		self.model = model or embedding_model
+
+	def __call__(self, input: List[str]):
+		return self.model.embed(input)
+
+
+sentence_transformer_ef = CachedEmbeddingFunction()
 
 class ChromaOps:
-	def __init__(self):
-		self.client = chroma_client
+	def __init__(self, client=None, embedding_function: Optional[chromadb.EmbeddingFunction] = None):
+		self.client = client if client is not None else shared_chroma_client()
+		# Every collection handle must carry it: without one, Chroma falls back to its own default model
+		self.embedding_function = embedding_function or sentence_transformer_ef
 
 	def create_collection(self, name: str, description: str):
 		collection = self.client.create_collection(
 			name=name,
-			embedding_function=sentence_transformer_ef,
+			embedding_function=self.embedding_function,
 			metadata={
 				"description": description,
 				"created": str(datetime.now())
@@ -26,7 +50,19 @@ class ChromaOps:
 		return collection
 	
 	def get_collection(self, name: str):
-		return self.client.get_collection(name=name)
+		return self.client.get_collection(name=name, embedding_function=self.embedding_function)
+
+	def get_or_create_collection(self, name: str, description: str = ""):
+		return self.client.get_or_create_collection(
+			name=name,
+			embedding_function=self.embedding_function,
+			metadata={"description": description or name}
+		)
+
+	@staticmethod
+	def collection_name(collection_id: int) -> str:
+		"""Chroma collection holding the vectors of a memory collection"""
+		return f"memory_collection_{collection_id}"
 	
 	def delete_collection(self, name: str):
 		self.client.delete_collection(name=name)
@@ -90,6 +126,23 @@ class ChromaOps:
 			
 		collection.update(**update_params)
 
+	def upsert_data(self, collection_name: str, ids: List[str], documents: List[str],
+					metadatas: Optional[List[Dict]] = None):
+		"""Add or replace multiple documents in a collection"""
+		collection = self.get_collection(collection_name)
+		collection.upsert(ids=ids, documents=documents, metadatas=metadatas)
+
+	def get_metadatas(self, collection_name: str, ids: List[str]) -> Dict[str, Dict]:
+		"""Stored metadata of the given ids that exist in a collection, by id"""
+		collection = self.get_collection(collection_name)
+		result = collection.get(ids=ids, include=["metadatas"])
+		return {doc_id: metadata or {} for doc_id, metadata in zip(result["ids"], result["metadatas"])}
+
+	def list_ids(self, collection_name: str, limit: int = 1000, offset: int = 0) -> List[str]:
+		"""One page of the ids stored in a collection"""
+		collection = self.get_collection(collection_name)
+		return collection.get(include=[], limit=limit, offset=offset)["ids"]
+
 	def delete_doc(self, collection_name: str, doc_id: str):
 		"""Delete a single document from a collection by ID"""
 		collection = self.get_collection(collection_name)
@@ -127,6 +180,21 @@ class ChromaOps:
 			
 		return collection.query(**query_params)
 
+	def query_embeddings(self, collection_name: str, query_embedding: List[float],
+						 n_results: int = 10, where: Optional[Dict] = None):
+		"""Query a collection with an embedding computed by the caller"""
+		collection = self.get_collection(collection_name)
+		
+		query_params = {
+			"query_embeddings": [query_embedding],
+			"n_results": n_results,
+			"include": ["documents", "distances"]
+		}
+		if where is not None:
+			query_params["where"] = where
+			
+		return collection.query(**query_params)
+
 	def query_data(self, collection_name: str, query_texts: List[str], 
 				   n_results: int = 10, where: Optional[Dict] = None, 
 				   where_document: Optional[Dict] = None):
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence
+
+Vector = List[float]
+
+
+def embedding_key(model_name: str, text: str) -> str:
+    """SHA-256 identifying an embedding by model and whitespace-normalized text."""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{model_name}\0{normalized}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of embeddings keyed on (model name, SHA-256 of the
+    whitespace-normalized text), in a SQLite file shared by every worker.
+
+    embed() only sends texts the cache has not seen to the encoder, so
+    re-imports, duplicate content across collections and metadata-only edits
+    (which Chroma re-embeds on upsert) cost nothing on the encoder. Vectors
+    are stored as float32; least recently used rows are deleted once the
+    stored vectors exceed max_bytes.
+
+    The file is opened on first use.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def embed(self, model_name: str, texts: Sequence[str], encode: Callable[[List[str]], Sequence[Sequence[float]]]) -> List[Vector]:
+        """Embeddings of texts, in order; only cache misses are passed to encode, once each."""
+        keys = [embedding_key(model_name, text) for text in texts]
+        vectors: Dict[str, Vector] = self._get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        hits = sum(1 for key in keys if key in vectors)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        if missing:
+            encoded = [list(map(float, vector)) for vector in encode(list(missing.values()))]
+            new = dict(zip(missing, encoded))
+            self._set_many(new)
+            vectors.update(new)
+        return [vectors[key] for key in keys]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM embedding_cache")
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+        }
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            db_dir = os.path.dirname(self.path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embedding_cache_accessed_at ON embedding_cache (accessed_at)")
+            self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache").fetchone()[0]
+        return self._conn
+
+    def _get_many(self, keys: List[str]) -> Dict[str, Vector]:
+        unique = list(dict.fromkeys(keys))
+        found: Dict[str, Vector] = {}
+        with self._lock:
+            conn = self._connection()
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embedding_cache WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                conn.executemany("UPDATE embedding_cache SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+        return found
+
+    def _set_many(self, vectors: Dict[str, Vector]) -> None:
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in vectors.items()]
+        with self._lock:
+            conn = self._connection()
+            inserted = conn.executemany("INSERT OR IGNORE INTO embedding_cache (key, vector, accessed_at) VALUES (?, ?, ?)", rows).rowcount
+            if inserted == len(rows):
+                self._bytes += sum(len(blob) for _, blob, _ in rows)
+            else:
+                # Another worker stored some of them first
+                self._bytes = conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache").fetchone()[0]
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        while self._bytes > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, LENGTH(vector) FROM embedding_cache ORDER BY accessed_at ASC LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._bytes <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM embedding_cache WHERE key = ?", (key,))
+                self._bytes -= size
+                self.evictions += 1
+
+
+def embedding_cache_from_env() -> Optional[EmbeddingCache]:
+    """Build the cache configured by EMBEDDING_CACHE (on unless "0"); None when disabled."""
+    if os.getenv("EMBEDDING_CACHE", "1") == "0":
+        return None
+    return EmbeddingCache(
+        os.getenv("EMBEDDING_CACHE_PATH") or "../data/memory/embedding_cache.db",
+        max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    )
+
+
+embedding_cache = embedding_cache_from_env()
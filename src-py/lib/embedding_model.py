@@ -0,0 +1,78 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Sequence
+
+from lib._utils import logger
+from lib.embedding_cache import embedding_cache
+
+
+def sentence_transformer(model_name: str):
+    from chromadb.utils import embedding_functions
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
+
+
+class EmbeddingModel:
+    """
+    The sentence-transformer behind the vector store, loaded on first use.
+
+    Loading EMBEDDING_MODEL takes seconds and a few hundred MB, so nothing
+    happens at import: the first embed() loads it (concurrent callers wait for
+    the same load), or warmup() loads it in a thread from the app's lifespan
+    so the first request does not pay for it. `ready` tells whether it is
+    loaded.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, factory: Callable = sentence_transformer):
+        self.model_name = model_name or os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2")
+        self.factory = factory
+        self.state = "cold"
+        self.load_seconds: Optional[float] = None
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._encoder is not None
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self.load()
+        return self._encoder
+
+    def load(self) -> None:
+        with self._lock:
+            if self._encoder is not None:
+                return
+            self.state = "loading"
+            started = time.perf_counter()
+            try:
+                encoder = self.factory(self.model_name)
+            except Exception:
+                self.state = "failed"
+                raise
+            self.load_seconds = time.perf_counter() - started
+            self._encoder = encoder
+            self.state = "ready"
+
+    def embed(self, texts: Sequence[str]) -> List:
+        """Embeddings of texts, through the embedding cache when it is enabled"""
+        if embedding_cache is None:
+            return self.encoder(list(texts))
+        return embedding_cache.embed(self.model_name, texts, lambda missing: self.encoder(missing))
+
+    async def warmup(self) -> None:
+        """Load the model in a thread; failures are logged and retried on first use"""
+        try:
+            await asyncio.to_thread(self.load)
+            logger.info(f"Embedding model {self.model_name} loaded in {self.load_seconds:.1f}s")
+        except Exception as e:
+            logger.error(f"Embedding model warmup failed: {e}")
+
+    def stats(self) -> dict:
+        return {"model": self.model_name, "state": self.state, "ready": self.ready, "load_seconds": self.load_seconds}
+
+
+embedding_model = EmbeddingModel()
@@ -1,4 +1,6 @@
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,48 +8,315 @@ load_dotenv()
 from google import genai
 from google.genai import types
 from google.genai.types import Content, Part
-from typing import Optional, List
+from typing import Optional, List, Iterator, AsyncIterator, Awaitable, Callable, TypeVar
+
+from lib._utils import logger
+from lib.resilience import (
+    CircuitBreaker,
+    GeminiError,
+    RetryableGeminiError,
+    RetryPolicy,
+    classify_error,
+)
+from lib.response_cache import ResponseCache, request_key, response_cache_from_env
+from lib.singleflight import SingleFlight
+
+T = TypeVar("T")
 
 
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
+# Opt-in exact-match response cache, enabled with GEMINI_RESPONSE_CACHE=memory|sqlite
+response_cache = response_cache_from_env()
+
+# Identical concurrent async requests share one upstream call; GEMINI_COALESCE_REQUESTS=0 disables
+single_flight = SingleFlight() if os.getenv("GEMINI_COALESCE_REQUESTS", "1") != "0" else None
+
+# Shared by every client in the process, so an outage trips it once for everyone
+circuit_breaker = CircuitBreaker()
+
 
 class GeminiClient:
-    def __init__(self, system_instruction: str = None):
-        self.client = client
+    """
+    Thin wrapper around the Gemini SDK.
+    
+    Failures are raised as GeminiError subclasses: RetryableGeminiError
+    (timeouts, rate limits, 5xx), FatalGeminiError (everything else) and
+    CircuitOpenError. Retryable failures are retried with jittered
+    exponential backoff up to GEMINI_MAX_ATTEMPTS; streams are only retried
+    before their first chunk. Every call has a deadline of GEMINI_TIMEOUT
+    seconds (for streams, per chunk), enforced on the HTTP request as well,
+    so a hung upstream never pins a thread or task indefinitely. A shared
+    circuit breaker fails calls fast while upstream keeps failing.
+    """
+    
+    def __init__(
+        self,
+        system_instruction: str = None,
+        genai_client: Optional[genai.Client] = None,
+        cache: Optional[ResponseCache] = None,
+        coalescer: Optional[SingleFlight] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        timeout: Optional[float] = None,
+    ):
+        self.client = genai_client or client
         self.system_instruction = system_instruction or "You are a helpful AI assistant. Respond in plain text."
+        self.response_cache = cache if cache is not None else response_cache
+        self.single_flight = coalescer if coalescer is not None else single_flight
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = breaker or circuit_breaker
+        self.timeout = timeout or float(os.getenv("GEMINI_TIMEOUT", "60"))
     
-    def generate_response(self, conversation_history: List[dict]) -> str:
+    def generate_response(self, conversation_history: List[dict], context_summary: Optional[str] = None) -> str:
         """
         Generate a response based on conversation history.
         
         Args:
             conversation_history: List of dicts with 'role' and 'content' keys
                                 where role is either 'user' or 'model'
+            context_summary: Optional summary of earlier turns not included
+                             in conversation_history
         
         Returns:
             Generated response text
+        
+        Raises:
+            GeminiError: if generation failed after retries
         """
-        # Convert our simple dict format to Gemini's Content format
-        contents = []
-        for message in conversation_history:
-            role = "user" if message["role"] == "user" else "model"
-            content = Content(role=role, parts=[Part(text=message["content"])])
-            contents.append(content)
+        cache_key, cached = self._cached_response(conversation_history, context_summary)
+        if cached is not None:
+            return cached
+        
+        response = self._call(lambda: self.client.models.generate_content(
+            model=os.getenv("GEMINI_MODEL"),
+            config=self._build_config(context_summary),
+            contents=self._build_contents(conversation_history)
+        ))
         
-        try:
-            response = self.client.models.generate_content(
+        self._store_response(cache_key, response.text)
+        return response.text
+    
+    def generate_response_stream(self, conversation_history: List[dict], context_summary: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream a response based on conversation history.
+        
+        Yields text chunks as soon as Gemini produces them, so callers can
+        forward the first tokens without waiting for the full reply.
+        
+        Args:
+            conversation_history: List of dicts with 'role' and 'content' keys
+                                where role is either 'user' or 'model'
+            context_summary: Optional summary of earlier turns not included
+                             in conversation_history
+        
+        Yields:
+            Incremental pieces of the generated response text
+        """
+        cache_key, cached = self._cached_response(conversation_history, context_summary)
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = []
+        attempt = 0
+        while True:
+            attempt += 1
+            self.circuit_breaker.before_call()
+            try:
+                stream = self.client.models.generate_content_stream(
+                    model=os.getenv("GEMINI_MODEL"),
+                    config=self._build_config(context_summary),
+                    contents=self._build_contents(conversation_history)
+                )
+                for chunk in stream:
+                    if chunk.text:
+                        chunks.append(chunk.text)
+                        yield chunk.text
+            except Exception as e:
+                error = self._record_failure(e)
+                # Text already went to the caller, so a retry would duplicate it
+                if chunks or not self._should_retry(error, attempt):
+                    raise error from e
+                time.sleep(self.retry_policy.delay(attempt))
+                continue
+            break
+        
+        self.circuit_breaker.record_success()
+        self._store_response(cache_key, "".join(chunks))
+    
+    async def generate_response_async(self, conversation_history: List[dict], context_summary: Optional[str] = None) -> str:
+        """
+        Async variant of generate_response built on the SDK's aio client.
+        
+        Concurrent identical requests are coalesced into one upstream call.
+        """
+        cache_key, cached = self._cached_response(conversation_history, context_summary)
+        if cached is not None:
+            return cached
+        
+        async def _generate() -> str:
+            response = await self._call_async(lambda: self.client.aio.models.generate_content(
                 model=os.getenv("GEMINI_MODEL"),
-                config=types.GenerateContentConfig(system_instruction=self.system_instruction),
-                contents=contents
-            )
+                config=self._build_config(context_summary),
+                contents=self._build_contents(conversation_history)
+            ))
+            
+            self._store_response(cache_key, response.text)
             return response.text
-        except Exception as e:
-            raise Exception(f"Failed to generate response: {str(e)}")
+        
+        if self.single_flight is None:
+            return await _generate()
+        return await self.single_flight.do(self._request_key(conversation_history, context_summary), _generate)
+    
+    async def generate_response_stream_async(self, conversation_history: List[dict], context_summary: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Async variant of generate_response_stream built on the SDK's aio client.
+        
+        Concurrent identical requests share one upstream stream; callers that
+        join late first receive the chunks already produced.
+        """
+        cache_key, cached = self._cached_response(conversation_history, context_summary)
+        if cached is not None:
+            yield cached
+            return
+        
+        async def _stream() -> AsyncIterator[str]:
+            chunks = []
+            attempt = 0
+            while True:
+                attempt += 1
+                self.circuit_breaker.before_call()
+                stream = None
+                try:
+                    async with asyncio.timeout(self.timeout):
+                        stream = await self.client.aio.models.generate_content_stream(
+                            model=os.getenv("GEMINI_MODEL"),
+                            config=self._build_config(context_summary),
+                            contents=self._build_contents(conversation_history)
+                        )
+                    while True:
+                        try:
+                            async with asyncio.timeout(self.timeout):
+                                chunk = await anext(stream)
+                        except StopAsyncIteration:
+                            break
+                        if chunk.text:
+                            chunks.append(chunk.text)
+                            yield chunk.text
+                except Exception as e:
+                    error = self._record_failure(e)
+                    # Text already went to the caller, so a retry would duplicate it
+                    if chunks or not self._should_retry(error, attempt):
+                        raise error from e
+                    await asyncio.sleep(self.retry_policy.delay(attempt))
+                    continue
+                finally:
+                    if stream is not None and hasattr(stream, "aclose"):
+                        await stream.aclose()
+                break
+            
+            self.circuit_breaker.record_success()
+            self._store_response(cache_key, "".join(chunks))
+        
+        if self.single_flight is None:
+            stream = _stream()
+        else:
+            stream = self.single_flight.stream(self._request_key(conversation_history, context_summary), _stream)
+        async for chunk in stream:
+            yield chunk
     
     def generate_single_response(self, message: str) -> str:
         """Generate a response to a single message without conversation history."""
         return self.generate_response([{"role": "user", "content": message}])
-	
-	
-	
\ No newline at end of file
+    
+    async def generate_single_response_async(self, message: str) -> str:
+        """Async variant of generate_single_response."""
+        return await self.generate_response_async([{"role": "user", "content": message}])
+    
+    def _call(self, fn: Callable[[], T]) -> T:
+        """Run a blocking upstream call with retries and the circuit breaker."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.circuit_breaker.before_call()
+            try:
+                result = fn()
+            except Exception as e:
+                error = self._record_failure(e)
+                if not self._should_retry(error, attempt):
+                    raise error from e
+                time.sleep(self.retry_policy.delay(attempt))
+                continue
+            self.circuit_breaker.record_success()
+            return result
+    
+    async def _call_async(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run an async upstream call under the deadline, with retries and the circuit breaker."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.circuit_breaker.before_call()
+            try:
+                async with asyncio.timeout(self.timeout):
+                    result = await fn()
+            except Exception as e:
+                error = self._record_failure(e)
+                if not self._should_retry(error, attempt):
+                    raise error from e
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+                continue
+            self.circuit_breaker.record_success()
+            return result
+    
+    def _record_failure(self, e: Exception) -> GeminiError:
+        error = classify_error(e)
+        self.circuit_breaker.record_failure(error)
+        logger.warning(f"Gemini call failed ({type(error).__name__}): {e}")
+        return error
+    
+    def _should_retry(self, error: GeminiError, attempt: int) -> bool:
+        return isinstance(error, RetryableGeminiError) and attempt < self.retry_policy.max_attempts
+    
+    def _request_key(self, conversation_history: List[dict], context_summary: Optional[str]) -> str:
+        return request_key(
+            os.getenv("GEMINI_MODEL"),
+            self._build_system_instruction(context_summary),
+            conversation_history
+        )
+    
+    def _cached_response(self, conversation_history: List[dict], context_summary: Optional[str]):
+        """Return (cache key, cached text); both are None when caching is off or the prompt is too large."""
+        if self.response_cache is None:
+            return None, None
+        cache_key = self.response_cache.key(
+            os.getenv("GEMINI_MODEL"),
+            self._build_system_instruction(context_summary),
+            conversation_history
+        )
+        if cache_key is None:
+            return None, None
+        return cache_key, self.response_cache.get(cache_key)
+    
+    def _store_response(self, cache_key: Optional[str], text: Optional[str]):
+        if cache_key is not None and text:
+            self.response_cache.set(cache_key, text)
+    
+    def _build_system_instruction(self, context_summary: Optional[str] = None) -> str:
+        if context_summary:
+            return f"{self.system_instruction}\n\nSummary of the earlier conversation:\n{context_summary}"
+        return self.system_instruction
+    
+    def _build_config(self, context_summary: Optional[str] = None) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            system_instruction=self._build_system_instruction(context_summary),
+            http_options=types.HttpOptions(timeout=int(self.timeout * 1000))
+        )
+    
+    def _build_contents(self, conversation_history: List[dict]) -> List[Content]:
+        """Convert our simple dict format to Gemini's Content format"""
+        contents = []
+        for message in conversation_history:
+            role = "user" if message["role"] == "user" else "model"
+            contents.append(Content(role=role, parts=[Part(text=message["content"])]))
+        return contents
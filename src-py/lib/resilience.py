@@ -0,0 +1,155 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+from google.genai import errors as genai_errors
+
+
+# HTTP statuses worth retrying: timeouts, rate limits and upstream outages
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    """Base class for errors raised by GeminiClient."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(f"Failed to generate response: {message}")
+        self.status_code = status_code
+
+
+class RetryableGeminiError(GeminiError):
+    """Transient upstream failure (timeout, rate limit, 5xx); the call may succeed if retried."""
+    pass
+
+
+class GeminiTimeout(RetryableGeminiError):
+    """The call did not finish within its deadline."""
+    pass
+
+
+class FatalGeminiError(GeminiError):
+    """Failure that retrying will not fix, e.g. an invalid request or bad credentials."""
+    pass
+
+
+class CircuitOpenError(GeminiError):
+    """Raised without calling upstream while the circuit breaker is open; retry_after is in seconds."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message, status_code=503)
+        self.retry_after = retry_after
+
+
+def classify_error(error: BaseException) -> GeminiError:
+    """Map an exception from the SDK or transport onto the GeminiError hierarchy."""
+    if isinstance(error, GeminiError):
+        return error
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException)):
+        return GeminiTimeout(str(error) or "deadline exceeded")
+    if isinstance(error, genai_errors.APIError):
+        if error.code in RETRYABLE_STATUS_CODES:
+            return RetryableGeminiError(str(error), status_code=error.code)
+        return FatalGeminiError(str(error), status_code=error.code)
+    if isinstance(error, (ConnectionError, httpx.TransportError)):
+        return RetryableGeminiError(str(error))
+    return FatalGeminiError(str(error))
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: failed attempt n sleeps uniformly in [0, min(max_delay, base_delay * 2**(n-1))]."""
+
+    def __init__(
+        self,
+        max_attempts: Optional[int] = None,
+        base_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+    ):
+        self.max_attempts = max_attempts or int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5"))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv("GEMINI_RETRY_MAX_DELAY", "8"))
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after the given (1-based) failed attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Fails fast while upstream is down.
+
+    After failure_threshold consecutive retryable failures the circuit opens
+    and calls are rejected with CircuitOpenError for reset_timeout seconds.
+    Then one trial call is let through (half-open): success closes the
+    circuit, failure opens it again. Fatal errors such as bad requests say
+    nothing about upstream health and are not counted.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.failure_threshold = failure_threshold or int(os.getenv("GEMINI_CIRCUIT_FAILURES", "5"))
+        self.reset_timeout = reset_timeout if reset_timeout is not None else float(os.getenv("GEMINI_CIRCUIT_RESET", "30"))
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go upstream now."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            # A trial that never reported back (e.g. cancelled) does not block the circuit forever
+            if self.state == self.HALF_OPEN and (not self._trial_in_flight or now - self._trial_started >= self.reset_timeout):
+                self._trial_in_flight = True
+                self._trial_started = now
+                return
+            self.rejected += 1
+            retry_in = max(0.0, self.reset_timeout - (now - self.opened_at))
+            raise CircuitOpenError(f"Gemini is unavailable, retry in {retry_in:.0f}s", retry_after=retry_in)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.rejected = 0
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, error: GeminiError) -> None:
+        if not isinstance(error, RetryableGeminiError):
+            with self._lock:
+                # Upstream answered, so a half-open trial still proves it is reachable
+                if self.state == self.HALF_OPEN:
+                    self.state = self.CLOSED
+                    self.failures = 0
+                    self._trial_in_flight = False
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
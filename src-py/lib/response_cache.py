@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from lib.cache import LRUCache
+
+
+def normalize_history(conversation_history: List[dict]) -> List[list]:
+    """Roles and whitespace-normalized text of a conversation, as used in request keys."""
+    return [
+        ["user" if m["role"] == "user" else "model", " ".join(m["content"].split())]
+        for m in conversation_history
+    ]
+
+
+def request_key(model: Optional[str], system_instruction: str, conversation_history: List[dict]) -> str:
+    """SHA-256 identifying a generation request by model, system instruction and contents."""
+    raw = json.dumps([model, system_instruction, normalize_history(conversation_history)], separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class MemoryResponseStore:
+    """In-process response store: TTL plus LRU eviction under a byte cap."""
+
+    def __init__(self, ttl: float, max_bytes: int):
+        self._cache = LRUCache(max_entries=1_000_000, ttl=ttl, max_size=max_bytes, sizeof=lambda text: len(text.encode()))
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def set(self, key: str, text: str) -> None:
+        self._cache.set(key, text)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict:
+        stats = self._cache.stats()
+        return {"entries": stats["entries"], "bytes": stats["size"], "evictions": stats["evictions"]}
+
+
+class SQLiteResponseStore:
+    """
+    On-disk response store in a SQLite table, shared by every worker using the same file.
+
+    Expired rows are ignored on read; least recently used rows are deleted once
+    the stored text exceeds max_bytes.
+    """
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_accessed_at ON response_cache (accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, text: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, text, len(text.encode()), now, now)
+            )
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache").fetchone()
+        return {"entries": entries, "bytes": total, "evictions": self.evictions}
+
+    def _evict(self) -> None:
+        self._conn.execute("DELETE FROM response_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+        while total > self.max_bytes:
+            row = self._conn.execute(
+                "SELECT key, size FROM response_cache ORDER BY accessed_at ASC LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._conn.execute("DELETE FROM response_cache WHERE key = ?", (row[0],))
+            self.evictions += 1
+            total -= row[1]
+
+
+class ResponseCache:
+    """
+    Exact-match cache of Gemini responses.
+
+    Keys are a SHA-256 over the model, the full system instruction and the
+    whitespace-normalized conversation contents, so only byte-for-byte equivalent
+    requests hit. Only prompts up to max_prompt_chars are cached, which covers
+    greetings and canned first-turn questions without filling the store with
+    one-off long conversations.
+    """
+
+    def __init__(self, store, max_prompt_chars: int = 2000):
+        self.store = store
+        self.max_prompt_chars = max_prompt_chars
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, model: Optional[str], system_instruction: str, conversation_history: List[dict]) -> Optional[str]:
+        """Cache key for a request, or None when the request is too large to be worth caching."""
+        if sum(len(m["content"]) for m in conversation_history) > self.max_prompt_chars:
+            return None
+        return request_key(model, system_instruction, conversation_history)
+
+    def get(self, key: str) -> Optional[str]:
+        text = self.store.get(key)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def set(self, key: str, text: str) -> None:
+        if text:
+            self.store.set(key, text)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            **self.store.stats(),
+        }
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    """Build the cache configured by GEMINI_RESPONSE_CACHE ("memory" or "sqlite"); None when disabled."""
+    backend = (os.getenv("GEMINI_RESPONSE_CACHE") or "").lower()
+    if backend not in ("memory", "sqlite"):
+        return None
+
+    ttl = float(os.getenv("GEMINI_RESPONSE_CACHE_TTL", "3600"))
+    max_bytes = int(os.getenv("GEMINI_RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+    if backend == "sqlite":
+        path = os.getenv("GEMINI_RESPONSE_CACHE_PATH") or "./response_cache.db"
+        store = SQLiteResponseStore(path, ttl=ttl, max_bytes=max_bytes)
+    else:
+        store = MemoryResponseStore(ttl=ttl, max_bytes=max_bytes)
+    return ResponseCache(store, max_prompt_chars=int(os.getenv("GEMINI_RESPONSE_CACHE_MAX_PROMPT_CHARS", "2000")))
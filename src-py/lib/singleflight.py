@@ -0,0 +1,128 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    """One in-flight coroutine call and how many callers are waiting on it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Broadcast:
+    """Chunks of one in-flight stream, replayed to every subscriber."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self) -> None:
+        await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight async calls.
+
+    Concurrent callers with the same key share one underlying call: the first
+    caller starts it, later callers await the same result (or, for streams,
+    receive the same chunks, including those produced before they joined).
+    Errors propagate to every waiter and nothing is remembered once the call
+    finishes, so a failed request is retried by the next caller. The shared
+    call is cancelled only when every waiter has gone away.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            self.leaders += 1
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.leaders += 1
+            broadcast = self._streams[key] = _Broadcast()
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, fn))
+        else:
+            self.coalesced += 1
+
+        broadcast.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(broadcast.chunks):
+                    yield broadcast.chunks[index]
+                    index += 1
+                if broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                await broadcast.wait()
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                broadcast.task.cancel()
+
+    async def _pump(self, key: str, broadcast: _Broadcast, fn: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for chunk in fn():
+                broadcast.publish(chunk)
+            broadcast.finish()
+        except asyncio.CancelledError as e:
+            broadcast.finish(e)
+        except Exception as e:
+            broadcast.finish(e)
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
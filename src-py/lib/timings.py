@@ -0,0 +1,42 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class StageTimings:
+    """Latency per pipeline stage: count, mean, max and most recent, in milliseconds."""
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block (including awaits) as one run of stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def record(self, stage: str, seconds: float) -> None:
+        ms = seconds * 1000
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += ms
+            entry["max_ms"] = max(entry["max_ms"], ms)
+            entry["last_ms"] = ms
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                stage: {
+                    "count": entry["count"],
+                    "avg_ms": entry["total_ms"] / entry["count"],
+                    "max_ms": entry["max_ms"],
+                    "last_ms": entry["last_ms"],
+                }
+                for stage, entry in self._stages.items()
+            }
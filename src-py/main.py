@@ -1,7 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from db import create_db_and_tables
+import asyncio
+import os
+from db import create_db_and_tables, async_engine, async_read_engine
+from services.payload_writer import payload_writer
+from services.session_archiver import session_archiver
+from services.connection_registry import connection_registry
+from services.vector_index import vector_reconciler, embedding_pipeline
+from lib.embedding_cache import embedding_cache
+from lib.embedding_model import embedding_model
 
 from api import api_router
 
@@ -9,12 +17,29 @@ from api import api_router
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     # Load
-    print("Creating database and tables...")
+    print("Creating database and tables, applying migrations...")
     create_db_and_tables()
     print("Database initialized!")
+    archival = asyncio.create_task(session_archiver.run()) if session_archiver.idle_days > 0 else None
+    registry = asyncio.create_task(connection_registry.run())
+    # Catch the vector store up with memory_documents without holding up startup
+    reconciliation = asyncio.create_task(vector_reconciler.run()) if vector_reconciler.enabled else None
+    # Load the embedding model in the background; until then /health reports it as not ready
+    warmup = asyncio.create_task(embedding_model.warmup()) if os.getenv("EMBEDDING_WARMUP", "1") != "0" else None
     yield
     # Shutdown logic
     print("Shutting down...")
+    if archival:
+        archival.cancel()
+    registry.cancel()
+    if reconciliation:
+        reconciliation.cancel()
+    if warmup:
+        warmup.cancel()
+    await connection_registry.close()
+    await payload_writer.close()
+    await async_engine.dispose()
+    await async_read_engine.dispose()
 
 
 app = FastAPI(
@@ -29,6 +54,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor"],
 )
 
 @app.get("/")
@@ -38,7 +64,15 @@ def root():
 
 @app.get("/health")
 def health():
-    return {"status": "OK", "service": "Clara Backend"}
+    return {
+        "status": "OK",
+        "service": "Clara Backend",
+        "ready": embedding_model.ready,
+        "embedding_model": embedding_model.stats(),
+        "vector_store": vector_reconciler.stats(),
+        "embedding_pipeline": embedding_pipeline.stats(),
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+    }
 
 
 app.include_router(api_router)
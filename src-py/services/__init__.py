@@ -1,11 +1,14 @@
 from .chat_service import ChatService
-from .memory_collection_service import MemoryCollectionService
-from .memory_document_service import MemoryDocumentService
-from .interaction_service import InteractionService
+from .memory_collection_service import MemoryCollectionService, AsyncMemoryCollectionService
+from .memory_document_service import MemoryDocumentService, AsyncMemoryDocumentService
+from .interaction_service import InteractionService, AsyncInteractionService
 
 __all__ = [
     "ChatService",
     "MemoryCollectionService", 
     "MemoryDocumentService",
-    "InteractionService"
+    "InteractionService",
+    "AsyncMemoryCollectionService",
+    "AsyncMemoryDocumentService",
+    "AsyncInteractionService",
 ] 
\ No newline at end of file
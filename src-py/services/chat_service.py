@@ -1,13 +1,35 @@
-from sqlmodel import Session, select
-from typing import List, Dict, Optional
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Dict, Optional, AsyncIterator
 from datetime import datetime, UTC
+from contextlib import aclosing
+import asyncio
 
 from lib.gemini import GeminiClient
+from lib.resilience import GeminiError
+from lib.timings import StageTimings
 from data.models import (
+    InteractionSession,
+    InteractionPayload,
     InteractionPayloadCreate,
     InteractionFrom,
 )
-from .interaction_service import InteractionService
+from .interaction_service import AsyncInteractionService
+from .context_builder import ContextBuilder, ConversationContext
+from .history_cache import history_cache
+from .payload_writer import payload_writer
+from .retrieval import MemoryRetriever
+from .scheduler import GenerationScheduler, Reservation, scheduler
+
+
+GENERATION_CANCELLED = "Generation cancelled"
+
+
+class GenerationCancelled(Exception):
+    """Raised by stream_message when generation was cancelled; carries the stored partial payload."""
+    
+    def __init__(self, payload: InteractionPayload):
+        super().__init__(GENERATION_CANCELLED)
+        self.payload = payload
 
 
 class ChatService:
@@ -16,13 +38,32 @@ class ChatService:
     
     Handles message processing, AI response generation, and database storage.
     Integrates with Gemini AI for intelligent responses.
+    
+    Each turn sends a token-budgeted context (see ContextBuilder): recent
+    turns verbatim plus a rolling summary of older ones. When memory
+    collections are configured (see MemoryRetriever), passages relevant to the
+    message are retrieved while that context is built and placed in front of
+    the user's message. The duration of each stage is kept in `timings`.
+    
+    The pipeline is async end to end: Gemini is called through the SDK's aio
+    client and the database through an AsyncSession, so no thread is held
+    while waiting on either. Generations go through the shared
+    GenerationScheduler, which caps concurrency, queues fairly across sessions
+    and rejects with SchedulerBusy when its queue is full. Payloads are written
+    through the shared PayloadWriter, which group-commits inserts across sessions.
     """
     
-    def __init__(self):
+    def __init__(self, max_concurrency: Optional[int] = None):
         self.gemini_client = GeminiClient()
-        self.interaction_service = InteractionService()
+        self.interaction_service = AsyncInteractionService()
+        self.history_cache = history_cache
+        self.payload_writer = payload_writer
+        self.scheduler = GenerationScheduler(max_concurrency=max_concurrency) if max_concurrency else scheduler
+        self.context_builder = ContextBuilder(cache=self.history_cache, scheduler=self.scheduler)
+        self.timings = StageTimings()
+        self.retriever = MemoryRetriever(timings=self.timings)
     
-    def send_message(self, session_id: str, message: str, db_session: Session) -> Dict:
+    async def send_message(self, session_id: str, message: str, db_session: AsyncSession) -> Dict:
         """
         Process a user message and generate Clara's AI response.
         
@@ -36,36 +77,34 @@ class ChatService:
             
         Returns:
             Dict containing user_message and ai_response data with IDs
+            
+        Raises:
+            SchedulerBusy: if the generation queue is full
+            GeminiError: if generation failed upstream (RetryableGeminiError,
+                FatalGeminiError or CircuitOpenError)
         """
-        # Verify session exists
-        interaction_session = self.interaction_service.get_session(db_session, session_id)
-        if not interaction_session:
-            raise ValueError(f"Session {session_id} not found")
-        
-        # Store user message
-        user_payload = InteractionPayloadCreate(
-            session_id=session_id,
-            content=message,
-            ok=True,
-            **{"from": InteractionFrom.USER}
-        )
-        user_record = self.interaction_service.create_payload(db_session, user_payload)
+        # Rejected here, before anything is stored, or never
+        reservation = self.scheduler.reserve()
+        try:
+            return await self._send_message(session_id, message, db_session, reservation)
+        finally:
+            reservation.release()
+    
+    async def _send_message(self, session_id: str, message: str, db_session: AsyncSession, reservation: Reservation) -> Dict:
+        interaction_session = await self._get_interaction_session(session_id, db_session)
+        user_record = await self._store_user_message(session_id, message, db_session)
         
         try:
-            # Get conversation history
-            conversation_history = self._get_conversation_history(session_id, db_session)
+            # Build the token-budgeted conversation context, with memory passages
+            context = await self._build_context(interaction_session, message, db_session)
             
             # Generate AI response
-            ai_response = self.gemini_client.generate_response(conversation_history)
+            with self.timings.measure("generation"):
+                async with self.scheduler.slot(session_id, reservation=reservation):
+                    ai_response = await self.gemini_client.generate_response_async(context.history, context.summary)
             
             # Store AI response
-            ai_payload = InteractionPayloadCreate(
-                session_id=session_id,
-                content=ai_response,
-                ok=True,
-                **{"from": InteractionFrom.MODEL}
-            )
-            ai_payload_record = self.interaction_service.create_payload(db_session, ai_payload)
+            ai_payload_record = await self._store_ai_message(session_id, ai_response, db_session)
             
             return {
                 "user_message": {
@@ -84,36 +123,138 @@ class ChatService:
                 "created_at": ai_payload_record.created_at
             }
             
+        except GeminiError as e:
+            # Store failed AI response; the typed error tells callers whether to retry
+            await self._store_ai_message(session_id, "", db_session, err=str(e))
+            raise
         except Exception as e:
             # Store failed AI response
-            error_payload = InteractionPayloadCreate(
-                session_id=session_id,
-                content="",
-                ok=False,
-                err=str(e),
-                **{"from": InteractionFrom.MODEL}
-            )
-            self.interaction_service.create_payload(db_session, error_payload)
-            raise Exception(f"Failed to generate AI response: {str(e)}")
+            await self._store_ai_message(session_id, "", db_session, err=str(e))
+            raise Exception(f"Failed to generate AI response: {str(e)}") from e
     
-    def _get_conversation_history(self, session_id: str, db_session: Session) -> List[Dict]:
-        """Get conversation history for a session in the format expected by Gemini."""
-        payloads = self.interaction_service.get_session_payloads(db_session, session_id)
+    async def stream_message(self, session_id: str, message: str, db_session: AsyncSession) -> AsyncIterator[Dict]:
+        """
+        Process a user message and stream Clara's AI response as it is generated.
         
-        history = []
-        for payload in payloads:
-            if payload.ok:  # Only include successful messages
-                role = "user" if payload.from_ == InteractionFrom.USER else "model"
-                history.append({
-                    "role": role,
-                    "content": payload.content
-                })
+        Yields, in order:
+            - a "user_message" event once the user message is stored
+            - one "ai_delta" event per chunk of generated text
+            - a final "ai_response" event with the persisted AI payload
+        
+        The AI payload is stored exactly once, when the stream completes. If
+        generation fails midway, the partial text is stored as a failed payload
+        and the error is raised. If the consuming task is cancelled or the
+        stream is closed early, the partial text is stored with
+        err=GENERATION_CANCELLED; cancellation is surfaced as GenerationCancelled
+        carrying that payload. When the generation queue is full, SchedulerBusy
+        is raised before anything is stored: a queue position is reserved up
+        front and used for the generation.
+        
+        Args:
+            session_id: The interaction session ID
+            message: User's message content
+            db_session: Database session
+        """
+        reservation = self.scheduler.reserve()
+        try:
+            async with aclosing(self._stream_message(session_id, message, db_session, reservation)) as events:
+                async for event in events:
+                    yield event
+        finally:
+            reservation.release()
+    
+    async def _stream_message(self, session_id: str, message: str, db_session: AsyncSession, reservation: Reservation) -> AsyncIterator[Dict]:
+        interaction_session = await self._get_interaction_session(session_id, db_session)
+        user_record = await self._store_user_message(session_id, message, db_session)
+        
+        chunks = []
+        try:
+            yield {
+                "type": "user_message",
+                "id": user_record.id,
+                "content": user_record.content,
+                "created_at": user_record.created_at
+            }
+            
+            context = await self._build_context(interaction_session, message, db_session)
+            
+            with self.timings.measure("generation"):
+                async with self.scheduler.slot(session_id, reservation=reservation):
+                    stream = self.gemini_client.generate_response_stream_async(context.history, context.summary)
+                    async with aclosing(stream):
+                        async for chunk in stream:
+                            chunks.append(chunk)
+                            yield {"type": "ai_delta", "content": chunk}
+        except (asyncio.CancelledError, GeneratorExit) as e:
+            # Stopped by the client or the connection closing: keep the partial text, marked as cancelled
+            cancelled_record = await self._store_ai_message(session_id, "".join(chunks), db_session, err=GENERATION_CANCELLED)
+            if isinstance(e, GeneratorExit):
+                raise
+            raise GenerationCancelled(cancelled_record)
+        except GeminiError as e:
+            # Store failed AI response, keeping whatever was generated
+            await self._store_ai_message(session_id, "".join(chunks), db_session, err=str(e))
+            raise
+        except Exception as e:
+            # Store failed AI response, keeping whatever was generated
+            await self._store_ai_message(session_id, "".join(chunks), db_session, err=str(e))
+            raise Exception(f"Failed to generate AI response: {str(e)}") from e
+        
+        ai_payload_record = await self._store_ai_message(session_id, "".join(chunks), db_session)
+        yield {
+            "type": "ai_response",
+            "id": ai_payload_record.id,
+            "content": ai_payload_record.content,
+            "created_at": ai_payload_record.created_at
+        }
+    
+    async def _build_context(self, interaction_session: InteractionSession, message: str, db_session: AsyncSession) -> ConversationContext:
+        """The conversation context, with memory passages retrieved concurrently added to the last user turn."""
+        async def build():
+            with self.timings.measure("context"):
+                return await self.context_builder.build(interaction_session, db_session)
+        
+        async def retrieve():
+            with self.timings.measure("retrieval"):
+                return await self.retriever.retrieve(message)
         
-        return history
+        context, retrieval = await asyncio.gather(build(), retrieve())
+        context.history = self.retriever.augment(context.history, retrieval.passages)
+        return context
+    
+    async def _get_interaction_session(self, session_id: str, db_session: AsyncSession) -> InteractionSession:
+        """Get the interaction session, raising if it does not exist."""
+        # A resumed archived session gets its history back before new messages are added
+        await self.interaction_service.rehydrate_if_archived(db_session, session_id)
+        interaction_session = await self.interaction_service.get_session(db_session, session_id)
+        if not interaction_session:
+            raise ValueError(f"Session {session_id} not found")
+        return interaction_session
+    
+    async def _store_user_message(self, session_id: str, message: str, db_session: AsyncSession) -> InteractionPayload:
+        """Store the user's message."""
+        user_payload = InteractionPayloadCreate(
+            session_id=session_id,
+            content=message,
+            ok=True,
+            **{"from": InteractionFrom.USER}
+        )
+        return await self.payload_writer.write(user_payload)
+    
+    async def _store_ai_message(self, session_id: str, content: str, db_session: AsyncSession, err: Optional[str] = None) -> InteractionPayload:
+        """Store an AI response, marking it failed when an error is given."""
+        ai_payload = InteractionPayloadCreate(
+            session_id=session_id,
+            content=content,
+            ok=err is None,
+            err=err,
+            **{"from": InteractionFrom.MODEL}
+        )
+        return await self.payload_writer.write(ai_payload)
     
-    def get_session_messages(self, session_id: str, db_session: Session) -> List[Dict]:
+    async def get_session_messages(self, session_id: str, db_session: AsyncSession) -> List[Dict]:
         """Get all messages for a session formatted for the frontend."""
-        payloads = self.interaction_service.get_session_payloads(db_session, session_id)
+        payloads = await self.interaction_service.get_session_payloads(db_session, session_id)
         
         messages = []
         for payload in payloads:
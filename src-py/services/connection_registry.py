@@ -0,0 +1,260 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from lib._utils import logger
+
+# Delivers one frame to the WebSocket this worker holds for a session
+Deliver = Callable[[dict], Awaitable[None]]
+
+
+class MemoryConnectionRegistry:
+    """
+    In-process registry of the chat WebSockets held by this worker.
+
+    Enough for a single worker: claims, the session list and published
+    frames never leave the process.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Deliver] = {}
+        self.delivered = 0
+
+    async def claim(self, session_id: str, deliver: Deliver) -> bool:
+        """Register this worker's socket for a session; False if the session already has one."""
+        if session_id in self._handlers:
+            return False
+        self._handlers[session_id] = deliver
+        return True
+
+    async def release(self, session_id: str) -> None:
+        self._handlers.pop(session_id, None)
+
+    async def sessions(self) -> List[str]:
+        return list(self._handlers)
+
+    async def publish(self, session_id: str, frame: dict) -> bool:
+        """Send a frame to the session's socket; False if no socket is connected."""
+        deliver = self._handlers.get(session_id)
+        if deliver is None:
+            return False
+        await deliver(frame)
+        self.delivered += 1
+        return True
+
+    async def run(self) -> None:
+        """Nothing to poll in-process; returns immediately."""
+
+    async def close(self) -> None:
+        self._handlers.clear()
+
+    async def stats(self) -> Dict:
+        return {"backend": "memory", "connections": len(self._handlers), "delivered": self.delivered}
+
+
+class SQLiteConnectionRegistry(MemoryConnectionRegistry):
+    """
+    Connection registry shared by every worker using the same SQLite file.
+
+    Each worker heartbeats a row in chat_workers. A claim is a row in
+    chat_connections keyed by session id, so only one worker can hold a
+    session's socket; claims of a worker whose heartbeat is older than
+    stale_after (crashed, killed) are taken over. A frame published for a
+    socket held by another worker goes into chat_frames, addressed to that
+    worker, which picks it up on its next poll and sends it.
+
+    All SQLite work runs off the event loop, serialized by a lock.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        poll_interval: float = 0.05,
+        heartbeat_interval: float = 2.0,
+        stale_after: float = 10.0,
+    ):
+        super().__init__()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.forwarded = 0
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chat_workers (worker_id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_connections ("
+            "session_id TEXT PRIMARY KEY, worker_id TEXT NOT NULL, connected_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_frames ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, worker_id TEXT NOT NULL, session_id TEXT NOT NULL, frame TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_frames_worker_id ON chat_frames (worker_id, id)")
+        self._heartbeat()
+
+    async def claim(self, session_id: str, deliver: Deliver) -> bool:
+        if session_id in self._handlers or not await asyncio.to_thread(self._claim, session_id):
+            return False
+        self._handlers[session_id] = deliver
+        return True
+
+    async def release(self, session_id: str) -> None:
+        self._handlers.pop(session_id, None)
+        await asyncio.to_thread(self._execute, "DELETE FROM chat_connections WHERE session_id = ? AND worker_id = ?", (session_id, self.worker_id))
+
+    async def sessions(self) -> List[str]:
+        return await asyncio.to_thread(self._live_sessions)
+
+    async def publish(self, session_id: str, frame: dict) -> bool:
+        if session_id in self._handlers:
+            return await super().publish(session_id, frame)
+        if not await asyncio.to_thread(self._forward, session_id, json.dumps(frame)):
+            return False
+        self.forwarded += 1
+        return True
+
+    async def run(self) -> None:
+        """Heartbeat and deliver frames addressed to this worker until cancelled."""
+        last_heartbeat = time.time()
+        while True:
+            try:
+                if time.time() - last_heartbeat >= self.heartbeat_interval:
+                    await asyncio.to_thread(self._heartbeat)
+                    last_heartbeat = time.time()
+                for session_id, frame in await asyncio.to_thread(self._take_frames):
+                    # The socket may have closed since the frame was addressed here
+                    await super().publish(session_id, json.loads(frame))
+            except Exception as e:
+                logger.error(f"Connection registry poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def close(self) -> None:
+        """Drop this worker's claims so other workers can take its sessions at once."""
+        await super().close()
+        await asyncio.to_thread(self._deregister)
+
+    async def stats(self) -> Dict:
+        connections, workers = await asyncio.to_thread(self._live_counts)
+        return {
+            "backend": "sqlite",
+            "worker_id": self.worker_id,
+            "connections": connections,
+            "local_connections": len(self._handlers),
+            "workers": workers,
+            "delivered": self.delivered,
+            "forwarded": self.forwarded,
+        }
+
+    def _execute(self, sql: str, params: tuple = ()) -> None:
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def _heartbeat(self) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chat_workers (worker_id, heartbeat_at) VALUES (?, ?)",
+                (self.worker_id, now)
+            )
+            # Frames addressed to a dead worker can never be delivered
+            self._conn.execute(
+                "DELETE FROM chat_frames WHERE worker_id NOT IN "
+                "(SELECT worker_id FROM chat_workers WHERE heartbeat_at >= ?)",
+                (now - self.stale_after,)
+            )
+
+    def _claim(self, session_id: str) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A claim whose worker stopped heartbeating belongs to nobody
+                self._conn.execute(
+                    "DELETE FROM chat_connections WHERE session_id = ? AND worker_id NOT IN "
+                    "(SELECT worker_id FROM chat_workers WHERE heartbeat_at >= ?)",
+                    (session_id, now - self.stale_after)
+                )
+                claimed = self._conn.execute(
+                    "INSERT OR IGNORE INTO chat_connections (session_id, worker_id, connected_at) VALUES (?, ?, ?)",
+                    (session_id, self.worker_id, now)
+                ).rowcount == 1
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def _live_sessions(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT c.session_id FROM chat_connections c JOIN chat_workers w ON w.worker_id = c.worker_id "
+                "WHERE w.heartbeat_at >= ? ORDER BY c.connected_at",
+                (time.time() - self.stale_after,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _live_counts(self) -> tuple:
+        """(sockets, workers holding them) across live workers"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT c.worker_id) FROM chat_connections c "
+                "JOIN chat_workers w ON w.worker_id = c.worker_id WHERE w.heartbeat_at >= ?",
+                (time.time() - self.stale_after,)
+            ).fetchone()
+
+    def _forward(self, session_id: str, frame: str) -> bool:
+        """Address a frame to the live worker holding the session; False if there is none."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT c.worker_id FROM chat_connections c JOIN chat_workers w ON w.worker_id = c.worker_id "
+                "WHERE c.session_id = ? AND w.heartbeat_at >= ?",
+                (session_id, time.time() - self.stale_after)
+            ).fetchone()
+            if row is None:
+                return False
+            self._conn.execute(
+                "INSERT INTO chat_frames (worker_id, session_id, frame) VALUES (?, ?, ?)",
+                (row[0], session_id, frame)
+            )
+        return True
+
+    def _take_frames(self) -> List[tuple]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, session_id, frame FROM chat_frames WHERE worker_id = ? ORDER BY id",
+                (self.worker_id,)
+            ).fetchall()
+            if rows:
+                self._conn.execute("DELETE FROM chat_frames WHERE worker_id = ? AND id <= ?", (self.worker_id, rows[-1][0]))
+        return [(session_id, frame) for _, session_id, frame in rows]
+
+    def _deregister(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chat_connections WHERE worker_id = ?", (self.worker_id,))
+            self._conn.execute("DELETE FROM chat_frames WHERE worker_id = ?", (self.worker_id,))
+            self._conn.execute("DELETE FROM chat_workers WHERE worker_id = ?", (self.worker_id,))
+
+
+def connection_registry_from_env() -> MemoryConnectionRegistry:
+    """Build the registry configured by CHAT_CONNECTION_REGISTRY ("memory", the default, or "sqlite")."""
+    if (os.getenv("CHAT_CONNECTION_REGISTRY") or "").lower() != "sqlite":
+        return MemoryConnectionRegistry()
+    return SQLiteConnectionRegistry(
+        os.getenv("CHAT_CONNECTION_REGISTRY_PATH") or "../data/memory/connections.db",
+        poll_interval=float(os.getenv("CHAT_CONNECTION_POLL_MS", "50")) / 1000,
+        stale_after=float(os.getenv("CHAT_CONNECTION_STALE_AFTER", "10")),
+    )
+
+
+connection_registry = connection_registry_from_env()
@@ -0,0 +1,177 @@
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass, field
+import os
+
+from lib._utils import logger
+from lib.gemini import GeminiClient
+from data.models import (
+    InteractionSession,
+    InteractionPayload,
+    InteractionFrom,
+)
+from .interaction_service import AsyncInteractionService
+from .history_cache import SessionHistoryCache, history_cache
+from .scheduler import GenerationScheduler, Priority, scheduler as default_scheduler
+
+
+SUMMARIZER_INSTRUCTION = (
+    "You maintain a running summary of a conversation between a user and Clara, "
+    "an AI assistant. Merge the new turns into the existing summary. Keep facts, "
+    "decisions, names, open questions and user preferences; drop small talk. "
+    "Respond with the updated summary only, in plain text."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for budgeting prompts."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class ConversationContext:
+    """What gets sent to Gemini for one turn: a rolling summary plus recent turns verbatim."""
+    history: List[Dict] = field(default_factory=list)
+    summary: Optional[str] = None
+
+
+class ContextBuilder:
+    """
+    Builds a token-budgeted prompt context for a chat session.
+
+    Payloads after InteractionSession.summarized_through_id are sent verbatim.
+    When they exceed CHAT_CONTEXT_TOKEN_BUDGET, the oldest ones are folded into
+    InteractionSession.context_summary until the verbatim part is back under
+    CHAT_CONTEXT_KEEP_RATIO of the budget, so the summary is updated every few
+    turns rather than on every message and prompt size stays flat as sessions grow.
+
+    Pending payloads are served from the per-session history cache when
+    possible, so a hot session builds its context without payload reads.
+    Summarizer calls go through the generation scheduler at the priority of
+    the turn being built: the reply waits for the summary, so queueing it
+    behind other requests would only hold that reply back.
+    """
+
+    def __init__(
+        self,
+        summarizer: Optional[GeminiClient] = None,
+        token_budget: Optional[int] = None,
+        keep_ratio: Optional[float] = None,
+        summary_max_words: Optional[int] = None,
+        fetch_limit: int = 500,
+        cache: Optional[SessionHistoryCache] = None,
+        scheduler: Optional[GenerationScheduler] = None,
+    ):
+        self.summarizer = summarizer or GeminiClient(system_instruction=SUMMARIZER_INSTRUCTION)
+        self.interaction_service = AsyncInteractionService()
+        self.history_cache = cache or history_cache
+        self.scheduler = scheduler or default_scheduler
+        self.token_budget = token_budget or int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "8000"))
+        self.keep_ratio = keep_ratio or float(os.getenv("CHAT_CONTEXT_KEEP_RATIO", "0.5"))
+        self.summary_max_words = summary_max_words or int(os.getenv("CHAT_SUMMARY_MAX_WORDS", "300"))
+        self.fetch_limit = fetch_limit
+
+    async def build(
+        self, interaction_session: InteractionSession, db_session: AsyncSession, priority: Priority = Priority.INTERACTIVE
+    ) -> ConversationContext:
+        """Return the context for the next generation, folding old turns into the summary if needed."""
+        summary = interaction_session.context_summary
+        watermark = interaction_session.summarized_through_id
+
+        while True:
+            payloads, has_more, version = await self._pending_payloads(interaction_session.id, watermark, db_session)
+            tokens = sum(estimate_tokens(p.content) for p in payloads if p.ok)
+            if not has_more and tokens <= self.token_budget:
+                break
+
+            folded = self._select_fold(payloads, keep_all_but_last=has_more)
+            if not folded:
+                break
+
+            try:
+                summary = await self._summarize(interaction_session.id, summary, folded, priority)
+            except Exception as e:
+                # Never fail the turn because of the summary; send the newest turns that fit instead
+                logger.warning(f"Context summarization failed for session {interaction_session.id}: {e}")
+                return ConversationContext(history=self._trim_to_budget(payloads), summary=summary)
+
+            watermark = folded[-1].id
+            await self.interaction_service.update_session_summary(
+                db_session, interaction_session.id, summary, watermark
+            )
+            if not has_more:
+                # Keep the unfolded tail cached under the new watermark, unless a payload
+                # was appended since it was read
+                self.history_cache.put(interaction_session.id, watermark, payloads[len(folded):], version)
+
+        return ConversationContext(history=self._to_history(payloads), summary=summary)
+
+    async def _pending_payloads(self, session_id: str, watermark: Optional[int], db_session: AsyncSession) -> Tuple[List, bool, int]:
+        """
+        Payloads after watermark from the history cache, falling back to the
+        database, with the cache version they were read at.
+        """
+        version = self.history_cache.version(session_id)
+        cached = self.history_cache.get(session_id, watermark)
+        if cached is not None:
+            return cached, False, version
+
+        payloads = await self.interaction_service.get_session_payloads_after(
+            db_session, session_id, watermark, self.fetch_limit
+        )
+        has_more = len(payloads) == self.fetch_limit
+        if not has_more:
+            self.history_cache.put(session_id, watermark, payloads, version)
+        return payloads, has_more, version
+
+    def _select_fold(self, payloads: List[InteractionPayload], keep_all_but_last: bool) -> List[InteractionPayload]:
+        """Pick the oldest payloads to fold, bounded so one summarizer call stays within the budget."""
+        target = self.token_budget * self.keep_ratio
+        remaining = sum(estimate_tokens(p.content) for p in payloads if p.ok)
+        folded_tokens = 0
+        folded = []
+        # Always keep the newest payload (the message being answered) verbatim
+        for payload in payloads[:-1]:
+            if not keep_all_but_last and remaining <= target:
+                break
+            cost = estimate_tokens(payload.content) if payload.ok else 0
+            if folded and folded_tokens + cost > self.token_budget:
+                break
+            folded.append(payload)
+            folded_tokens += cost
+            remaining -= cost
+        return folded
+
+    async def _summarize(self, session_id: str, summary: Optional[str], payloads: List[InteractionPayload], priority: Priority) -> str:
+        transcript = "\n".join(
+            f"{'User' if p.from_ == InteractionFrom.USER else 'Clara'}: {p.content}"
+            for p in payloads if p.ok
+        )
+        prompt = (
+            f"Existing summary:\n{summary or '(none)'}\n\n"
+            f"New turns:\n{transcript}\n\n"
+            f"Write the updated summary in at most {self.summary_max_words} words."
+        )
+        async with self.scheduler.slot(session_id, priority):
+            return await self.summarizer.generate_response_async([{"role": "user", "content": prompt}])
+
+    def _trim_to_budget(self, payloads: List[InteractionPayload]) -> List[Dict]:
+        """Keep the newest successful turns that fit the token budget."""
+        kept = []
+        tokens = 0
+        for payload in reversed([p for p in payloads if p.ok]):
+            tokens += estimate_tokens(payload.content)
+            if kept and tokens > self.token_budget:
+                break
+            kept.append(payload)
+        return self._to_history(reversed(kept))
+
+    def _to_history(self, payloads) -> List[Dict]:
+        """Convert payloads into the format expected by Gemini, skipping failed ones."""
+        return [
+            {
+                "role": "user" if p.from_ == InteractionFrom.USER else "model",
+                "content": p.content
+            }
+            for p in payloads if p.ok
+        ]
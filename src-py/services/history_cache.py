@@ -0,0 +1,85 @@
+from typing import List, Optional, NamedTuple
+import os
+
+from lib.cache import LRUCache
+from data.models import InteractionPayload, InteractionPayloadRead
+
+
+class CachedHistory(NamedTuple):
+    watermark: Optional[int]
+    payloads: List[InteractionPayloadRead]
+
+
+class SessionHistoryCache:
+    """
+    Per-session cache of the payloads the context builder sends verbatim.
+
+    Each entry holds the payloads after the session's summary watermark as
+    detached InteractionPayloadRead snapshots. InteractionService appends new
+    payloads on create and invalidates on update/delete, so a hot session can
+    build its context without reading payloads from the database.
+
+    A per-session version guards against a stale fill: a snapshot read from
+    the database is only stored if nothing changed for that session meanwhile.
+    """
+
+    def __init__(self, max_sessions: Optional[int] = None, max_payloads: Optional[int] = None):
+        max_sessions = max_sessions or int(os.getenv("CHAT_HISTORY_CACHE_SESSIONS", "256"))
+        self.max_payloads = max_payloads or int(os.getenv("CHAT_HISTORY_CACHE_MAX_PAYLOADS", "500"))
+        self._entries = LRUCache(max_entries=max_sessions)
+        self._versions = LRUCache(max_entries=max_sessions * 8)
+
+    def version(self, session_id: str) -> int:
+        """Current version of a session; pass it to put() after reading from the database."""
+        return self._versions.get(session_id, 0)
+
+    def get(self, session_id: str, watermark: Optional[int]) -> Optional[List[InteractionPayloadRead]]:
+        """Cached payloads after watermark, or None when not cached for that watermark."""
+        entry = self._entries.get(session_id)
+        if entry is None or entry.watermark != watermark:
+            return None
+        return list(entry.payloads)
+
+    def put(self, session_id: str, watermark: Optional[int], payloads: List, version: int) -> bool:
+        """Store a snapshot unless the session changed since version was taken."""
+        if len(payloads) > self.max_payloads or self.version(session_id) != version:
+            return False
+        snapshot = [self._snapshot(p) for p in payloads]
+        self._entries.set(session_id, CachedHistory(watermark, snapshot))
+        return True
+
+    def append(self, payload: InteractionPayload) -> None:
+        """Add a newly stored payload to its session's entry, if cached."""
+        self._bump(payload.session_id)
+        snapshot = self._snapshot(payload)
+        sizes = []
+
+        def _append(entry: CachedHistory) -> CachedHistory:
+            sizes.append(len(entry.payloads) + 1)
+            return CachedHistory(entry.watermark, entry.payloads + [snapshot])
+
+        if self._entries.update(payload.session_id, _append) and sizes[0] > self.max_payloads:
+            self._entries.pop(payload.session_id)
+
+    def invalidate(self, session_id: str) -> None:
+        self._bump(session_id)
+        self._entries.pop(session_id)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+    def _bump(self, session_id: str) -> None:
+        self._versions.set(session_id, self._versions.get(session_id, 0) + 1)
+
+    @staticmethod
+    def _snapshot(payload) -> InteractionPayloadRead:
+        if isinstance(payload, InteractionPayloadRead):
+            return payload
+        return InteractionPayloadRead.model_validate(payload)
+
+
+history_cache = SessionHistoryCache()
@@ -1,19 +1,35 @@
-from sqlmodel import Session, select
+from sqlmodel import Session, select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional
 from datetime import datetime, UTC
+import asyncio
+import os
 
 from data.models import (
     InteractionSession,
     InteractionSessionCreate,
+    InteractionSessionRead,
+    InteractionSessionWithPayloads,
     InteractionSessionUpdate,
     InteractionPayload,
     InteractionPayloadCreate,
+    InteractionPayloadRead,
     InteractionPayloadUpdate,
     InteractionFrom,
 )
+from .history_cache import history_cache
+from .metadata_cache import metadata_cache
+from .pagination import Keyset
+from .session_archiver import session_archiver
 
 
 class InteractionService:
+    # List orderings; the trailing id breaks ties so cursors are exact
+    session_pages = Keyset(InteractionSession.started_at, InteractionSession.id, descending=True)
+    payload_pages = Keyset(InteractionPayload.created_at, InteractionPayload.id, descending=True)
+    session_payload_pages = Keyset(InteractionPayload.created_at, InteractionPayload.id)
+    
     # Session operations
     def create_session(self, session: Session, session_data: InteractionSessionCreate) -> InteractionSession:
         """Create a new interaction session"""
@@ -24,13 +40,17 @@ class InteractionService:
         return db_session
     
     def get_session(self, session: Session, session_id: str) -> Optional[InteractionSession]:
-        """Get an interaction session by ID"""
-        return session.get(InteractionSession, session_id)
+        """Get an interaction session by ID, through the metadata cache (treat the result as read-only)"""
+        cached = metadata_cache.get("sessions", session_id)
+        if cached is not None:
+            return cached
+        version = metadata_cache.version("sessions", session_id)
+        interaction_session = session.get(InteractionSession, session_id, populate_existing=True)
+        return metadata_cache.put("sessions", session_id, interaction_session, version)
     
-    def get_sessions(self, session: Session, skip: int = 0, limit: int = 100) -> List[InteractionSession]:
-        """Get all interaction sessions"""
-        statement = select(InteractionSession).order_by(InteractionSession.started_at.desc()).offset(skip).limit(limit)
-        return session.exec(statement).all()
+    def get_sessions(self, session: Session, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[InteractionSession]:
+        """Get all interaction sessions, newest first"""
+        return self.session_pages.fetch(session, select(InteractionSession), skip, limit, after, before)
     
     def get_recent_sessions(self, session: Session, limit: int = 10) -> List[InteractionSession]:
         """Get recent interaction sessions"""
@@ -47,30 +67,54 @@ class InteractionService:
             session.add(interaction_session)
             session.commit()
             session.refresh(interaction_session)
+            metadata_cache.invalidate("sessions", session_id)
         return interaction_session
     
-    def delete_session(self, session: Session, session_id: str) -> bool:
-        """Delete an interaction session and all its payloads"""
+    def update_session_summary(self, session: Session, session_id: str, context_summary: str, summarized_through_id: int) -> Optional[InteractionSession]:
+        """Store the rolling context summary and the last payload it covers"""
         interaction_session = session.get(InteractionSession, session_id)
         if interaction_session:
-            # First delete all associated payloads
-            statement = select(InteractionPayload).where(InteractionPayload.session_id == session_id)
-            payloads = session.exec(statement).all()
-            for payload in payloads:
-                session.delete(payload)
-            
-            # Then delete the session
-            session.delete(interaction_session)
+            interaction_session.context_summary = context_summary
+            interaction_session.summarized_through_id = summarized_through_id
+            session.add(interaction_session)
             session.commit()
-            return True
-        return False
-    
-    def get_session_with_payloads(self, session: Session, session_id: str) -> Optional[InteractionSession]:
-        """Get an interaction session with all its payloads"""
-        statement = select(InteractionSession).where(InteractionSession.id == session_id)
-        interaction_session = session.exec(statement).first()
+            session.refresh(interaction_session)
+            metadata_cache.invalidate("sessions", session_id)
         return interaction_session
     
+    def delete_session(self, session: Session, session_id: str) -> bool:
+        """Delete an interaction session and all its payloads in one transaction"""
+        archive_path = session.exec(
+            select(InteractionSession.archive_path).where(InteractionSession.id == session_id)
+        ).first()
+        # Set-based DELETEs: no payload rows are loaded into Python
+        session.exec(delete(InteractionPayload).where(InteractionPayload.session_id == session_id))
+        result = session.exec(delete(InteractionSession).where(InteractionSession.id == session_id))
+        session.commit()
+        session_archiver.discard(archive_path)
+        history_cache.invalidate(session_id)
+        metadata_cache.invalidate("sessions", session_id)
+        return result.rowcount > 0
+    
+    def delete_session_payloads_chunk(self, session: Session, session_id: str, chunk_size: int) -> int:
+        """Delete and commit up to chunk_size payloads of a session; returns how many were deleted"""
+        chunk = select(InteractionPayload.id).where(InteractionPayload.session_id == session_id).limit(chunk_size)
+        result = session.exec(delete(InteractionPayload).where(InteractionPayload.id.in_(chunk.scalar_subquery())))
+        session.commit()
+        return result.rowcount
+    
+    def get_session_with_payloads(self, session: Session, session_id: str, limit: int = 100, after: Optional[str] = None) -> Optional[InteractionSessionWithPayloads]:
+        """Get an interaction session with one page of its payloads, oldest first"""
+        # The session by key plus a keyset page; the relationship is never lazy-loaded or read whole
+        interaction_session = self.get_session(session, session_id)
+        if not interaction_session:
+            return None
+        payloads = self.get_session_payloads(session, session_id, limit=limit, after=after)
+        return InteractionSessionWithPayloads(
+            **InteractionSessionRead.model_validate(interaction_session).model_dump(),
+            payloads=[InteractionPayloadRead.model_validate(p) for p in payloads],
+        )
+    
     # Payload operations
     def create_payload(self, session: Session, payload_data: InteractionPayloadCreate) -> InteractionPayload:
         """Create a new interaction payload"""
@@ -78,36 +122,38 @@ class InteractionService:
         session.add(db_payload)
         session.commit()
         session.refresh(db_payload)
+        history_cache.append(db_payload)
         return db_payload
     
     def get_payload(self, session: Session, payload_id: int) -> Optional[InteractionPayload]:
         """Get an interaction payload by ID"""
         return session.get(InteractionPayload, payload_id)
     
-    def get_payloads(self, session: Session, skip: int = 0, limit: int = 100) -> List[InteractionPayload]:
-        """Get all interaction payloads"""
-        statement = select(InteractionPayload).order_by(InteractionPayload.created_at.desc()).offset(skip).limit(limit)
-        return session.exec(statement).all()
+    def get_payloads(self, session: Session, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[InteractionPayload]:
+        """Get all interaction payloads, newest first"""
+        return self.payload_pages.fetch(session, select(InteractionPayload), skip, limit, after, before)
     
-    def get_payloads_by_type(self, session: Session, from_type: InteractionFrom, skip: int = 0, limit: int = 100) -> List[InteractionPayload]:
+    def get_payloads_by_type(self, session: Session, from_type: InteractionFrom, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[InteractionPayload]:
         """Get payloads filtered by sender type (user/model)"""
-        statement = select(InteractionPayload).where(
-            InteractionPayload.from_ == from_type
-        ).order_by(InteractionPayload.created_at.desc()).offset(skip).limit(limit)
-        return session.exec(statement).all()
+        statement = select(InteractionPayload).where(InteractionPayload.from_ == from_type)
+        return self.payload_pages.fetch(session, statement, skip, limit, after, before)
     
-    def get_failed_payloads(self, session: Session, skip: int = 0, limit: int = 100) -> List[InteractionPayload]:
+    def get_failed_payloads(self, session: Session, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[InteractionPayload]:
         """Get payloads that failed (ok=False)"""
-        statement = select(InteractionPayload).where(
-            InteractionPayload.ok == False
-        ).order_by(InteractionPayload.created_at.desc()).offset(skip).limit(limit)
-        return session.exec(statement).all()
+        statement = select(InteractionPayload).where(InteractionPayload.ok == False)
+        return self.payload_pages.fetch(session, statement, skip, limit, after, before)
     
-    def get_session_payloads(self, session: Session, session_id: str, skip: int = 0, limit: int = 100) -> List[InteractionPayload]:
-        """Get all payloads for a specific session"""
-        statement = select(InteractionPayload).where(
-            InteractionPayload.session_id == session_id
-        ).order_by(InteractionPayload.created_at.asc()).offset(skip).limit(limit)
+    def get_session_payloads(self, session: Session, session_id: str, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[InteractionPayload]:
+        """Get all payloads for a specific session, oldest first"""
+        statement = select(InteractionPayload).where(InteractionPayload.session_id == session_id)
+        return self.session_payload_pages.fetch(session, statement, skip, limit, after, before)
+    
+    def get_session_payloads_after(self, session: Session, session_id: str, after_id: Optional[int] = None, limit: int = 500) -> List[InteractionPayload]:
+        """Get payloads for a session newer than after_id, oldest first"""
+        statement = select(InteractionPayload).where(InteractionPayload.session_id == session_id)
+        if after_id is not None:
+            statement = statement.where(InteractionPayload.id > after_id)
+        statement = statement.order_by(InteractionPayload.id.asc()).limit(limit)
         return session.exec(statement).all()
     
     def update_payload(self, session: Session, payload_id: int, payload_data: InteractionPayloadUpdate) -> Optional[InteractionPayload]:
@@ -120,10 +166,133 @@ class InteractionService:
             session.add(payload)
             session.commit()
             session.refresh(payload)
+            history_cache.invalidate(payload.session_id)
         return payload
     
     def get_payload_with_session(self, session: Session, payload_id: int) -> Optional[InteractionPayload]:
         """Get an interaction payload with its session data"""
-        statement = select(InteractionPayload).where(InteractionPayload.id == payload_id)
-        payload = session.exec(statement).first()
-        return payload 
\ No newline at end of file
+        statement = select(InteractionPayload).where(
+            InteractionPayload.id == payload_id
+        ).options(selectinload(InteractionPayload.session))
+        return session.exec(statement).first()
+
+
+class AsyncInteractionService:
+    """
+    InteractionService for AsyncSession.
+    
+    Each call runs the sync implementation through AsyncSession.run_sync, which
+    drives it on the asyncio driver without a worker thread. Relationships that
+    routes serialize are eager-loaded, since lazy loads cannot run after the call.
+    """
+    
+    def __init__(self):
+        self.sync = InteractionService()
+    
+    # Session operations
+    async def create_session(self, session: AsyncSession, session_data: InteractionSessionCreate) -> InteractionSession:
+        """Create a new interaction session"""
+        return await session.run_sync(self.sync.create_session, session_data)
+    
+    async def get_session(self, session: AsyncSession, session_id: str) -> Optional[InteractionSession]:
+        """Get an interaction session by ID, through the metadata cache (treat the result as read-only)"""
+        cached = metadata_cache.get("sessions", session_id)
+        if cached is not None:
+            return cached
+        version = metadata_cache.version("sessions", session_id)
+        interaction_session = await session.get(InteractionSession, session_id, populate_existing=True)
+        return metadata_cache.put("sessions", session_id, interaction_session, version)
+    
+    async def get_sessions(self, session: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[InteractionSession]:
+        """Get all interaction sessions, newest first"""
+        return await session.run_sync(self.sync.get_sessions, skip, limit, after, before)
+    
+    async def get_recent_sessions(self, session: AsyncSession, limit: int = 10) -> List[InteractionSession]:
+        """Get recent interaction sessions"""
+        return await session.run_sync(self.sync.get_recent_sessions, limit)
+    
+    async def update_session(self, session: AsyncSession, session_id: str, session_data: InteractionSessionUpdate) -> Optional[InteractionSession]:
+        """Update an interaction session"""
+        return await session.run_sync(self.sync.update_session, session_id, session_data)
+    
+    async def update_session_summary(self, session: AsyncSession, session_id: str, context_summary: str, summarized_through_id: int) -> Optional[InteractionSession]:
+        """Store the rolling context summary and the last payload it covers"""
+        return await session.run_sync(self.sync.update_session_summary, session_id, context_summary, summarized_through_id)
+    
+    async def delete_session(self, session: AsyncSession, session_id: str) -> bool:
+        """Delete an interaction session and all its payloads in one transaction"""
+        return await session.run_sync(self.sync.delete_session, session_id)
+    
+    async def rehydrate_if_archived(self, session: AsyncSession, session_id: str) -> None:
+        """
+        Bring an archived session's payloads back to the hot table before they are read.
+        
+        Only the async service rehydrates, so the archive's decompression, bulk
+        insert and commit always run in a thread, never on the event loop.
+        """
+        interaction_session = await self.get_session(session, session_id)
+        if interaction_session and interaction_session.archived_at:
+            # Archive file I/O and the restoring commit run off the event loop
+            await asyncio.to_thread(session_archiver.rehydrate, session_id)
+    
+    async def purge_session(self, session: AsyncSession, session_id: str, chunk_size: Optional[int] = None) -> bool:
+        """
+        Delete a session's payloads in chunks of SESSION_PURGE_CHUNK rows, then the session.
+        
+        Each chunk is its own short transaction, and the event loop runs in
+        between, so purging a very long session never holds the write lock for
+        long. The history cache is dropped first so the session stops serving
+        stale turns while the purge runs.
+        """
+        chunk_size = chunk_size or int(os.getenv("SESSION_PURGE_CHUNK", "500"))
+        history_cache.invalidate(session_id)
+        while await session.run_sync(self.sync.delete_session_payloads_chunk, session_id, chunk_size) == chunk_size:
+            await asyncio.sleep(0)
+        return await self.delete_session(session, session_id)
+    
+    async def get_session_with_payloads(self, session: AsyncSession, session_id: str, limit: int = 100, after: Optional[str] = None) -> Optional[InteractionSessionWithPayloads]:
+        """Get an interaction session with one page of its payloads, oldest first"""
+        await self.rehydrate_if_archived(session, session_id)
+        return await session.run_sync(self.sync.get_session_with_payloads, session_id, limit, after)
+    
+    # Payload operations
+    async def create_payload(self, session: AsyncSession, payload_data: InteractionPayloadCreate) -> InteractionPayload:
+        """Create a new interaction payload"""
+        return await session.run_sync(self.sync.create_payload, payload_data)
+    
+    async def get_payload(self, session: AsyncSession, payload_id: int) -> Optional[InteractionPayload]:
+        """Get an interaction payload by ID"""
+        return await session.get(InteractionPayload, payload_id)
+    
+    async def get_payloads(self, session: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[InteractionPayload]:
+        """Get all interaction payloads, newest first"""
+        return await session.run_sync(self.sync.get_payloads, skip, limit, after, before)
+    
+    async def get_payloads_by_type(self, session: AsyncSession, from_type: InteractionFrom, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[InteractionPayload]:
+        """Get payloads filtered by sender type (user/model)"""
+        return await session.run_sync(self.sync.get_payloads_by_type, from_type, skip, limit, after, before)
+    
+    async def get_failed_payloads(self, session: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[InteractionPayload]:
+        """Get payloads that failed (ok=False)"""
+        return await session.run_sync(self.sync.get_failed_payloads, skip, limit, after, before)
+    
+    async def get_session_payloads(self, session: AsyncSession, session_id: str, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[InteractionPayload]:
+        """Get all payloads for a specific session, oldest first"""
+        await self.rehydrate_if_archived(session, session_id)
+        return await session.run_sync(self.sync.get_session_payloads, session_id, skip, limit, after, before)
+    
+    async def get_session_payloads_after(self, session: AsyncSession, session_id: str, after_id: Optional[int] = None, limit: int = 500) -> List[InteractionPayload]:
+        """Get payloads for a session newer than after_id, oldest first"""
+        await self.rehydrate_if_archived(session, session_id)
+        return await session.run_sync(self.sync.get_session_payloads_after, session_id, after_id, limit)
+    
+    async def update_payload(self, session: AsyncSession, payload_id: int, payload_data: InteractionPayloadUpdate) -> Optional[InteractionPayload]:
+        """Update an interaction payload"""
+        return await session.run_sync(self.sync.update_payload, payload_id, payload_data)
+    
+    async def get_payload_with_session(self, session: AsyncSession, payload_id: int) -> Optional[InteractionPayload]:
+        """Get an interaction payload with its session data"""
+        statement = select(InteractionPayload).where(
+            InteractionPayload.id == payload_id
+        ).options(selectinload(InteractionPayload.session))
+        return (await session.exec(statement)).first()
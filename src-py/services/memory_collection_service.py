@@ -1,15 +1,25 @@
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import List, Optional
 from datetime import datetime, UTC
 
 from data.models import (
     MemoryCollection, 
     MemoryCollectionCreate, 
+    MemoryCollectionRead,
     MemoryCollectionUpdate,
+    MemoryCollectionWithDocuments,
+    MemoryDocument,
+    MemoryDocumentRead,
 )
+from .memory_document_service import MemoryDocumentService
+from .metadata_cache import metadata_cache
+from .pagination import Keyset
 
 
 class MemoryCollectionService:
+    collection_pages = Keyset(MemoryCollection.id)
+    
     def create_collection(self, session: Session, collection_data: MemoryCollectionCreate) -> MemoryCollection:
         """Create a new memory collection"""
         db_collection = MemoryCollection.model_validate(collection_data)
@@ -19,13 +29,18 @@ class MemoryCollectionService:
         return db_collection
     
     def get_collection(self, session: Session, collection_id: int) -> Optional[MemoryCollection]:
-        """Get a memory collection by ID"""
-        return session.get(MemoryCollection, collection_id)
+        """Get a memory collection by ID, through the metadata cache (treat the result as read-only)"""
+        cached = metadata_cache.get("collections", collection_id)
+        if cached is not None:
+            return cached
+        version = metadata_cache.version("collections", collection_id)
+        collection = session.get(MemoryCollection, collection_id, populate_existing=True)
+        return metadata_cache.put("collections", collection_id, collection, version)
     
-    def get_collections(self, session: Session, skip: int = 0, limit: int = 100) -> List[MemoryCollection]:
+    def get_collections(self, session: Session, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[MemoryCollection]:
         """Get all memory collections"""
-        statement = select(MemoryCollection).where(MemoryCollection.archived_at.is_(None)).offset(skip).limit(limit)
-        return session.exec(statement).all()
+        statement = select(MemoryCollection).where(MemoryCollection.archived_at.is_(None))
+        return self.collection_pages.fetch(session, statement, skip, limit, after, before)
     
     def update_collection(self, session: Session, collection_id: int, collection_data: MemoryCollectionUpdate) -> Optional[MemoryCollection]:
         """Update a memory collection"""
@@ -38,6 +53,7 @@ class MemoryCollectionService:
             session.add(collection)
             session.commit()
             session.refresh(collection)
+            metadata_cache.invalidate("collections", collection_id)
         return collection
     
     def archive_collection(self, session: Session, collection_id: int) -> Optional[MemoryCollection]:
@@ -49,10 +65,64 @@ class MemoryCollectionService:
             session.add(collection)
             session.commit()
             session.refresh(collection)
+            metadata_cache.invalidate("collections", collection_id)
         return collection
     
-    def get_collection_with_documents(self, session: Session, collection_id: int) -> Optional[MemoryCollection]:
-        """Get a memory collection with its documents"""
-        statement = select(MemoryCollection).where(MemoryCollection.id == collection_id)
-        collection = session.exec(statement).first()
-        return collection 
\ No newline at end of file
+    def get_collection_documents(self, session: Session, collection_id: int, limit: int = 100, after: Optional[str] = None, include_archived: bool = False) -> List[MemoryDocument]:
+        """Get one page of a collection's documents, in id order"""
+        statement = select(MemoryDocument).where(MemoryDocument.collection_id == collection_id)
+        if not include_archived:
+            statement = statement.where(MemoryDocument.archived_at.is_(None))
+        return MemoryDocumentService.document_pages.fetch(session, statement, limit=limit, after=after)
+    
+    def get_collection_with_documents(self, session: Session, collection_id: int, limit: int = 100, after: Optional[str] = None, include_archived: bool = False) -> Optional[MemoryCollectionWithDocuments]:
+        """
+        Get a memory collection with one page of its documents.
+        
+        Two queries, the collection by key and a keyset page of documents, so
+        nothing is lazy-loaded during serialization and a large collection is
+        never read whole.
+        """
+        collection = session.get(MemoryCollection, collection_id)
+        if not collection:
+            return None
+        documents = self.get_collection_documents(session, collection_id, limit, after, include_archived)
+        return MemoryCollectionWithDocuments(
+            **MemoryCollectionRead.model_validate(collection).model_dump(),
+            documents=[MemoryDocumentRead.model_validate(d) for d in documents],
+        )
+
+
+class AsyncMemoryCollectionService:
+    """MemoryCollectionService for AsyncSession; see AsyncInteractionService."""
+    
+    def __init__(self):
+        self.sync = MemoryCollectionService()
+    
+    async def create_collection(self, session: AsyncSession, collection_data: MemoryCollectionCreate) -> MemoryCollection:
+        """Create a new memory collection"""
+        return await session.run_sync(self.sync.create_collection, collection_data)
+    
+    async def get_collection(self, session: AsyncSession, collection_id: int) -> Optional[MemoryCollection]:
+        """Get a memory collection by ID, through the metadata cache (treat the result as read-only)"""
+        return await session.run_sync(self.sync.get_collection, collection_id)
+    
+    async def get_collections(self, session: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[MemoryCollection]:
+        """Get all memory collections"""
+        return await session.run_sync(self.sync.get_collections, skip, limit, after, before)
+    
+    async def update_collection(self, session: AsyncSession, collection_id: int, collection_data: MemoryCollectionUpdate) -> Optional[MemoryCollection]:
+        """Update a memory collection"""
+        return await session.run_sync(self.sync.update_collection, collection_id, collection_data)
+    
+    async def archive_collection(self, session: AsyncSession, collection_id: int) -> Optional[MemoryCollection]:
+        """Archive a memory collection"""
+        return await session.run_sync(self.sync.archive_collection, collection_id)
+    
+    async def get_collection_documents(self, session: AsyncSession, collection_id: int, limit: int = 100, after: Optional[str] = None, include_archived: bool = False) -> List[MemoryDocument]:
+        """Get one page of a collection's documents, in id order"""
+        return await session.run_sync(self.sync.get_collection_documents, collection_id, limit, after, include_archived)
+    
+    async def get_collection_with_documents(self, session: AsyncSession, collection_id: int, limit: int = 100, after: Optional[str] = None, include_archived: bool = False) -> Optional[MemoryCollectionWithDocuments]:
+        """Get a memory collection with one page of its documents"""
+        return await session.run_sync(self.sync.get_collection_with_documents, collection_id, limit, after, include_archived)
@@ -1,18 +1,31 @@
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import column, func, literal_column, table, tuple_
 from typing import List, Optional
 from datetime import datetime, UTC
 import json
 
 from data.models import (
+    IndexStatus,
     MemoryDocument,
     MemoryDocumentCreate,
+    MemoryDocumentRead,
     MemoryDocumentUpdate,
+    MemoryDocumentSearchResult,
 )
+from .metadata_cache import metadata_cache
+from .pagination import Keyset, decode_cursor, encode_cursor
+from .vector_index import embedding_pipeline
+
+# FTS5 index kept in sync with memory_documents by triggers (data/migrations.py)
+memory_documents_fts = table("memory_documents_fts", column("rowid"), column("rank"), column("memory_documents_fts"))
 
 
 class MemoryDocumentService:
+    document_pages = Keyset(MemoryDocument.id)
+    
     def create_document(self, session: Session, document_data: MemoryDocumentCreate) -> MemoryDocument:
-        """Create a new memory document"""
+        """Create a new memory document; it is embedded into Chroma in the background"""
         # Convert metadatas dict to JSON string for storage
         db_document = MemoryDocument(
             chroma_id=document_data.chroma_id,
@@ -23,34 +36,47 @@ class MemoryDocumentService:
         session.add(db_document)
         session.commit()
         session.refresh(db_document)
+        embedding_pipeline.enqueue(db_document.id)
         return db_document
     
     def get_document(self, session: Session, document_id: int) -> Optional[MemoryDocument]:
-        """Get a memory document by ID"""
-        return session.get(MemoryDocument, document_id)
+        """Get a memory document by ID, through the metadata cache (treat the result as read-only)"""
+        cached = metadata_cache.get("documents", document_id)
+        if cached is not None:
+            return cached
+        version = metadata_cache.version("documents", document_id)
+        document = session.get(MemoryDocument, document_id, populate_existing=True)
+        return metadata_cache.put("documents", document_id, document, version)
     
     def get_document_by_chroma_id(self, session: Session, chroma_id: str) -> Optional[MemoryDocument]:
-        """Get a memory document by ChromaDB ID"""
-        statement = select(MemoryDocument).where(MemoryDocument.chroma_id == chroma_id)
-        return session.exec(statement).first()
+        """Get a memory document by ChromaDB ID, through the metadata cache (treat the result as read-only)"""
+        cached = metadata_cache.get("documents_by_chroma_id", chroma_id)
+        if cached is not None:
+            return cached
+        version = metadata_cache.version("documents_by_chroma_id", chroma_id)
+        statement = select(MemoryDocument).where(MemoryDocument.chroma_id == chroma_id).execution_options(populate_existing=True)
+        document = session.exec(statement).first()
+        return metadata_cache.put("documents_by_chroma_id", chroma_id, document, version)
     
-    def get_documents_by_collection(self, session: Session, collection_id: int, skip: int = 0, limit: int = 100) -> List[MemoryDocument]:
+    def get_documents_by_collection(self, session: Session, collection_id: int, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[MemoryDocument]:
         """Get all documents in a collection"""
         statement = select(MemoryDocument).where(
             MemoryDocument.collection_id == collection_id,
             MemoryDocument.archived_at.is_(None)
-        ).offset(skip).limit(limit)
-        return session.exec(statement).all()
+        )
+        return self.document_pages.fetch(session, statement, skip, limit, after, before)
     
-    def get_documents(self, session: Session, skip: int = 0, limit: int = 100) -> List[MemoryDocument]:
+    def get_documents(self, session: Session, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[MemoryDocument]:
         """Get all memory documents"""
-        statement = select(MemoryDocument).where(MemoryDocument.archived_at.is_(None)).offset(skip).limit(limit)
-        return session.exec(statement).all()
+        statement = select(MemoryDocument).where(MemoryDocument.archived_at.is_(None))
+        return self.document_pages.fetch(session, statement, skip, limit, after, before)
     
     def update_document(self, session: Session, document_id: int, document_data: MemoryDocumentUpdate) -> Optional[MemoryDocument]:
-        """Update a memory document"""
+        """Update a memory document; its vector is refreshed in the background"""
         document = session.get(MemoryDocument, document_id)
         if document:
+            previous = (document.collection_id, document.chroma_id)
+            old_chroma_id = document.chroma_id
             update_data = document_data.model_dump(exclude_unset=True)
             update_data['updated_at'] = datetime.now(UTC)
             # Handle metadatas conversion
@@ -59,9 +85,13 @@ class MemoryDocumentService:
             
             for key, value in update_data.items():
                 setattr(document, key, value)
+            document.index_status = IndexStatus.PENDING
             session.add(document)
             session.commit()
             session.refresh(document)
+            metadata_cache.invalidate_document(document_id, old_chroma_id, document.chroma_id)
+            moved = previous != (document.collection_id, document.chroma_id)
+            embedding_pipeline.enqueue(document_id, previous if moved else None)
         return document
     
     def archive_document(self, session: Session, document_id: int) -> Optional[MemoryDocument]:
@@ -73,12 +103,102 @@ class MemoryDocumentService:
             session.add(document)
             session.commit()
             session.refresh(document)
+            metadata_cache.invalidate_document(document_id, document.chroma_id)
+            # Archived documents are removed from the vector store
+            embedding_pipeline.enqueue(document_id)
         return document
     
-    def search_documents(self, session: Session, content_query: str, limit: int = 10) -> List[MemoryDocument]:
-        """Simple text search in document content"""
-        statement = select(MemoryDocument).where(
-            MemoryDocument.content.contains(content_query),
-            MemoryDocument.archived_at.is_(None)
-        ).limit(limit)
-        return session.exec(statement).all() 
\ No newline at end of file
+    def search_documents(
+        self,
+        session: Session,
+        content_query: str,
+        limit: int = 10,
+        collection_id: Optional[int] = None,
+        include_archived: bool = False,
+        after: Optional[str] = None,
+    ) -> List[MemoryDocumentSearchResult]:
+        """
+        Full-text search over document content, best BM25 match first.
+        
+        Every word of the query must appear in the document, as a whole word or
+        a prefix. Pass the search_cursor of the last result as `after` for the
+        next page.
+        """
+        match = self._match_expression(content_query)
+        if not match:
+            return []
+        fts = memory_documents_fts
+        statement = select(
+            MemoryDocument,
+            fts.c.rank,
+            func.snippet(literal_column("memory_documents_fts"), 0, "<mark>", "</mark>", "…", 16),
+        ).join(fts, fts.c.rowid == MemoryDocument.id).where(fts.c.memory_documents_fts.op("MATCH")(match))
+        if collection_id is not None:
+            statement = statement.where(MemoryDocument.collection_id == collection_id)
+        if not include_archived:
+            statement = statement.where(MemoryDocument.archived_at.is_(None))
+        if after:
+            rank, document_id = decode_cursor(after, 2)
+            statement = statement.where(tuple_(fts.c.rank, MemoryDocument.id) > (rank, document_id))
+        statement = statement.order_by(fts.c.rank, MemoryDocument.id).limit(limit)
+        return [
+            MemoryDocumentSearchResult(**MemoryDocumentRead.model_validate(document).model_dump(), rank=rank, snippet=snippet)
+            for document, rank, snippet in session.exec(statement).all()
+        ]
+    
+    def search_cursor(self, result: MemoryDocumentSearchResult) -> str:
+        """Cursor for the search page that follows result"""
+        return encode_cursor([result.rank, result.id])
+    
+    @staticmethod
+    def _match_expression(content_query: str) -> str:
+        """Quote each word as an FTS5 prefix query so user input cannot break the MATCH syntax"""
+        terms = [term.replace('"', '""') for term in content_query.split()]
+        return " ".join(f'"{term}"*' for term in terms)
+
+
+class AsyncMemoryDocumentService:
+    """MemoryDocumentService for AsyncSession; see AsyncInteractionService."""
+    
+    def __init__(self):
+        self.sync = MemoryDocumentService()
+    
+    async def create_document(self, session: AsyncSession, document_data: MemoryDocumentCreate) -> MemoryDocument:
+        """Create a new memory document"""
+        return await session.run_sync(self.sync.create_document, document_data)
+    
+    async def get_document(self, session: AsyncSession, document_id: int) -> Optional[MemoryDocument]:
+        """Get a memory document by ID, through the metadata cache (treat the result as read-only)"""
+        return await session.run_sync(self.sync.get_document, document_id)
+    
+    async def get_document_by_chroma_id(self, session: AsyncSession, chroma_id: str) -> Optional[MemoryDocument]:
+        """Get a memory document by ChromaDB ID"""
+        return await session.run_sync(self.sync.get_document_by_chroma_id, chroma_id)
+    
+    async def get_documents_by_collection(self, session: AsyncSession, collection_id: int, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[MemoryDocument]:
+        """Get all documents in a collection"""
+        return await session.run_sync(self.sync.get_documents_by_collection, collection_id, skip, limit, after, before)
+    
+    async def get_documents(self, session: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[str] = None, before: Optional[str] = None) -> List[MemoryDocument]:
+        """Get all memory documents"""
+        return await session.run_sync(self.sync.get_documents, skip, limit, after, before)
+    
+    async def update_document(self, session: AsyncSession, document_id: int, document_data: MemoryDocumentUpdate) -> Optional[MemoryDocument]:
+        """Update a memory document"""
+        return await session.run_sync(self.sync.update_document, document_id, document_data)
+    
+    async def archive_document(self, session: AsyncSession, document_id: int) -> Optional[MemoryDocument]:
+        """Archive a memory document"""
+        return await session.run_sync(self.sync.archive_document, document_id)
+    
+    async def search_documents(
+        self,
+        session: AsyncSession,
+        content_query: str,
+        limit: int = 10,
+        collection_id: Optional[int] = None,
+        include_archived: bool = False,
+        after: Optional[str] = None,
+    ) -> List[MemoryDocumentSearchResult]:
+        """Full-text search over document content, best BM25 match first"""
+        return await session.run_sync(self.sync.search_documents, content_query, limit, collection_id, include_archived, after)
@@ -0,0 +1,71 @@
+from sqlmodel import SQLModel
+from sqlalchemy import inspect
+from typing import Dict, Hashable, Optional, TypeVar
+import os
+
+from lib.cache import LRUCache
+
+Row = TypeVar("Row", bound=SQLModel)
+
+
+class MetadataCache:
+    """
+    Read-through cache for rows the services look up by key on every request:
+    sessions, collections and documents (by id and by chroma_id).
+
+    Cached values are detached copies, safe to share between requests and
+    sessions; treat them as read-only. The services invalidate a key on every
+    update, archive and delete, and entries expire after METADATA_CACHE_TTL
+    seconds to bound staleness from writes made by other processes.
+
+    As in SessionHistoryCache, a per-key version guards against a stale fill:
+    a row read from the database is only stored if the key was not
+    invalidated while it was being read.
+    """
+
+    KINDS = ("sessions", "collections", "documents", "documents_by_chroma_id")
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        max_entries = max_entries or int(os.getenv("METADATA_CACHE_ENTRIES", "1024"))
+        ttl = ttl if ttl is not None else float(os.getenv("METADATA_CACHE_TTL", "60"))
+        self._caches = {kind: LRUCache(max_entries=max_entries, ttl=ttl) for kind in self.KINDS}
+        self._versions = LRUCache(max_entries=max_entries * 8)
+
+    def get(self, kind: str, key: Hashable) -> Optional[SQLModel]:
+        return self._caches[kind].get(key)
+
+    def version(self, kind: str, key: Hashable) -> int:
+        """Current version of a key; pass it to put() after reading from the database."""
+        return self._versions.get((kind, key), 0)
+
+    def put(self, kind: str, key: Hashable, row: Optional[Row], version: int) -> Optional[Row]:
+        """Cache a detached copy of row unless the key changed since version; returns the copy."""
+        if row is None:
+            return None
+        # Column attributes only: relationships would lazy-load (and cannot under AsyncSession)
+        copy = type(row)(**{attr.key: getattr(row, attr.key) for attr in inspect(type(row)).column_attrs})
+        if self.version(kind, key) == version:
+            self._caches[kind].set(key, copy)
+        return copy
+
+    def invalidate(self, kind: str, key: Hashable) -> None:
+        self._versions.set((kind, key), self.version(kind, key) + 1)
+        self._caches[kind].pop(key)
+
+    def invalidate_document(self, document_id: int, *chroma_ids: Optional[str]) -> None:
+        """Drop a document under its id and each chroma_id it was or is known by."""
+        self.invalidate("documents", document_id)
+        for chroma_id in chroma_ids:
+            if chroma_id is not None:
+                self.invalidate("documents_by_chroma_id", chroma_id)
+
+    def clear(self) -> None:
+        for cache in self._caches.values():
+            cache.clear()
+        self._versions.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        return {kind: cache.stats() for kind, cache in self._caches.items()}
+
+
+metadata_cache = MetadataCache()
@@ -0,0 +1,95 @@
+from sqlmodel import Session
+from sqlalchemy import tuple_
+from sqlalchemy.sql import Select
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import base64
+import json
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Opaque, URL-safe cursor for a sort key."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Sort key of a cursor; raises ValueError unless it holds exactly size values."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class Keyset:
+    """
+    Keyset (cursor) pagination over a fixed ordering, e.g. (created_at, id).
+
+    Cursors are opaque URL-safe strings holding the sort key of one row.
+    `after` returns the rows that follow the cursor in list order and
+    `before` the rows that precede it, so each page is a range seek on the
+    ordering's index instead of an OFFSET scan, and rows inserted while a
+    client pages do not shift later pages. The last column must be unique
+    (normally the primary key) so that ties on the others are broken.
+    """
+
+    def __init__(self, *columns, descending: bool = False):
+        self.columns = columns
+        self.descending = descending
+
+    def fetch(
+        self,
+        session: Session,
+        statement: Select,
+        skip: int = 0,
+        limit: int = 100,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+    ) -> List[Any]:
+        """Run statement ordered by the keyset, starting at the cursor if one is given."""
+        if after and before:
+            raise ValueError("Use either 'after' or 'before', not both")
+
+        key = tuple_(*self.columns)
+        # Paging backwards reads the range in reverse order, then flips it
+        reverse = bool(before)
+        if after:
+            values = self.decode(after)
+            statement = statement.where(key < values if self.descending else key > values)
+        elif before:
+            values = self.decode(before)
+            statement = statement.where(key > values if self.descending else key < values)
+
+        ascending = self.descending == reverse
+        statement = statement.order_by(*[c.asc() if ascending else c.desc() for c in self.columns])
+        rows = session.exec(statement.offset(skip).limit(limit)).all()
+        return list(reversed(rows)) if reverse else list(rows)
+
+    def cursor(self, row: Any) -> str:
+        """Opaque cursor pointing at row."""
+        return encode_cursor([getattr(row, c.key) for c in self.columns])
+
+    def decode(self, cursor: str) -> tuple:
+        values = decode_cursor(cursor, len(self.columns))
+        try:
+            return tuple(
+                datetime.fromisoformat(v) if c.type.python_type is datetime else v
+                for c, v in zip(self.columns, values)
+            )
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor")
+
+    def headers(self, rows: List[Any], limit: int, after: Optional[str] = None, before: Optional[str] = None) -> Dict[str, str]:
+        """
+        Response headers for a page: X-Next-Cursor when the page is full (more
+        rows may follow), X-Prev-Cursor when the page was reached via a cursor.
+        """
+        headers = {}
+        if rows and (len(rows) == limit or before):
+            headers["X-Next-Cursor"] = self.cursor(rows[-1])
+        if rows and (after or before):
+            headers["X-Prev-Cursor"] = self.cursor(rows[0])
+        return headers
@@ -0,0 +1,145 @@
+from sqlmodel import Session
+from sqlalchemy.engine import Connection, Engine
+from typing import List, Optional
+import asyncio
+import os
+
+from lib._utils import logger
+from data.models import InteractionPayload, InteractionPayloadCreate
+from .history_cache import history_cache
+
+
+class PayloadWriter:
+    """
+    Group-commit writer for InteractionPayload inserts.
+
+    Callers await write() as usual, but inserts arriving within
+    PAYLOAD_WRITER_WINDOW_MS of each other (across all sessions) are committed
+    together in one transaction, up to PAYLOAD_WRITER_MAX_BATCH rows. Each
+    caller gets back its own detached row with id and created_at populated once
+    the shared commit has succeeded; if it fails, every caller in the batch sees
+    the error.
+
+    PAYLOAD_WRITER_SYNCHRONOUS sets SQLite's synchronous level for the writer's
+    commits (FULL, NORMAL or OFF), trading durability on power loss for fewer
+    fsyncs. Leave it unset to keep the connection default. The level is put
+    back before the connection returns to the shared pool, so other users of
+    the engine keep the storage profile's setting.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[Engine] = None,
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        synchronous: Optional[str] = None,
+    ):
+        self._engine = engine
+        self.window = (window_ms if window_ms is not None else float(os.getenv("PAYLOAD_WRITER_WINDOW_MS", "5"))) / 1000
+        self.max_batch = max_batch or int(os.getenv("PAYLOAD_WRITER_MAX_BATCH", "64"))
+        self.synchronous = (synchronous or os.getenv("PAYLOAD_WRITER_SYNCHRONOUS") or "").upper() or None
+        if self.synchronous not in (None, "FULL", "NORMAL", "OFF"):
+            raise ValueError(f"Invalid PAYLOAD_WRITER_SYNCHRONOUS: {self.synchronous}")
+        self.batches = 0
+        self.rows = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            from db import engine
+            self._engine = engine
+        return self._engine
+
+    async def write(self, payload_data: InteractionPayloadCreate) -> InteractionPayload:
+        """Queue a payload insert and wait for the group commit that persists it."""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((payload_data, future))
+        return await future
+
+    async def close(self) -> None:
+        """Flush queued writes and stop the worker."""
+        if self._worker is None or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+    def _ensure_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                records = await asyncio.to_thread(self._commit, [payload_data for payload_data, _ in batch])
+            except Exception as e:
+                logger.error(f"Payload group commit of {len(batch)} rows failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), record in zip(batch, records):
+                    history_cache.append(record)
+                    if not future.done():
+                        future.set_result(record)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _commit(self, payloads: List[InteractionPayloadCreate]) -> List[InteractionPayload]:
+        """Insert all payloads in one transaction; runs on a worker thread."""
+        with self.engine.connect() as connection:
+            previous = self._set_synchronous(connection, self.synchronous)
+            try:
+                with Session(connection, expire_on_commit=False) as session:
+                    records = [InteractionPayload.model_validate(payload_data) for payload_data in payloads]
+                    session.add_all(records)
+                    session.commit()
+                    session.expunge_all()
+            finally:
+                # The connection goes back to the shared pool: restore the storage profile's level
+                self._set_synchronous(connection, previous)
+        self.batches += 1
+        self.rows += len(records)
+        return records
+
+    def _set_synchronous(self, connection: Connection, level) -> Optional[int]:
+        """Set PRAGMA synchronous on connection and return the previous level; no-op unless configured."""
+        if not self.synchronous or level is None or self.engine.dialect.name != "sqlite":
+            return None
+        previous = connection.exec_driver_sql("PRAGMA synchronous").scalar()
+        connection.exec_driver_sql(f"PRAGMA synchronous={level}")
+        # End the autobegun transaction so the Session commits its own
+        connection.commit()
+        return previous
+
+payload_writer = PayloadWriter()
@@ -0,0 +1,124 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
+import os
+
+from lib._utils import logger
+from lib.embedding_model import EmbeddingModel, embedding_model
+from lib.timings import StageTimings
+
+MEMORY_PREAMBLE = "Relevant notes from your memory (use them if they help answer):"
+
+
+@dataclass
+class Retrieval:
+    """Passages retrieved for one message, best match first; skipped says why there are none."""
+    passages: List[str] = field(default_factory=list)
+    skipped: Optional[str] = None
+
+
+class MemoryRetriever:
+    """
+    Retrieval stage of the chat pipeline.
+
+    The user message is embedded once and the memory collections listed in
+    CHAT_RETRIEVAL_COLLECTIONS (collection ids) are queried in parallel; the
+    CHAT_RETRIEVAL_TOP_K closest passages across all of them are added to the
+    prompt. The whole stage runs under CHAT_RETRIEVAL_BUDGET_MS: when the
+    budget is exceeded, the embedding model is not loaded yet, or Chroma
+    fails, the turn goes ahead without passages instead of waiting. A
+    collection that fails on its own is left out and the others still count.
+    """
+
+    def __init__(
+        self,
+        collection_ids: Optional[Sequence[int]] = None,
+        top_k: Optional[int] = None,
+        budget_ms: Optional[float] = None,
+        model: Optional[EmbeddingModel] = None,
+        chroma=None,
+        timings: Optional[StageTimings] = None,
+    ):
+        if collection_ids is None:
+            collection_ids = [int(i) for i in (os.getenv("CHAT_RETRIEVAL_COLLECTIONS") or "").split(",") if i.strip()]
+        self.collection_ids = list(collection_ids)
+        self.top_k = top_k or int(os.getenv("CHAT_RETRIEVAL_TOP_K", "4"))
+        self.budget = (budget_ms or float(os.getenv("CHAT_RETRIEVAL_BUDGET_MS", "200"))) / 1000
+        self.model = model or embedding_model
+        self._chroma = chroma
+        self.timings = timings or StageTimings()
+        self.retrieved = 0
+        self.skipped = Counter()
+
+    @property
+    def chroma(self):
+        if self._chroma is None:
+            from lib.chroma import ChromaOps
+            self._chroma = ChromaOps()
+        return self._chroma
+
+    async def retrieve(self, query: str) -> Retrieval:
+        """Passages for query within the latency budget; never raises."""
+        if not self.collection_ids or not query.strip():
+            return Retrieval(skipped="disabled")
+        if not self.model.ready:
+            # Loading the model here would stall the turn for seconds
+            return self._skip("model_not_ready")
+        try:
+            async with asyncio.timeout(self.budget):
+                passages = await self._retrieve(query)
+        except TimeoutError:
+            logger.warning(f"Memory retrieval exceeded its {self.budget * 1000:.0f} ms budget; skipped")
+            return self._skip("timeout")
+        except Exception as e:
+            logger.warning(f"Memory retrieval failed; skipped: {e}")
+            return self._skip("error")
+        self.retrieved += 1
+        return Retrieval(passages=passages)
+
+    async def _retrieve(self, query: str) -> List[str]:
+        with self.timings.measure("retrieval_embed"):
+            [embedding] = await asyncio.to_thread(self.model.embed, [query])
+        with self.timings.measure("retrieval_query"):
+            results = await asyncio.gather(
+                *(asyncio.to_thread(self._query, collection_id, embedding) for collection_id in self.collection_ids),
+                return_exceptions=True,
+            )
+
+        hits: List[Tuple[float, str]] = []
+        for collection_id, result in zip(self.collection_ids, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Memory retrieval from collection {collection_id} failed: {result}")
+                continue
+            hits.extend(result)
+        passages = []
+        for _, document in sorted(hits, key=lambda hit: hit[0]):
+            if document not in passages:
+                passages.append(document)
+        return passages[:self.top_k]
+
+    def _query(self, collection_id: int, embedding: List[float]) -> List[Tuple[float, str]]:
+        result = self.chroma.query_embeddings(self.chroma.collection_name(collection_id), embedding, n_results=self.top_k)
+        return list(zip(result["distances"][0], result["documents"][0]))
+
+    def _skip(self, reason: str) -> Retrieval:
+        self.skipped[reason] += 1
+        return Retrieval(skipped=reason)
+
+    @staticmethod
+    def augment(history: List[Dict], passages: List[str]) -> List[Dict]:
+        """history with the passages placed before the latest user message; the input is not modified"""
+        if not passages or not history or history[-1]["role"] != "user":
+            return history
+        notes = "\n".join(f"- {passage}" for passage in passages)
+        last = {**history[-1], "content": f"{MEMORY_PREAMBLE}\n{notes}\n\n{history[-1]['content']}"}
+        return history[:-1] + [last]
+
+    def stats(self) -> dict:
+        return {
+            "collections": self.collection_ids,
+            "retrieved": self.retrieved,
+            "skipped": dict(self.skipped),
+            "budget_ms": self.budget * 1000,
+        }
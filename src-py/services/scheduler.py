@@ -0,0 +1,173 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Deque, Dict, Optional
+import asyncio
+import os
+import time
+
+
+class Priority(IntEnum):
+    """Scheduling class of a generation; lower values are served first."""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class SchedulerBusy(Exception):
+    """Raised when a generation is rejected because the scheduler queue is full."""
+    pass
+
+
+class GenerationScheduler:
+    """
+    Admission control in front of Gemini calls.
+
+    At most max_concurrency generations run at once (CHAT_MAX_CONCURRENCY).
+    Further requests wait in a queue bounded by max_queue (CHAT_MAX_QUEUE);
+    once it is full, new requests are rejected immediately with SchedulerBusy
+    instead of piling up behind the model.
+
+    Waiting requests are served strictly by priority (interactive chat before
+    background work that no reply is waiting on) and, within a priority, round-robin
+    across sessions, so one chatty session cannot hold back everyone else.
+    The time each request spent queued is kept for stats().
+
+    A caller with work to do before its generation (storing the message,
+    building the context) takes a Reservation first: it holds a queue
+    position, so the later acquire cannot be rejected and SchedulerBusy is
+    only ever raised before anything was done.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, max_queue: Optional[int] = None, samples: int = 1000):
+        self.max_concurrency = max_concurrency or int(os.getenv("CHAT_MAX_CONCURRENCY", "32"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("CHAT_MAX_QUEUE", "128"))
+        self.running = 0
+        self.queued = 0
+        self.reserved = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._waits: Deque[float] = deque(maxlen=samples)
+
+    def ensure_capacity(self) -> None:
+        """Reject up front when a new request could not even be queued."""
+        if self.running >= self.max_concurrency and self.queued + self.reserved >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerBusy("Server is busy, please try again shortly")
+
+    def reserve(self) -> "Reservation":
+        """Hold a queue position for a later slot(); raises SchedulerBusy when there is none."""
+        self.ensure_capacity()
+        self.reserved += 1
+        return Reservation(self)
+
+    @asynccontextmanager
+    async def slot(
+        self, session_id: str, priority: Priority = Priority.INTERACTIVE, reservation: Optional["Reservation"] = None
+    ) -> AsyncIterator[None]:
+        """Hold one generation slot for the duration of the block, using reservation if given."""
+        await self.acquire(session_id, priority, reservation)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(
+        self, session_id: str, priority: Priority = Priority.INTERACTIVE, reservation: Optional["Reservation"] = None
+    ) -> None:
+        # A reserved position turns into the queue entry (or is freed by the fast path)
+        reserved = reservation is not None and reservation.release()
+        if self.running < self.max_concurrency and not self.queued:
+            self.running += 1
+            self._admit(0.0)
+            return
+        if not reserved:
+            self.ensure_capacity()
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(session_id, deque()).append(future)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on
+                self.release()
+            else:
+                self._discard(priority, session_id, future)
+            raise
+        self._admit(time.monotonic() - started)
+
+    def release(self) -> None:
+        """Hand the slot to the next waiter, or free it when nobody is waiting."""
+        future = self._next_waiter()
+        if future is None:
+            self.running -= 1
+        else:
+            future.set_result(None)
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for priority in Priority:
+            sessions = self._queues[priority]
+            while sessions:
+                session_id, waiters = next(iter(sessions.items()))
+                future = waiters.popleft()
+                self.queued -= 1
+                if waiters:
+                    # Round-robin: the session goes to the back of its priority class
+                    sessions.move_to_end(session_id)
+                else:
+                    del sessions[session_id]
+                if not future.done():
+                    return future
+        return None
+
+    def _discard(self, priority: Priority, session_id: str, future: asyncio.Future) -> None:
+        waiters = self._queues[priority].get(session_id)
+        if waiters is None or future not in waiters:
+            return
+        waiters.remove(future)
+        self.queued -= 1
+        if not waiters:
+            del self._queues[priority][session_id]
+
+    def _admit(self, waited: float) -> None:
+        self.admitted += 1
+        self._waits.append(waited)
+
+    def stats(self) -> Dict:
+        waits = sorted(self._waits)
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "reserved": self.reserved,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "queue_ms_avg": sum(waits) / len(waits) * 1000 if waits else 0.0,
+            "queue_ms_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000 if waits else 0.0,
+            "queue_ms_max": waits[-1] * 1000 if waits else 0.0,
+        }
+
+
+class Reservation:
+    """A queue position taken by GenerationScheduler.reserve(); released once, by slot() or release()."""
+
+    def __init__(self, scheduler: GenerationScheduler):
+        self.scheduler = scheduler
+        self.held = True
+
+    def release(self) -> bool:
+        """Give the position back; False if it was already released."""
+        if not self.held:
+            return False
+        self.held = False
+        self.scheduler.reserved -= 1
+        return True
+
+
+scheduler = GenerationScheduler()
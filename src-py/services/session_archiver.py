@@ -0,0 +1,206 @@
+from sqlmodel import Session, select, delete, func, update
+from sqlalchemy.engine import Engine
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+from typing import List, Optional, Set
+import asyncio
+import gzip
+import os
+
+from lib._utils import logger
+from data.models import InteractionSession, InteractionPayload, InteractionPayloadRead
+from .history_cache import history_cache
+from .metadata_cache import metadata_cache
+
+
+class SessionArchiver:
+    """
+    Cold storage for idle interaction sessions.
+
+    Sessions whose last payload is older than SESSION_ARCHIVE_AFTER_DAYS have
+    their payloads written to a gzipped JSON-lines file in SESSION_ARCHIVE_DIR
+    and deleted from interaction_payloads, so the hot table, its indexes and
+    the page cache only carry the active working set. The session row stays
+    as a stub with archived_at and archive_path set.
+
+    rehydrate() puts an archived session's payloads back, under their
+    original ids (interaction_payloads is AUTOINCREMENT, so ids are never
+    reused); AsyncInteractionService calls it, in a thread, whenever an
+    archived session's payloads are read. Concurrent callers are safe: each
+    one claims the session by clearing archived_at, and only the one that
+    claimed it inserts.
+
+    Archival is opt-in: nothing is archived while SESSION_ARCHIVE_AFTER_DAYS
+    is 0, the default.
+
+    Like PayloadWriter, the archiver commits through its own engine, so a
+    read-only caller can still trigger rehydration.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[Engine] = None,
+        archive_dir: Optional[str] = None,
+        idle_days: Optional[float] = None,
+        interval: Optional[float] = None,
+        batch: Optional[int] = None,
+    ):
+        self._engine = engine
+        self.archive_dir = Path(archive_dir or os.getenv("SESSION_ARCHIVE_DIR", "../data/memory/archive"))
+        self.idle_days = idle_days if idle_days is not None else float(os.getenv("SESSION_ARCHIVE_AFTER_DAYS", "0"))
+        self.interval = interval or float(os.getenv("SESSION_ARCHIVE_INTERVAL", "3600"))
+        self.batch = batch or int(os.getenv("SESSION_ARCHIVE_BATCH", "100"))
+        self.archived = 0
+        self.rehydrated = 0
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            from db import engine
+            self._engine = engine
+        return self._engine
+
+    def idle_sessions(self, session: Session, now: Optional[datetime] = None) -> List[str]:
+        """Ids of unarchived sessions with payloads, none newer than the idle cutoff"""
+        cutoff = (now or datetime.now(UTC)) - timedelta(days=self.idle_days)
+        last_payload = select(func.max(InteractionPayload.created_at)).where(
+            InteractionPayload.session_id == InteractionSession.id
+        ).scalar_subquery()
+        statement = select(InteractionSession.id).where(
+            InteractionSession.archived_at.is_(None),
+            last_payload < cutoff,
+        ).limit(self.batch)
+        return list(session.exec(statement).all())
+
+    def archive_idle(self, now: Optional[datetime] = None) -> List[str]:
+        """Archive up to SESSION_ARCHIVE_BATCH idle sessions; returns their ids"""
+        with Session(self.engine) as session:
+            session_ids = self.idle_sessions(session, now)
+        return [session_id for session_id in session_ids if self.archive_session(session_id)]
+
+    def archive_session(self, session_id: str) -> bool:
+        """Move a session's payloads to its archive file; False if missing or already archived"""
+        with Session(self.engine) as session:
+            interaction_session = session.get(InteractionSession, session_id)
+            if not interaction_session or interaction_session.archived_at:
+                return False
+            payloads = session.exec(
+                select(InteractionPayload).where(InteractionPayload.session_id == session_id).order_by(InteractionPayload.id)
+            ).all()
+            path = self.archive_dir / f"{session_id}.jsonl.gz"
+            self._write(path, payloads)
+
+            if payloads:
+                # Only what reached the file is deleted; a payload written meanwhile stays hot
+                session.exec(delete(InteractionPayload).where(
+                    InteractionPayload.session_id == session_id,
+                    InteractionPayload.id <= payloads[-1].id,
+                ))
+            interaction_session.archived_at = datetime.now(UTC)
+            interaction_session.archive_path = str(path)
+            session.add(interaction_session)
+            session.commit()
+        history_cache.invalidate(session_id)
+        metadata_cache.invalidate("sessions", session_id)
+        self.archived += 1
+        return True
+
+    def rehydrate(self, session_id: str) -> bool:
+        """Restore an archived session's payloads to the hot table; False if it is not archived (any more)"""
+        with Session(self.engine) as session:
+            stub = session.exec(
+                select(InteractionSession.archived_at, InteractionSession.archive_path).where(
+                    InteractionSession.id == session_id,
+                    InteractionSession.archived_at.is_not(None),
+                )
+            ).first()
+        if not stub:
+            return False
+        archived_at, archive_path = stub
+        path = Path(archive_path)
+        try:
+            # Decompressed before taking the write lock
+            records = self._read(path)
+        except FileNotFoundError:
+            # Another caller rehydrated it and removed the file
+            return False
+
+        with Session(self.engine) as session:
+            # The claim is the transaction's first statement and takes SQLite's write
+            # lock, so of concurrent callers exactly one sees rowcount 1
+            claimed = session.exec(
+                update(InteractionSession)
+                .where(InteractionSession.id == session_id, InteractionSession.archived_at == archived_at)
+                .values(archived_at=None, archive_path=None)
+            ).rowcount
+            if claimed != 1:
+                return False
+            taken = self._taken_ids(session, [record.id for record in records])
+            if taken:
+                # Only archives written before ids became AUTOINCREMENT can collide
+                logger.warning(f"Rehydrating session {session_id}: {len(taken)} payload ids were reused and get new ones")
+            session.add_all([
+                InteractionPayload(
+                    id=None if record.id in taken else record.id,
+                    session_id=session_id,
+                    content=record.content,
+                    ok=record.ok,
+                    err=record.err,
+                    from_=record.from_,
+                    created_at=record.created_at,
+                )
+                for record in records
+            ])
+            session.commit()
+        path.unlink(missing_ok=True)
+        history_cache.invalidate(session_id)
+        metadata_cache.invalidate("sessions", session_id)
+        self.rehydrated += 1
+        return True
+
+    def discard(self, archive_path: Optional[str]) -> None:
+        """Delete the archive file of a session that is being deleted"""
+        if archive_path:
+            Path(archive_path).unlink(missing_ok=True)
+
+    async def run(self) -> None:
+        """Archive idle sessions every SESSION_ARCHIVE_INTERVAL seconds until cancelled"""
+        while True:
+            try:
+                archived = await asyncio.to_thread(self.archive_idle)
+                if archived:
+                    logger.info(f"Archived {len(archived)} idle sessions")
+            except Exception as e:
+                logger.error(f"Session archival failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {"archived": self.archived, "rehydrated": self.rehydrated, "idle_days": self.idle_days}
+
+    def _write(self, path: Path, payloads: List[InteractionPayload]) -> None:
+        """Write the archive to a temporary file, fsync it, then move it into place"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb") as archive:
+                for payload in payloads:
+                    line = InteractionPayloadRead.model_validate(payload).model_dump_json(by_alias=True)
+                    archive.write(line.encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _taken_ids(self, session: Session, ids: List[int]) -> Set[int]:
+        taken: Set[int] = set()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            taken.update(session.exec(select(InteractionPayload.id).where(InteractionPayload.id.in_(chunk))).all())
+        return taken
+
+    def _read(self, path: Path) -> List[InteractionPayloadRead]:
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            return [InteractionPayloadRead.model_validate_json(line) for line in archive if line.strip()]
+
+
+session_archiver = SessionArchiver()
@@ -0,0 +1,346 @@
+from sqlmodel import Session, select, update
+from sqlalchemy.engine import Engine
+from collections import defaultdict
+from datetime import datetime, UTC
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+
+from lib._utils import logger
+from data.models import IndexStatus, MemoryCollection, MemoryDocument
+from .metadata_cache import metadata_cache
+
+
+def vector_metadata(document: MemoryDocument) -> Dict:
+    """
+    Chroma metadata for a document: its scalar user metadata plus the row it
+    came from. updated_at is what reconciliation compares to spot stale vectors.
+    """
+    metadata = {
+        key: value
+        for key, value in json.loads(document.metadatas or "{}").items()
+        if isinstance(value, (str, int, float, bool))
+    }
+    metadata.update(
+        document_id=document.id,
+        collection_id=document.collection_id,
+        updated_at=document.updated_at.isoformat(),
+    )
+    return metadata
+
+
+def set_index_status(engine: Engine, documents: List[MemoryDocument], status: IndexStatus) -> None:
+    """
+    Record the index status of documents, unless a row changed since it was
+    read (its newer version is still pending and will be indexed on its own).
+    """
+    with Session(engine) as session:
+        for document in documents:
+            session.exec(
+                update(MemoryDocument)
+                .where(MemoryDocument.id == document.id, MemoryDocument.updated_at == document.updated_at)
+                .values(index_status=status)
+            )
+        session.commit()
+    for document in documents:
+        metadata_cache.invalidate_document(document.id, document.chroma_id)
+
+
+class VectorReconciler:
+    """
+    Brings the Chroma store back in line with memory_documents.
+
+    For every active collection, the documents are compared with what Chroma
+    holds, batch by batch: rows whose vector is missing, or was embedded from
+    an older version of the row (updated_at differs), are re-embedded, and
+    vectors with no active row behind them are deleted. Nothing that is
+    already current is re-encoded, so with a persistent store a restart only
+    pays for what changed while the process was down.
+
+    run() does one pass in a thread at startup; the API serves requests
+    meanwhile, so time to ready does not depend on the corpus size. Like
+    SessionArchiver, it reads through its own engine.
+    """
+
+    def __init__(self, engine: Optional[Engine] = None, chroma=None, batch: Optional[int] = None):
+        self._engine = engine
+        self._chroma = chroma
+        self.batch = batch or int(os.getenv("CHROMA_RECONCILE_BATCH", "64"))
+        self.enabled = os.getenv("CHROMA_RECONCILE", "1") != "0"
+        self.state = "idle"
+        self.checked = 0
+        self.embedded = 0
+        self.deleted = 0
+        self.last_run: Optional[datetime] = None
+        self._stop = threading.Event()
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            from db import engine
+            self._engine = engine
+        return self._engine
+
+    @property
+    def chroma(self):
+        if self._chroma is None:
+            from lib.chroma import ChromaOps
+            self._chroma = ChromaOps()
+        return self._chroma
+
+    def reconcile(self) -> None:
+        """One full pass over every active collection"""
+        self._stop.clear()
+        self.state = "running"
+        try:
+            with Session(self.engine) as session:
+                collections = session.exec(
+                    select(MemoryCollection).where(MemoryCollection.archived_at.is_(None)).order_by(MemoryCollection.id)
+                ).all()
+            for collection in collections:
+                if self._stop.is_set():
+                    break
+                self.reconcile_collection(collection)
+            self.state = "stopped" if self._stop.is_set() else "ready"
+        except Exception:
+            self.state = "failed"
+            raise
+        finally:
+            self.last_run = datetime.now(UTC)
+
+    def reconcile_collection(self, collection: MemoryCollection) -> None:
+        name = self.chroma.collection_name(collection.id)
+        self.chroma.get_or_create_collection(name, collection.title)
+
+        last_id = 0
+        while not self._stop.is_set():
+            with Session(self.engine) as session:
+                documents = session.exec(
+                    select(MemoryDocument).where(
+                        MemoryDocument.collection_id == collection.id,
+                        MemoryDocument.archived_at.is_(None),
+                        MemoryDocument.id > last_id,
+                    ).order_by(MemoryDocument.id).limit(self.batch)
+                ).all()
+            if not documents:
+                break
+            last_id = documents[-1].id
+            self._embed_outdated(name, documents)
+            unmarked = [d for d in documents if d.index_status != IndexStatus.INDEXED]
+            if unmarked:
+                set_index_status(self.engine, unmarked, IndexStatus.INDEXED)
+
+        self._delete_orphans(name, collection.id)
+
+    def _embed_outdated(self, name: str, documents: List[MemoryDocument]) -> None:
+        stored = self.chroma.get_metadatas(name, [d.chroma_id for d in documents])
+        outdated = [
+            d for d in documents
+            if stored.get(d.chroma_id, {}).get("updated_at") != d.updated_at.isoformat()
+        ]
+        self.checked += len(documents)
+        if outdated:
+            self.chroma.upsert_data(
+                name,
+                ids=[d.chroma_id for d in outdated],
+                documents=[d.content for d in outdated],
+                metadatas=[vector_metadata(d) for d in outdated],
+            )
+            self.embedded += len(outdated)
+
+    def _delete_orphans(self, name: str, collection_id: int) -> None:
+        """Delete vectors whose document is gone, archived or moved to another collection"""
+        orphans: List[str] = []
+        offset = 0
+        while not self._stop.is_set():
+            ids = self.chroma.list_ids(name, limit=self.batch, offset=offset)
+            if not ids:
+                break
+            offset += len(ids)
+            orphans.extend(set(ids) - self._active_chroma_ids(collection_id, ids))
+        if orphans:
+            # Deleted after the scan so the offsets above stay valid
+            for start in range(0, len(orphans), self.batch):
+                self.chroma.delete_data(name, ids=orphans[start:start + self.batch])
+            self.deleted += len(orphans)
+
+    def _active_chroma_ids(self, collection_id: int, chroma_ids: List[str]) -> Set[str]:
+        with Session(self.engine) as session:
+            return set(session.exec(
+                select(MemoryDocument.chroma_id).where(
+                    MemoryDocument.collection_id == collection_id,
+                    MemoryDocument.archived_at.is_(None),
+                    MemoryDocument.chroma_id.in_(chroma_ids),
+                )
+            ).all())
+
+    async def run(self) -> None:
+        """Reconcile once in the background; cancelling stops the pass after the current batch"""
+        try:
+            await asyncio.to_thread(self.reconcile)
+            logger.info(f"Vector store reconciled: {self.checked} checked, {self.embedded} embedded, {self.deleted} deleted")
+        except asyncio.CancelledError:
+            self._stop.set()
+            raise
+        except Exception as e:
+            logger.error(f"Vector store reconciliation failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "checked": self.checked,
+            "embedded": self.embedded,
+            "deleted": self.deleted,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
+
+
+class EmbeddingPipeline:
+    """
+    Write-behind indexing of memory documents into Chroma.
+
+    MemoryDocumentService enqueues a document id after each create, update and
+    archive commit and returns at once; the document stays `pending` until
+    indexed. A worker thread drains the queue in batches of up to
+    EMBEDDING_BATCH_SIZE documents, or whatever arrived within
+    EMBEDDING_BATCH_WINDOW_MS of the first, and embeds each collection's share
+    in one upsert (the encoder is several times faster per document on a
+    batch). Rows then move to `indexed`, or `failed` if Chroma raised;
+    archived documents have their vectors removed. Anything lost in a crash is
+    picked up by VectorReconciler at the next startup.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[Engine] = None,
+        chroma=None,
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+    ):
+        self._engine = engine
+        self._chroma = chroma
+        self.window = (window_ms if window_ms is not None else float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "200"))) / 1000
+        self.max_batch = max_batch or int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+        self.enabled = os.getenv("EMBEDDING_PIPELINE", "1") != "0"
+        self.batches = 0
+        self.indexed = 0
+        self.failed = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            from db import engine
+            self._engine = engine
+        return self._engine
+
+    @property
+    def chroma(self):
+        if self._chroma is None:
+            from lib.chroma import ChromaOps
+            self._chroma = ChromaOps()
+        return self._chroma
+
+    def enqueue(self, document_id: int, previous: Optional[Tuple[int, str]] = None) -> None:
+        """
+        Queue a document for indexing. previous is the (collection_id,
+        chroma_id) its vector was stored under, if that changed.
+        """
+        if not self.enabled:
+            return
+        self._ensure_worker()
+        self._queue.put((document_id, previous))
+
+    def flush(self) -> None:
+        """Block until everything queued so far has been processed."""
+        self._queue.join()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "indexed": self.indexed,
+            "failed": self.failed,
+            "avg_batch_size": (self.indexed + self.failed) / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-pipeline", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                self._index(batch)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(batch)} documents failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _index(self, batch: List[tuple]) -> None:
+        document_ids = list(dict.fromkeys(document_id for document_id, _ in batch))
+        with Session(self.engine, expire_on_commit=False) as session:
+            documents = session.exec(select(MemoryDocument).where(MemoryDocument.id.in_(document_ids))).all()
+            session.expunge_all()
+
+        for _, previous in batch:
+            if previous:
+                collection_id, chroma_id = previous
+                self._delete(collection_id, [chroma_id])
+
+        active, archived = defaultdict(list), defaultdict(list)
+        for document in documents:
+            (archived if document.archived_at else active)[document.collection_id].append(document)
+        for collection_id, group in archived.items():
+            self._delete(collection_id, [d.chroma_id for d in group])
+
+        for collection_id, group in active.items():
+            name = self.chroma.collection_name(collection_id)
+            try:
+                self.chroma.get_or_create_collection(name)
+                self.chroma.upsert_data(
+                    name,
+                    ids=[d.chroma_id for d in group],
+                    documents=[d.content for d in group],
+                    metadatas=[vector_metadata(d) for d in group],
+                )
+            except Exception as e:
+                logger.error(f"Embedding {len(group)} documents into {name} failed: {e}")
+                set_index_status(self.engine, group, IndexStatus.FAILED)
+                self.failed += len(group)
+            else:
+                set_index_status(self.engine, group, IndexStatus.INDEXED)
+                self.indexed += len(group)
+        self.batches += 1
+
+    def _delete(self, collection_id: int, chroma_ids: List[str]) -> None:
+        name = self.chroma.collection_name(collection_id)
+        try:
+            self.chroma.get_or_create_collection(name)
+            self.chroma.delete_data(name, ids=chroma_ids)
+        except Exception as e:
+            logger.error(f"Removing {len(chroma_ids)} vectors from {name} failed: {e}")
+
+
+vector_reconciler = VectorReconciler()
+embedding_pipeline = EmbeddingPipeline()
@@ -1,33 +1,130 @@
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import Session, SQLModel, create_engine
-from sqlmodel.pool import StaticPool
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from main import app
-from db import get_session
+from data.migrations import run_migrations
+from db import configure_sqlite, get_session, get_async_session, get_async_read_session
 from data.models import *  # Import all models to register them
 
 
+@pytest.fixture(name="db_url")
+def db_url_fixture(tmp_path):
+    """A temporary SQLite file, so the sync and async engines see the same data"""
+    return f"sqlite:///{tmp_path / 'test.db'}"
+
+
 @pytest.fixture(name="session")
-def session_fixture():
+def session_fixture(db_url):
     """Create a test database session"""
-    engine = create_engine(
-        "sqlite:///:memory:", 
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
+    engine = configure_sqlite(create_engine(db_url, connect_args={"check_same_thread": False}))
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
     with Session(engine) as session:
         yield session
+    engine.dispose()
+
+
+@pytest.fixture(name="async_engine")
+def async_engine_fixture(session: Session, db_url):
+    """Async engine on the test database; NullPool keeps connections from outliving their event loop"""
+    return configure_sqlite(create_async_engine(db_url.replace("sqlite:", "sqlite+aiosqlite:", 1), poolclass=NullPool))
+
+
+@pytest.fixture(name="async_read_engine")
+def async_read_engine_fixture(session: Session, db_url):
+    """Read-only async engine on the test database, as used by GET routes"""
+    return configure_sqlite(
+        create_async_engine(db_url.replace("sqlite:", "sqlite+aiosqlite:", 1), poolclass=NullPool),
+        read_only=True
+    )
+
+
+@pytest_asyncio.fixture(name="async_session")
+async def async_session_fixture(async_engine):
+    """Create an async test database session"""
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+@pytest.fixture(autouse=True)
+def payload_writer(session: Session, monkeypatch):
+    """Point the shared group-commit writer at the test database"""
+    from services.payload_writer import payload_writer
+
+    monkeypatch.setattr(payload_writer, "_engine", session.get_bind())
+    return payload_writer
+
+
+@pytest.fixture(autouse=True)
+def session_archiver(session: Session, tmp_path, monkeypatch):
+    """Point the session archiver at the test database and a temporary archive directory"""
+    from services.session_archiver import session_archiver
+
+    monkeypatch.setattr(session_archiver, "_engine", session.get_bind())
+    monkeypatch.setattr(session_archiver, "archive_dir", tmp_path / "archive")
+    monkeypatch.setattr(session_archiver, "idle_days", 30)
+    return session_archiver
+
+
+@pytest.fixture(autouse=True)
+def embedding_pipeline(session: Session, monkeypatch):
+    """Index documents into a fake Chroma through the test database; drained before teardown"""
+    from services.vector_index import embedding_pipeline
+    from tests.fakes import FakeChromaOps
+
+    monkeypatch.setattr(embedding_pipeline, "_engine", session.get_bind())
+    monkeypatch.setattr(embedding_pipeline, "_chroma", FakeChromaOps())
+    monkeypatch.setattr(embedding_pipeline, "window", 0.01)
+    yield embedding_pipeline
+    embedding_pipeline.flush()
+
+
+@pytest.fixture(name="chroma_client")
+def chroma_client_fixture():
+    """An in-memory Chroma client; its collections are process-wide, so they are dropped afterwards"""
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    yield client
+    for collection in client.list_collections():
+        client.delete_collection(collection.name)
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Reset process-wide caches so tests don't see each other's entries"""
+    from lib.gemini import circuit_breaker
+    from services.history_cache import history_cache
+    from services.metadata_cache import metadata_cache
+
+    history_cache.clear()
+    metadata_cache.clear()
+    circuit_breaker.reset()
+    yield
 
 
 @pytest.fixture(name="client")
-def client_fixture(session: Session):
+def client_fixture(session: Session, async_engine, async_read_engine):
     """Create a test client with database override"""
     def get_session_override():
         return session
 
+    async def get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
+    async def get_async_read_session_override():
+        async with AsyncSession(async_read_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_async_session] = get_async_session_override
+    app.dependency_overrides[get_async_read_session] = get_async_read_session_override
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
@@ -0,0 +1,128 @@
+"""
+Test doubles for external services: Gemini for the chat pipeline, Chroma for the vector store.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+
+class FakeGenaiModels:
+    """
+    Mimics `genai.Client().models`, returning canned chunks instead of calling Gemini.
+
+    With an error, every call fails (streams after fail_after chunks); with
+    fail_times as well, only the first fail_times calls fail.
+    """
+
+    def __init__(
+        self,
+        chunks: List[str],
+        error: Optional[Exception] = None,
+        fail_after: int = 0,
+        fail_times: Optional[int] = None,
+    ):
+        self.chunks = chunks
+        self.error = error
+        self.fail_after = fail_after
+        self.fail_times = fail_times
+        self.calls = []
+
+    def generate_content(self, model, config, contents):
+        self.calls.append(contents)
+        if self._failing():
+            raise self.error
+        return SimpleNamespace(text="".join(self.chunks))
+
+    def generate_content_stream(self, model, config, contents):
+        self.calls.append(contents)
+        failing = self._failing()
+        for index, chunk in enumerate(self.chunks):
+            if failing and index == self.fail_after:
+                raise self.error
+            yield SimpleNamespace(text=chunk)
+        if failing and self.fail_after >= len(self.chunks):
+            raise self.error
+
+    def _failing(self) -> bool:
+        return self.error is not None and (self.fail_times is None or len(self.calls) <= self.fail_times)
+
+
+class FakeAsyncGenaiModels:
+    """Mimics `genai.Client().aio.models` on top of the same canned chunks, with optional latency."""
+
+    def __init__(self, models: FakeGenaiModels, delay: float = 0):
+        self._models = models
+        self.delay = delay
+
+    async def generate_content(self, model, config, contents):
+        await asyncio.sleep(self.delay)
+        return self._models.generate_content(model, config, contents)
+
+    async def generate_content_stream(self, model, config, contents):
+        async def stream():
+            for chunk in self._models.generate_content_stream(model, config, contents):
+                await asyncio.sleep(self.delay)
+                yield chunk
+        return stream()
+
+
+class FakeGenaiClient:
+    """Drop-in replacement for `genai.Client` in tests."""
+
+    def __init__(
+        self,
+        chunks: List[str],
+        error: Optional[Exception] = None,
+        fail_after: int = 0,
+        fail_times: Optional[int] = None,
+        delay: float = 0,
+    ):
+        self.models = FakeGenaiModels(chunks, error=error, fail_after=fail_after, fail_times=fail_times)
+        self.aio = SimpleNamespace(models=FakeAsyncGenaiModels(self.models, delay=delay))
+
+
+class FakeChromaOps:
+    """
+    Stands in for `lib.chroma.ChromaOps`, keeping collections as dicts of
+    id -> (document, metadata). `embedded` lists every document text that
+    would have gone through the embedding model.
+    """
+
+    def __init__(self, query_delay: float = 0):
+        self.collections: Dict[str, Dict[str, tuple]] = {}
+        self.embedded: List[str] = []
+        self.query_delay = query_delay
+
+    @staticmethod
+    def collection_name(collection_id: int) -> str:
+        return f"memory_collection_{collection_id}"
+
+    def get_or_create_collection(self, name: str, description: str = ""):
+        return self.collections.setdefault(name, {})
+
+    def upsert_data(self, collection_name: str, ids: List[str], documents: List[str], metadatas: Optional[List[Dict]] = None):
+        metadatas = metadatas or [{} for _ in ids]
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            self.collections[collection_name][doc_id] = (document, metadata)
+        self.embedded.extend(documents)
+
+    def get_metadatas(self, collection_name: str, ids: List[str]) -> Dict[str, Dict]:
+        collection = self.collections[collection_name]
+        return {doc_id: collection[doc_id][1] for doc_id in ids if doc_id in collection}
+
+    def list_ids(self, collection_name: str, limit: int = 1000, offset: int = 0) -> List[str]:
+        return list(self.collections[collection_name])[offset:offset + limit]
+
+    def query_embeddings(self, collection_name: str, query_embedding: List[float], n_results: int = 10, where=None):
+        """Documents ordered by the "distance" in their metadata (0 when absent), in Chroma's result shape"""
+        time.sleep(self.query_delay)
+        ranked = sorted(self.collections[collection_name].values(), key=lambda item: (item[1] or {}).get("distance", 0))[:n_results]
+        return {
+            "documents": [[document for document, _ in ranked]],
+            "distances": [[(metadata or {}).get("distance", 0) for _, metadata in ranked]],
+        }
+
+    def delete_data(self, collection_name: str, ids: Optional[List[str]] = None, where=None, where_document=None):
+        for doc_id in ids or []:
+            self.collections[collection_name].pop(doc_id, None)
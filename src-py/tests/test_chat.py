@@ -0,0 +1,750 @@
+import asyncio
+import time
+import pytest
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from data.models import InteractionFrom, InteractionSession
+from lib.gemini import GeminiClient
+from services.chat_service import GENERATION_CANCELLED, ChatService
+from services.context_builder import ContextBuilder, ConversationContext
+from services.interaction_service import InteractionService
+from services.scheduler import GenerationScheduler, Priority, SchedulerBusy
+from tests.fakes import FakeChromaOps, FakeGenaiClient
+
+
+def make_chat_service(chunks, **kwargs) -> ChatService:
+    chat_service = ChatService()
+    chat_service.gemini_client = GeminiClient(genai_client=FakeGenaiClient(chunks, **kwargs))
+    chat_service.context_builder.summarizer = GeminiClient(genai_client=FakeGenaiClient(["summary"]))
+    return chat_service
+
+
+class TestChatService:
+    """Test the ChatService streaming pipeline"""
+
+    @pytest.mark.asyncio
+    async def test_stream_message(self, session: Session, async_session: AsyncSession, sample_interaction_session):
+        """Test that deltas are streamed and one AI payload is persisted"""
+        chat_service = make_chat_service(["Hello", ", ", "world"])
+        events = [e async for e in chat_service.stream_message(sample_interaction_session.id, "Hi", async_session)]
+
+        assert [e["type"] for e in events] == [
+            "user_message", "ai_delta", "ai_delta", "ai_delta", "ai_response"
+        ]
+        assert "".join(e["content"] for e in events if e["type"] == "ai_delta") == "Hello, world"
+        assert events[-1]["content"] == "Hello, world"
+
+        payloads = InteractionService().get_session_payloads(session, sample_interaction_session.id)
+        assert [(p.from_, p.content, p.ok) for p in payloads] == [
+            (InteractionFrom.USER, "Hi", True),
+            (InteractionFrom.MODEL, "Hello, world", True),
+        ]
+        assert events[-1]["id"] == payloads[-1].id
+
+    @pytest.mark.asyncio
+    async def test_stream_message_failure(self, session: Session, async_session: AsyncSession, sample_interaction_session):
+        """Test that a failed stream persists the partial response as failed"""
+        chat_service = make_chat_service(["Partial", " answer"], error=RuntimeError("boom"), fail_after=1)
+        events = []
+        with pytest.raises(Exception, match="boom"):
+            async for event in chat_service.stream_message(sample_interaction_session.id, "Hi", async_session):
+                events.append(event)
+
+        assert [e["type"] for e in events] == ["user_message", "ai_delta"]
+        payloads = InteractionService().get_session_payloads(session, sample_interaction_session.id)
+        assert len(payloads) == 2
+        assert payloads[-1].ok is False
+        assert payloads[-1].content == "Partial"
+        assert "boom" in payloads[-1].err
+
+    @pytest.mark.asyncio
+    async def test_stream_message_session_not_found(self, async_session: AsyncSession):
+        """Test streaming into a non-existent session"""
+        chat_service = make_chat_service(["unused"])
+        with pytest.raises(ValueError):
+            [e async for e in chat_service.stream_message("missing", "Hi", async_session)]
+
+    @pytest.mark.asyncio
+    async def test_stream_message_cancelled(self, session: Session, async_session: AsyncSession, sample_interaction_session):
+        """Test that cancelling mid-stream stores the partial response as cancelled"""
+        import asyncio
+        from services.chat_service import GenerationCancelled, GENERATION_CANCELLED
+
+        chat_service = make_chat_service(["Partial", " answer"], delay=0.05)
+        first_delta = asyncio.Event()
+
+        async def consume():
+            async for event in chat_service.stream_message(sample_interaction_session.id, "Hi", async_session):
+                if event["type"] == "ai_delta":
+                    first_delta.set()
+
+        task = asyncio.create_task(consume())
+        await first_delta.wait()
+        task.cancel()
+        with pytest.raises(GenerationCancelled) as exc_info:
+            await task
+
+        assert exc_info.value.payload.content == "Partial"
+        payloads = InteractionService().get_session_payloads(session, sample_interaction_session.id)
+        assert [(p.content, p.ok, p.err) for p in payloads[1:]] == [("Partial", False, GENERATION_CANCELLED)]
+
+    @pytest.mark.asyncio
+    async def test_send_message(self, session: Session, async_session: AsyncSession, sample_interaction_session):
+        """Test the non-streaming async pipeline"""
+        chat_service = make_chat_service(["Hello", " there"])
+        result = await chat_service.send_message(sample_interaction_session.id, "Hi", async_session)
+
+        assert result["user_message"]["content"] == "Hi"
+        assert result["ai_response"]["content"] == "Hello there"
+        assert result["ai_response"]["id"] is not None
+
+    @pytest.mark.asyncio
+    async def test_send_message_respects_concurrency_limit(self, session: Session, sample_interaction_session):
+        """Test that generations are capped by the scheduler's concurrency"""
+        import asyncio
+        from types import SimpleNamespace
+
+        chat_service = make_chat_service(["ok"])
+        chat_service.scheduler = GenerationScheduler(max_concurrency=1)
+        in_flight = 0
+        peak = 0
+
+        # Keep the database out of the picture; only generation concurrency matters here
+        async def store(session_id, content, db_session, err=None):
+            return SimpleNamespace(id=1, content=content, created_at=None)
+
+        async def get_interaction_session(session_id, db_session):
+            return sample_interaction_session
+
+        async def build(interaction_session, db_session):
+            return ConversationContext()
+
+        chat_service._get_interaction_session = get_interaction_session
+        chat_service._store_user_message = store
+        chat_service._store_ai_message = store
+        chat_service.context_builder.build = build
+
+        async def slow_generate(conversation_history, context_summary=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return "ok"
+
+        chat_service.gemini_client.generate_response_async = slow_generate
+        await asyncio.gather(*[
+            chat_service.send_message(sample_interaction_session.id, f"Hi {i}", session)
+            for i in range(3)
+        ])
+        assert peak == 1
+
+
+class TestMemoryRetrieval:
+    """Test the retrieval stage of the chat pipeline"""
+
+    @pytest.fixture
+    def retrieval_chat_service(self, monkeypatch):
+        from lib.embedding_model import EmbeddingModel
+        from services.retrieval import MemoryRetriever
+
+        monkeypatch.setattr("lib.embedding_model.embedding_cache", None)
+        model = EmbeddingModel("small-model", factory=lambda name: lambda texts: [[1.0, 0.0] for _ in texts])
+        model.load()
+        chroma = FakeChromaOps()
+        for collection_id, documents in ((1, {"a": ("Alex likes tea", 0.2), "b": ("Alex lives in Oslo", 0.1)}), (2, {"c": ("Tea time is 5pm", 0.3)})):
+            name = chroma.collection_name(collection_id)
+            chroma.get_or_create_collection(name)
+            for doc_id, (text, distance) in documents.items():
+                chroma.upsert_data(name, ids=[doc_id], documents=[text], metadatas=[{"distance": distance}])
+
+        chat_service = make_chat_service(["Hello"])
+        chat_service.retriever = MemoryRetriever(
+            collection_ids=[1, 2], top_k=2, budget_ms=500, model=model, chroma=chroma, timings=chat_service.timings
+        )
+        return chat_service
+
+    @pytest.mark.asyncio
+    async def test_passages_added_to_prompt(self, async_session: AsyncSession, retrieval_chat_service, sample_interaction_session):
+        """Test that the closest passages across collections precede the user's message"""
+        await retrieval_chat_service.send_message(sample_interaction_session.id, "Where does Alex live?", async_session)
+
+        prompt = retrieval_chat_service.gemini_client.client.models.calls[-1][-1].parts[0].text
+        assert prompt.index("Alex lives in Oslo") < prompt.index("Alex likes tea") < prompt.index("Where does Alex live?")
+        assert "Tea time" not in prompt
+        assert {"context", "retrieval", "retrieval_embed", "retrieval_query", "generation"} <= set(retrieval_chat_service.timings.stats())
+
+    @pytest.mark.asyncio
+    async def test_over_budget_retrieval_skipped(self, async_session: AsyncSession, retrieval_chat_service, sample_interaction_session):
+        """Test that a slow vector store does not hold up the reply"""
+        retrieval_chat_service.retriever.budget = 0.02
+        retrieval_chat_service.retriever.chroma.query_delay = 0.2
+
+        result = await retrieval_chat_service.send_message(sample_interaction_session.id, "Where does Alex live?", async_session)
+
+        prompt = retrieval_chat_service.gemini_client.client.models.calls[-1][-1].parts[0].text
+        assert result["ai_response"]["content"] == "Hello"
+        assert prompt == "Where does Alex live?"
+        assert retrieval_chat_service.retriever.stats()["skipped"] == {"timeout": 1}
+
+    @pytest.mark.asyncio
+    async def test_skipped_until_model_loaded(self, retrieval_chat_service):
+        """Test that retrieval does not load the embedding model in the request path"""
+        from lib.embedding_model import EmbeddingModel
+
+        retrieval_chat_service.retriever.model = EmbeddingModel("cold-model", factory=lambda name: pytest.fail("loaded in request path"))
+        retrieval = await retrieval_chat_service.retriever.retrieve("Where does Alex live?")
+
+        assert retrieval.passages == []
+        assert retrieval.skipped == "model_not_ready"
+
+    @pytest.mark.asyncio
+    async def test_retrieves_from_chroma_collection(self, chroma_client, monkeypatch):
+        """Test that queries are embedded by the same model as the stored vectors in a real Chroma collection"""
+        from lib.chroma import CachedEmbeddingFunction, ChromaOps
+        from lib.embedding_model import EmbeddingModel
+        from services.retrieval import MemoryRetriever
+
+        monkeypatch.setattr("lib.embedding_model.embedding_cache", None)
+        model = EmbeddingModel("small-model", factory=lambda name: lambda texts: [[float(len(text)), 1.0] for text in texts])
+        model.load()
+        chroma = ChromaOps(client=chroma_client, embedding_function=CachedEmbeddingFunction(model))
+        name = chroma.collection_name(1)
+        chroma.get_or_create_collection(name)
+        chroma.upsert_data(name, ids=["a", "b"], documents=["Alex likes tea", "Alex lives in Oslo, Norway"])
+
+        retriever = MemoryRetriever(collection_ids=[1], top_k=1, budget_ms=2000, model=model, chroma=chroma)
+        retrieval = await retriever.retrieve("Where is Alex?")
+
+        assert retrieval.skipped is None
+        assert retrieval.passages == ["Alex likes tea"]
+
+
+class TestContextBuilder:
+    """Test the token-budgeted context builder"""
+
+    def add_turns(self, session: Session, session_id: str, count: int):
+        from data.models import InteractionPayloadCreate
+
+        service = InteractionService()
+        for i in range(count):
+            service.create_payload(session, InteractionPayloadCreate(
+                session_id=session_id,
+                content=f"turn {i} " + "x" * 36,
+                ok=True,
+                **{"from": InteractionFrom.USER if i % 2 == 0 else InteractionFrom.MODEL}
+            ))
+
+    @pytest.mark.asyncio
+    async def test_build_within_budget(self, session: Session, async_session: AsyncSession, sample_interaction_session):
+        """Test that short sessions are sent verbatim without summarizing"""
+        self.add_turns(session, sample_interaction_session.id, 4)
+        summarizer = FakeGenaiClient(["new summary"])
+        builder = ContextBuilder(summarizer=GeminiClient(genai_client=summarizer), token_budget=1000)
+        interaction_session = await async_session.get(InteractionSession, sample_interaction_session.id)
+
+        context = await builder.build(interaction_session, async_session)
+
+        assert len(context.history) == 4
+        assert context.summary == "Testing the chat functionality"
+        assert summarizer.models.calls == []
+
+    @pytest.mark.asyncio
+    async def test_build_folds_old_turns(self, session: Session, async_session: AsyncSession, sample_interaction_session):
+        """Test that turns over budget are folded into context_summary"""
+        self.add_turns(session, sample_interaction_session.id, 20)
+        summarizer = FakeGenaiClient(["new summary"])
+        builder = ContextBuilder(summarizer=GeminiClient(genai_client=summarizer), token_budget=100, keep_ratio=0.5)
+        interaction_session = await async_session.get(InteractionSession, sample_interaction_session.id)
+
+        context = await builder.build(interaction_session, async_session)
+
+        assert context.summary == "new summary"
+        assert 0 < len(context.history) < 20
+        assert context.history[-1]["content"].startswith("turn 19")
+        assert sum(len(m["content"]) // 4 + 1 for m in context.history) <= 50
+        assert interaction_session.context_summary == "new summary"
+        assert interaction_session.summarized_through_id is not None
+
+        # The next turn reuses the stored summary instead of re-folding
+        summarizer.models.calls.clear()
+        context = await builder.build(interaction_session, async_session)
+        assert summarizer.models.calls == []
+        assert context.summary == "new summary"
+
+    @pytest.mark.asyncio
+    async def test_build_survives_summarizer_failure(self, session: Session, async_session: AsyncSession, sample_interaction_session):
+        """Test that a failing summarizer falls back to the newest turns that fit"""
+        self.add_turns(session, sample_interaction_session.id, 20)
+        summarizer = FakeGenaiClient([], error=RuntimeError("down"))
+        builder = ContextBuilder(summarizer=GeminiClient(genai_client=summarizer), token_budget=100)
+        interaction_session = await async_session.get(InteractionSession, sample_interaction_session.id)
+
+        context = await builder.build(interaction_session, async_session)
+
+        assert context.history[-1]["content"].startswith("turn 19")
+        assert sum(len(m["content"]) // 4 + 1 for m in context.history) <= 100
+        assert interaction_session.summarized_through_id is None
+
+    @pytest.mark.asyncio
+    async def test_append_during_summary_not_lost(self, session: Session, async_session: AsyncSession, sample_interaction_session):
+        """Test that a payload stored while old turns are being folded is in the next context"""
+        from data.models import InteractionPayloadCreate
+
+        self.add_turns(session, sample_interaction_session.id, 20)
+        builder = ContextBuilder(summarizer=GeminiClient(genai_client=FakeGenaiClient(["new summary"])), token_budget=100, keep_ratio=0.5)
+        interaction_session = await async_session.get(InteractionSession, sample_interaction_session.id)
+        summarize = builder.summarizer.generate_response_async
+
+        async def slow_summarize(*args, **kwargs):
+            await asyncio.sleep(0.01)
+            InteractionService().create_payload(session, InteractionPayloadCreate(
+                session_id=sample_interaction_session.id, content="late turn", ok=True, **{"from": InteractionFrom.USER}
+            ))
+            return await summarize(*args, **kwargs)
+
+        builder.summarizer.generate_response_async = slow_summarize
+        await builder.build(interaction_session, async_session)
+        builder.summarizer.generate_response_async = summarize
+
+        context = await builder.build(interaction_session, async_session)
+        assert context.history[-1] == {"role": "user", "content": "late turn"}
+
+    @pytest.mark.asyncio
+    async def test_summary_not_starved_by_interactive_load(self, session: Session, async_session: AsyncSession, sample_interaction_session):
+        """Test that the inline summary queues with interactive requests, not behind all of them"""
+        import asyncio
+
+        self.add_turns(session, sample_interaction_session.id, 20)
+        scheduler = GenerationScheduler(max_concurrency=1, max_queue=10)
+        builder = ContextBuilder(summarizer=GeminiClient(genai_client=FakeGenaiClient(["new summary"])), token_budget=100, scheduler=scheduler)
+        interaction_session = await async_session.get(InteractionSession, sample_interaction_session.id)
+        order = []
+        summarize = builder.summarizer.generate_response_async
+
+        async def recorded_summarize(*args, **kwargs):
+            order.append("summary")
+            return await summarize(*args, **kwargs)
+
+        async def other(name):
+            async with scheduler.slot("other"):
+                order.append(name)
+
+        builder.summarizer.generate_response_async = recorded_summarize
+        await scheduler.acquire("holder")
+        others = [asyncio.create_task(other(f"o{i}")) for i in range(3)]
+        build = asyncio.create_task(builder.build(interaction_session, async_session))
+        while scheduler.queued < 4:
+            await asyncio.sleep(0.001)
+        scheduler.release()
+        await asyncio.gather(build, *others)
+
+        # Round-robin with the other session instead of waiting for it to drain
+        assert order[:4] == ["o0", "summary", "o1", "o2"]
+        assert build.result().summary == "new summary"
+
+
+class TestSessionHistoryCache:
+    """Test the per-session history cache used by the context builder"""
+
+    @pytest.mark.asyncio
+    async def test_hot_session_skips_payload_reads(self, session: Session, async_session: AsyncSession, sample_interaction_session, monkeypatch):
+        """Test that a cached session builds its context without reading payloads"""
+        from data.models import InteractionPayloadCreate
+
+        service = InteractionService()
+        builder = ContextBuilder(summarizer=GeminiClient(genai_client=FakeGenaiClient(["s"])), token_budget=1000)
+        interaction_session = await async_session.get(InteractionSession, sample_interaction_session.id)
+        await builder.build(interaction_session, async_session)
+
+        service.create_payload(session, InteractionPayloadCreate(
+            session_id=sample_interaction_session.id, content="Hi", ok=True, **{"from": InteractionFrom.USER}
+        ))
+
+        def fail(*args, **kwargs):
+            raise AssertionError("payloads should come from the cache")
+
+        monkeypatch.setattr(builder.interaction_service, "get_session_payloads_after", fail)
+        context = await builder.build(interaction_session, async_session)
+        assert context.history == [{"role": "user", "content": "Hi"}]
+
+    @pytest.mark.asyncio
+    async def test_update_payload_invalidates(self, session: Session, async_session: AsyncSession, sample_interaction_payload):
+        """Test that editing a payload drops its session from the cache"""
+        from data.models import InteractionPayloadUpdate
+        from services.history_cache import history_cache
+
+        builder = ContextBuilder(summarizer=GeminiClient(genai_client=FakeGenaiClient(["s"])), token_budget=1000)
+        interaction_session = await async_session.get(InteractionSession, sample_interaction_payload.session_id)
+        await builder.build(interaction_session, async_session)
+        assert history_cache.get(interaction_session.id, None) is not None
+
+        InteractionService().update_payload(session, sample_interaction_payload.id, InteractionPayloadUpdate(content="Edited"))
+        assert history_cache.get(interaction_session.id, None) is None
+
+        context = await builder.build(interaction_session, async_session)
+        assert context.history == [{"role": "user", "content": "Edited"}]
+
+    def test_lru_eviction(self):
+        """Test that the cache is bounded by the configured number of sessions"""
+        from services.history_cache import SessionHistoryCache
+
+        cache = SessionHistoryCache(max_sessions=2)
+        for session_id in ["a", "b", "c"]:
+            cache.put(session_id, None, [], cache.version(session_id))
+
+        assert cache.get("a", None) is None
+        assert cache.get("c", None) == []
+        assert cache.stats()["evictions"] == 1
+
+
+class TestPayloadWriter:
+    """Test the group-commit payload writer"""
+
+    def payload(self, session_id: str, content: str):
+        from data.models import InteractionPayloadCreate
+
+        return InteractionPayloadCreate(session_id=session_id, content=content, ok=True, **{"from": InteractionFrom.USER})
+
+    @pytest.mark.asyncio
+    async def test_concurrent_writes_share_a_commit(self, session: Session, sample_interaction_session):
+        """Test that concurrent inserts are committed together and get their own ids back"""
+        import asyncio
+        from services.payload_writer import PayloadWriter
+
+        writer = PayloadWriter(engine=session.get_bind(), window_ms=20)
+        records = await asyncio.gather(*[
+            writer.write(self.payload(sample_interaction_session.id, f"message {i}")) for i in range(5)
+        ])
+
+        assert writer.stats()["batches"] == 1
+        assert [r.content for r in records] == [f"message {i}" for i in range(5)]
+        assert len({r.id for r in records}) == 5
+        assert all(r.created_at is not None for r in records)
+        stored = InteractionService().get_session_payloads(session, sample_interaction_session.id)
+        assert [p.id for p in stored] == [r.id for r in records]
+
+    @pytest.mark.asyncio
+    async def test_batch_size_is_capped(self, session: Session, sample_interaction_session):
+        """Test that a batch never exceeds max_batch rows"""
+        import asyncio
+        from services.payload_writer import PayloadWriter
+
+        writer = PayloadWriter(engine=session.get_bind(), window_ms=20, max_batch=2)
+        await asyncio.gather(*[
+            writer.write(self.payload(sample_interaction_session.id, f"message {i}")) for i in range(5)
+        ])
+        assert writer.stats()["batches"] == 3
+
+    @pytest.mark.asyncio
+    async def test_failed_commit_reaches_every_caller(self, session: Session, sample_interaction_session):
+        """Test that a failing commit raises for all callers in the batch"""
+        import asyncio
+        from services.payload_writer import PayloadWriter
+
+        writer = PayloadWriter(engine=session.get_bind(), window_ms=20)
+
+        def fail(payloads):
+            raise RuntimeError("disk full")
+
+        writer._commit = fail
+        results = await asyncio.gather(*[
+            writer.write(self.payload(sample_interaction_session.id, f"message {i}")) for i in range(2)
+        ], return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+
+    @pytest.mark.asyncio
+    async def test_synchronous_level_not_leaked_to_pool(self, db_url, sample_interaction_session):
+        """Test that the writer's PRAGMA synchronous is undone before its connection goes back to the pool"""
+        from sqlmodel import create_engine
+        from db import configure_sqlite
+        from services.payload_writer import PayloadWriter
+
+        engine = configure_sqlite(create_engine(db_url, pool_size=1, max_overflow=0))
+        writer = PayloadWriter(engine=engine, window_ms=0, synchronous="OFF")
+        try:
+            with engine.connect() as connection:
+                profile_level = connection.exec_driver_sql("PRAGMA synchronous").scalar()
+            record = await writer.write(self.payload(sample_interaction_session.id, "message"))
+
+            assert record.id is not None
+            with engine.connect() as connection:
+                assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == profile_level
+        finally:
+            engine.dispose()
+
+class TestGenerationScheduler:
+    """Test admission control and ordering in GenerationScheduler"""
+
+    @pytest.mark.asyncio
+    async def test_priority_and_session_fairness(self):
+        """Test that interactive waiters go first, round-robin across sessions"""
+        import asyncio
+
+        scheduler = GenerationScheduler(max_concurrency=1, max_queue=10)
+        order = []
+
+        async def job(session_id, name, priority=Priority.INTERACTIVE):
+            async with scheduler.slot(session_id, priority):
+                order.append(name)
+
+        await scheduler.acquire("holder")
+        tasks = [
+            asyncio.create_task(job("s0", "summary", Priority.BACKGROUND)),
+            asyncio.create_task(job("s1", "a1")),
+            asyncio.create_task(job("s1", "a2")),
+            asyncio.create_task(job("s1", "a3")),
+            asyncio.create_task(job("s2", "b1")),
+        ]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+        assert order == ["a1", "b1", "a2", "a3", "summary"]
+        assert scheduler.stats()["running"] == 0
+        assert scheduler.stats()["admitted"] == 6
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_queue_full(self):
+        """Test that requests beyond the queue bound fail fast with SchedulerBusy"""
+        import asyncio
+
+        scheduler = GenerationScheduler(max_concurrency=1, max_queue=1)
+        await scheduler.acquire("s1")
+        waiter = asyncio.create_task(scheduler.acquire("s2"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(SchedulerBusy):
+            scheduler.ensure_capacity()
+        with pytest.raises(SchedulerBusy):
+            await scheduler.acquire("s3")
+        assert scheduler.stats()["rejected"] == 2
+
+        # A cancelled waiter gives its queue position back
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert scheduler.queued == 0
+        scheduler.ensure_capacity()
+        scheduler.release()
+        assert scheduler.running == 0
+
+    @pytest.mark.asyncio
+    async def test_reservation_holds_a_queue_position(self):
+        """Test that a reserved request is admitted even when the queue filled up after reserving"""
+        import asyncio
+
+        scheduler = GenerationScheduler(max_concurrency=1, max_queue=1)
+        await scheduler.acquire("s1")
+        reservation = scheduler.reserve()
+
+        with pytest.raises(SchedulerBusy):
+            scheduler.reserve()
+        with pytest.raises(SchedulerBusy):
+            await scheduler.acquire("s2")
+
+        waiter = asyncio.create_task(scheduler.acquire("s3", reservation=reservation))
+        await asyncio.sleep(0)
+        assert (scheduler.queued, scheduler.reserved) == (1, 0)
+        scheduler.release()
+        await waiter
+        assert reservation.release() is False
+        scheduler.release()
+        assert scheduler.running == 0
+
+
+class TestConnectionRegistry:
+    """Test the WebSocket connection registry shared between workers"""
+
+    @pytest.fixture
+    def workers(self, tmp_path):
+        from services.connection_registry import SQLiteConnectionRegistry
+
+        path = str(tmp_path / "connections.db")
+        return SQLiteConnectionRegistry(path, poll_interval=0.01), SQLiteConnectionRegistry(path, poll_interval=0.01)
+
+    @pytest.mark.asyncio
+    async def test_one_socket_per_session_across_workers(self, workers):
+        """Test that a session claimed by one worker cannot be claimed by another until released"""
+        first, second = workers
+
+        async def deliver(frame):
+            pass
+
+        assert await first.claim("s1", deliver)
+        assert not await second.claim("s1", deliver)
+        assert await second.sessions() == ["s1"]
+        stats = await second.stats()
+        assert (stats["connections"], stats["workers"], stats["local_connections"]) == (1, 1, 0)
+
+        await first.release("s1")
+        assert await second.claim("s1", deliver)
+
+    @pytest.mark.asyncio
+    async def test_publish_reaches_the_worker_holding_the_socket(self, workers):
+        """Test that a frame published on one worker is delivered by the worker that holds the socket"""
+        import asyncio
+
+        first, second = workers
+        received = asyncio.Queue()
+        await first.claim("s1", received.put)
+
+        poller = asyncio.create_task(first.run())
+        try:
+            assert await second.publish("s1", {"type": "ai_response", "content": "Hi"})
+            frame = await asyncio.wait_for(received.get(), timeout=2)
+        finally:
+            poller.cancel()
+
+        assert frame == {"type": "ai_response", "content": "Hi"}
+        assert not await second.publish("nobody", {"type": "ping"})
+
+    @pytest.mark.asyncio
+    async def test_claims_of_dead_worker_are_taken_over(self, workers):
+        """Test that a worker that stopped heartbeating loses its sessions"""
+        first, second = workers
+
+        async def deliver(frame):
+            pass
+
+        await first.claim("s1", deliver)
+        first._execute("UPDATE chat_workers SET heartbeat_at = 0 WHERE worker_id = ?", (first.worker_id,))
+
+        assert await second.sessions() == []
+        assert await second.claim("s1", deliver)
+
+
+class TestChatRoutes:
+    """Test the chat WebSocket route"""
+
+    @pytest.fixture
+    def chat_routes(self, async_engine, monkeypatch):
+        from contextlib import asynccontextmanager
+        from api import chat_routes
+
+        @asynccontextmanager
+        async def session_override():
+            async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+                yield async_session
+
+        monkeypatch.setattr(chat_routes, "async_session_from_generator", session_override)
+        monkeypatch.setattr(chat_routes, "chat_service", make_chat_service(["Hel", "lo"]))
+        return chat_routes
+
+    @pytest.fixture
+    def slow_chat_routes(self, chat_routes, monkeypatch):
+        monkeypatch.setattr(chat_routes, "chat_service", make_chat_service(["Hel", "lo"], delay=0.2))
+        return chat_routes
+
+    def test_websocket_streams_deltas(self, client, chat_routes, sample_interaction_session):
+        """Test that the socket sends ai_delta frames before the final ai_response"""
+        with client.websocket_connect(f"/api/chat/ws/{sample_interaction_session.id}") as websocket:
+            websocket.send_json({"type": "message", "content": "Hi"})
+            frames = [websocket.receive_json() for _ in range(4)]
+
+        assert [f["type"] for f in frames] == ["user_message", "ai_delta", "ai_delta", "ai_response"]
+        assert [f["content"] for f in frames[1:3]] == ["Hel", "lo"]
+        assert frames[-1]["content"] == "Hello"
+        assert frames[-1]["payload_id"] is not None
+
+    def test_websocket_ping_during_generation(self, client, slow_chat_routes, sample_interaction_session):
+        """Test that pings are answered while a reply is still streaming"""
+        with client.websocket_connect(f"/api/chat/ws/{sample_interaction_session.id}") as websocket:
+            websocket.send_json({"type": "message", "content": "Hi"})
+            websocket.send_json({"type": "ping"})
+            frames = [websocket.receive_json() for _ in range(5)]
+
+        types = [f["type"] for f in frames]
+        assert types[-1] == "ai_response"
+        assert types.index("pong") < types.index("ai_delta")
+
+    def test_websocket_cancel(self, client, slow_chat_routes, sample_interaction_session):
+        """Test that a cancel frame stops the reply and returns the partial text"""
+        with client.websocket_connect(f"/api/chat/ws/{sample_interaction_session.id}") as websocket:
+            websocket.send_json({"type": "message", "content": "Hi"})
+            assert websocket.receive_json()["type"] == "user_message"
+            assert websocket.receive_json() == {"type": "ai_delta", "content": "Hel"}
+            websocket.send_json({"type": "cancel"})
+            frame = websocket.receive_json()
+
+        assert frame["type"] == "cancelled"
+        assert frame["content"] == "Hel"
+        assert frame["payload_id"] is not None
+
+    def test_websocket_disconnect_stops_worker(self, client, session: Session, slow_chat_routes, sample_interaction_session, monkeypatch):
+        """Test that closing the socket mid-reply ends the worker and stores the partial reply as cancelled"""
+        workers = []
+
+        class RecordingConnection(slow_chat_routes.ChatConnection):
+            async def process_messages(self):
+                workers.append(asyncio.current_task())
+                await super().process_messages()
+
+        monkeypatch.setattr(slow_chat_routes, "ChatConnection", RecordingConnection)
+        with client.websocket_connect(f"/api/chat/ws/{sample_interaction_session.id}") as websocket:
+            websocket.send_json({"type": "message", "content": "Hi"})
+            assert websocket.receive_json()["type"] == "user_message"
+            assert websocket.receive_json() == {"type": "ai_delta", "content": "Hel"}
+            # Closed from the client side; leaving the block would also cancel the app task
+            websocket.close()
+            deadline = time.monotonic() + 2
+            while not workers[0].done() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert workers[0].done()
+
+        payloads = InteractionService().get_session_payloads(session, sample_interaction_session.id)
+        assert [(p.content, p.err) for p in payloads][-1] == ("Hel", GENERATION_CANCELLED)
+
+    def test_websocket_busy(self, client, session: Session, chat_routes, sample_interaction_session):
+        """Test that a full generation queue is answered with a busy frame"""
+        chat_routes.chat_service.scheduler = GenerationScheduler(max_concurrency=1, max_queue=0)
+        chat_routes.chat_service.scheduler.running = 1
+        with client.websocket_connect(f"/api/chat/ws/{sample_interaction_session.id}") as websocket:
+            websocket.send_json({"type": "message", "content": "Hi"})
+            frame = websocket.receive_json()
+
+        assert frame["type"] == "busy"
+        assert InteractionService().get_session_payloads(session, sample_interaction_session.id) == []
+
+    def test_post_message_busy(self, client, chat_routes, sample_interaction_session):
+        """Test that the HTTP endpoint returns 503 when the generation queue is full"""
+        chat_routes.chat_service.scheduler = GenerationScheduler(max_concurrency=1, max_queue=0)
+        chat_routes.chat_service.scheduler.running = 1
+        response = client.post(f"/api/chat/{sample_interaction_session.id}/messages", json={"content": "Hi"})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    def test_post_message_circuit_open(self, client, chat_routes, sample_interaction_session):
+        """Test that the HTTP endpoint returns 503 with Retry-After while the Gemini circuit is open"""
+        breaker = chat_routes.chat_service.gemini_client.circuit_breaker
+        breaker.state, breaker.opened_at, breaker.reset_timeout = breaker.OPEN, time.monotonic(), 30
+        response = client.post(f"/api/chat/{sample_interaction_session.id}/messages", json={"content": "Hi"})
+
+        assert response.status_code == 503
+        assert 1 <= int(response.headers["Retry-After"]) <= 30
+
+    def test_post_message(self, client, chat_routes, sample_interaction_session):
+        """Test the HTTP endpoint returns the stored reply"""
+        response = client.post(f"/api/chat/{sample_interaction_session.id}/messages", json={"content": "Hi"})
+
+        assert response.status_code == 200
+        assert response.json()["ai_response"]["content"] == "Hello"
+
+    def test_stats(self, client, chat_routes):
+        """Test that /api/chat/stats reports every pipeline component"""
+        response = client.get("/api/chat/stats")
+
+        assert response.status_code == 200
+        assert response.json()["connection_registry"]["backend"] == "memory"
+
+    def test_post_message_reaches_open_socket(self, client, chat_routes, sample_interaction_session):
+        """Test that messages sent over HTTP are published to the session's WebSocket"""
+        with client.websocket_connect(f"/api/chat/ws/{sample_interaction_session.id}") as websocket:
+            assert client.get("/api/chat/active-connections").json() == {"active_sessions": [sample_interaction_session.id]}
+            client.post(f"/api/chat/{sample_interaction_session.id}/messages", json={"content": "Hi"})
+            frames = [websocket.receive_json() for _ in range(2)]
+
+        assert [(f["type"], f["content"]) for f in frames] == [("user_message", "Hi"), ("ai_response", "Hello")]
+        assert client.get("/api/chat/active-connections").json() == {"active_sessions": []}
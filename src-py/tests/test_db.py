@@ -0,0 +1,92 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel
+
+from data.migrations import MIGRATIONS, run_migrations
+
+
+class TestStorageProfile:
+    """Test the SQLite storage profile applied by db.configure_sqlite"""
+
+    def test_pragmas_applied_on_connect(self, session: Session):
+        """Test that connections run in WAL mode with relaxed fsyncs and a busy timeout"""
+        connection = session.connection()
+
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+
+    @pytest.mark.asyncio
+    async def test_read_engine_rejects_writes(self, async_read_engine, sample_interaction_session):
+        """Test that the read-only pool can read but not write"""
+        async with async_read_engine.connect() as connection:
+            count = await connection.scalar(text("SELECT COUNT(*) FROM interaction_sessions"))
+            assert count == 1
+            with pytest.raises(OperationalError):
+                await connection.execute(text("DELETE FROM interaction_sessions"))
+
+
+class TestMigrations:
+    """Test the versioned schema migration runner"""
+
+    def test_fresh_database_is_fully_migrated(self, session: Session):
+        """Test that every migration is recorded and the hot-path indexes exist"""
+        engine = session.get_bind()
+        indexes = {i["name"] for i in inspect(engine).get_indexes("interaction_payloads")}
+
+        assert "ix_interaction_payloads_session_id_created_at" in indexes
+        assert run_migrations(engine) == []
+        with engine.connect() as connection:
+            versions = [row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))]
+        assert versions == [m.version for m in MIGRATIONS]
+
+    def test_upgrades_existing_database_in_place(self, tmp_path):
+        """Test that a database created before the migrations gains the new column and indexes"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE interaction_sessions (id VARCHAR PRIMARY KEY, title VARCHAR(255) NOT NULL, "
+                "context_summary VARCHAR, started_at DATETIME NOT NULL)"
+            ))
+            connection.execute(text("INSERT INTO interaction_sessions VALUES ('s1', 'Old', NULL, '2024-01-01')"))
+        SQLModel.metadata.create_all(engine)
+
+        assert run_migrations(engine) == [m.version for m in MIGRATIONS]
+
+        inspector = inspect(engine)
+        assert "summarized_through_id" in {c["name"] for c in inspector.get_columns("interaction_sessions")}
+        assert {i["name"] for i in inspector.get_indexes("interaction_sessions")} == {"ix_interaction_sessions_started_at_id"}
+        with engine.connect() as connection:
+            plan = " ".join(str(row) for row in connection.execute(text(
+                "EXPLAIN QUERY PLAN SELECT * FROM interaction_payloads WHERE session_id = 's1' ORDER BY created_at"
+            )))
+        assert "ix_interaction_payloads_session_id_created_at" in plan
+        engine.dispose()
+
+    def test_payload_ids_become_autoincrement(self, tmp_path):
+        """Test that an interaction_payloads table from before AUTOINCREMENT is rebuilt with its rows and indexes"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE interaction_payloads (id INTEGER NOT NULL PRIMARY KEY, session_id VARCHAR NOT NULL, "
+                "content VARCHAR NOT NULL, ok BOOLEAN NOT NULL, err VARCHAR, from_ VARCHAR(5) NOT NULL, created_at DATETIME NOT NULL)"
+            ))
+            connection.execute(text(
+                "INSERT INTO interaction_payloads VALUES "
+                "(1, 's1', 'a', 1, NULL, 'USER', '2024-01-01'), (2, 's1', 'b', 1, NULL, 'MODEL', '2024-01-02')"
+            ))
+        SQLModel.metadata.create_all(engine)
+
+        run_migrations(engine)
+
+        with engine.begin() as connection:
+            ddl = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'interaction_payloads'")).scalar()
+            assert "AUTOINCREMENT" in ddl
+            assert connection.execute(text("SELECT id, content FROM interaction_payloads ORDER BY id")).all() == [(1, "a"), (2, "b")]
+            # A deleted top id is not handed out again
+            connection.execute(text("DELETE FROM interaction_payloads WHERE id = 2"))
+            connection.execute(text("INSERT INTO interaction_payloads (session_id, content, ok, from_, created_at) VALUES ('s1', 'c', 1, 'USER', '2024-01-03')"))
+            assert connection.execute(text("SELECT max(id) FROM interaction_payloads")).scalar() == 3
+        assert "ix_interaction_payloads_session_id_created_at" in {i["name"] for i in inspect(engine).get_indexes("interaction_payloads")}
+        engine.dispose()
@@ -0,0 +1,134 @@
+import threading
+import chromadb
+import pytest
+
+from lib.embedding_cache import EmbeddingCache
+from lib.embedding_model import EmbeddingModel
+
+
+class FakeEncoder:
+    """Records what it is asked to encode; each vector is derived from the text length"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 0.5] for text in texts]
+
+
+class TestEmbeddingCache:
+    """Test the content-hash embedding cache in front of the encoder"""
+
+    def test_only_unseen_texts_are_encoded(self, tmp_path):
+        """Test that repeats, in-batch duplicates and whitespace variants skip the encoder"""
+        cache = EmbeddingCache(str(tmp_path / "embeddings.db"), max_bytes=1024)
+        encoder = FakeEncoder()
+
+        first = cache.embed("model", ["alpha", "beta", "alpha"], encoder)
+        second = cache.embed("model", ["beta", " alpha\n", "gamma"], encoder)
+
+        assert encoder.calls == [["alpha", "beta"], ["gamma"]]
+        assert first == [[5.0, 0.5], [4.0, 0.5], [5.0, 0.5]]
+        assert second == [[4.0, 0.5], [5.0, 0.5], [5.0, 0.5]]
+        assert cache.stats()["hits"] == 2
+        assert cache.stats()["misses"] == 4
+
+    def test_key_includes_model(self, tmp_path):
+        """Test that the same text is encoded again for a different model"""
+        cache = EmbeddingCache(str(tmp_path / "embeddings.db"), max_bytes=1024)
+        encoder = FakeEncoder()
+
+        cache.embed("model-a", ["alpha"], encoder)
+        cache.embed("model-b", ["alpha"], encoder)
+
+        assert encoder.calls == [["alpha"], ["alpha"]]
+
+    def test_persisted_and_size_capped(self, tmp_path):
+        """Test that vectors survive a reopen and least recently used ones are evicted over the cap"""
+        path = str(tmp_path / "embeddings.db")
+        cache = EmbeddingCache(path, max_bytes=16)  # two float32 vectors of two dimensions
+        encoder = FakeEncoder()
+        cache.embed("model", ["a"], encoder)
+        cache.embed("model", ["bb"], encoder)
+        cache.embed("model", ["a"], encoder)
+        cache.embed("model", ["ccc"], encoder)
+
+        reopened = EmbeddingCache(path, max_bytes=16)
+        reopened.embed("model", ["a", "ccc", "bb"], encoder)
+
+        assert cache.stats()["evictions"] == 1
+        assert encoder.calls[-1] == ["bb"]
+
+
+class TestEmbeddingModel:
+    """Test lazy loading and warmup of the embedding model"""
+
+    def test_loaded_once_on_first_use(self, monkeypatch):
+        """Test that nothing loads until the first embed, and concurrent first uses share one load"""
+        monkeypatch.setattr("lib.embedding_model.embedding_cache", None)
+        loads = []
+
+        def factory(model_name):
+            loads.append(model_name)
+            return FakeEncoder()
+
+        model = EmbeddingModel("small-model", factory=factory)
+        assert not model.ready
+
+        threads = [threading.Thread(target=model.embed, args=(["text"],)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert loads == ["small-model"]
+        assert model.ready
+        assert model.embed(["abc"]) == [[3.0, 0.5]]
+
+    @pytest.mark.asyncio
+    async def test_failed_warmup_retried_on_use(self):
+        """Test that a failed background warmup is reported and the next use loads again"""
+        attempts = []
+
+        def factory(model_name):
+            attempts.append(model_name)
+            if len(attempts) == 1:
+                raise OSError("model download failed")
+            return FakeEncoder()
+
+        model = EmbeddingModel("small-model", factory=factory)
+        await model.warmup()
+        assert model.stats()["state"] == "failed"
+        assert not model.ready
+
+        model.load()
+        assert model.ready
+        assert model.stats()["state"] == "ready"
+
+
+class TestChromaOps:
+    """Test that Chroma collections embed through the memory embedding function"""
+
+    def test_upsert_uses_embedding_function(self, chroma_client):
+        """Test that documents are encoded by the configured function, not Chroma's default model"""
+        from lib.chroma import ChromaOps
+
+        class StubEmbeddingFunction(chromadb.EmbeddingFunction):
+            def __init__(self):
+                self.calls = []
+
+            def __call__(self, input):
+                self.calls.append(list(input))
+                return [[float(len(text)), 0.5] for text in input]
+
+        embedding_function = StubEmbeddingFunction()
+        chroma = ChromaOps(client=chroma_client, embedding_function=embedding_function)
+        name = chroma.collection_name(1)
+        chroma.get_or_create_collection(name)
+
+        chroma.upsert_data(name, ids=["a", "b"], documents=["tea", "coffee"])
+
+        assert embedding_function.calls == [["tea", "coffee"]]
+        stored = chroma.get_collection(name).get(ids=["a"], include=["embeddings"])
+        assert list(stored["embeddings"][0]) == [3.0, 0.5]
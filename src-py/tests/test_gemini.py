@@ -0,0 +1,283 @@
+import asyncio
+import pytest
+
+from google.genai import errors as genai_errors
+
+from lib.gemini import GeminiClient
+from lib.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    FatalGeminiError,
+    GeminiTimeout,
+    RetryableGeminiError,
+    RetryPolicy,
+)
+from lib.response_cache import ResponseCache, MemoryResponseStore, SQLiteResponseStore
+from lib.singleflight import SingleFlight
+from tests.fakes import FakeGenaiClient
+
+
+def make_cache(store=None, **kwargs) -> ResponseCache:
+    return ResponseCache(store or MemoryResponseStore(ttl=60, max_bytes=1024), **kwargs)
+
+
+def unavailable() -> genai_errors.ServerError:
+    return genai_errors.ServerError(503, {"error": {"code": 503, "message": "overloaded", "status": "UNAVAILABLE"}})
+
+
+def make_resilient_client(fake, max_attempts=3, **kwargs) -> GeminiClient:
+    return GeminiClient(
+        genai_client=fake,
+        coalescer=SingleFlight(),
+        retry_policy=RetryPolicy(max_attempts=max_attempts, base_delay=0),
+        breaker=kwargs.pop("breaker", None) or CircuitBreaker(failure_threshold=5, reset_timeout=60),
+        **kwargs
+    )
+
+
+class TestResponseCache:
+    """Test the exact-match Gemini response cache"""
+
+    def test_repeated_prompt_hits_cache(self):
+        """Test that an identical prompt is answered without calling Gemini"""
+        fake = FakeGenaiClient(["Hello!"])
+        cache = make_cache()
+        gemini = GeminiClient(genai_client=fake, cache=cache)
+
+        assert gemini.generate_single_response("Hi") == "Hello!"
+        assert gemini.generate_single_response("  Hi ") == "Hello!"
+
+        assert len(fake.models.calls) == 1
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_key_includes_system_instruction(self):
+        """Test that different system instructions don't share entries"""
+        fake = FakeGenaiClient(["Hello!"])
+        cache = make_cache()
+        GeminiClient(genai_client=fake, cache=cache).generate_single_response("Hi")
+        GeminiClient(system_instruction="Be terse.", genai_client=fake, cache=cache).generate_single_response("Hi")
+
+        assert len(fake.models.calls) == 2
+
+    def test_long_prompts_are_not_cached(self):
+        """Test that prompts above max_prompt_chars bypass the cache"""
+        fake = FakeGenaiClient(["ok"])
+        gemini = GeminiClient(genai_client=fake, cache=make_cache(max_prompt_chars=5))
+
+        gemini.generate_single_response("a long question")
+        gemini.generate_single_response("a long question")
+
+        assert len(fake.models.calls) == 2
+
+    def test_errors_are_not_cached(self):
+        """Test that failed generations leave the cache empty"""
+        cache = make_cache()
+        gemini = GeminiClient(genai_client=FakeGenaiClient([], error=RuntimeError("down")), cache=cache)
+
+        with pytest.raises(Exception):
+            gemini.generate_single_response("Hi")
+        assert cache.stats()["entries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_stream_hit_yields_whole_response(self):
+        """Test that a cached streamed reply is replayed as one chunk"""
+        fake = FakeGenaiClient(["Hel", "lo"])
+        gemini = GeminiClient(genai_client=fake, cache=make_cache())
+        history = [{"role": "user", "content": "Hi"}]
+
+        first = [c async for c in gemini.generate_response_stream_async(history)]
+        second = [c async for c in gemini.generate_response_stream_async(history)]
+
+        assert first == ["Hel", "lo"]
+        assert second == ["Hello"]
+        assert len(fake.models.calls) == 1
+
+    def test_memory_store_lru_eviction(self):
+        """Test that the memory store evicts least recently used entries over its byte cap"""
+        store = MemoryResponseStore(ttl=60, max_bytes=10)
+        store.set("a", "12345")
+        store.set("b", "12345")
+        store.get("a")
+        store.set("c", "12345")
+
+        assert store.get("a") == "12345"
+        assert store.get("b") is None
+        assert store.stats()["evictions"] == 1
+
+    def test_memory_store_ttl(self):
+        """Test that expired entries are misses"""
+        store = MemoryResponseStore(ttl=0, max_bytes=1024)
+        store.set("a", "x")
+        assert store.get("a") is None
+
+    def test_sqlite_store(self, tmp_path):
+        """Test the on-disk store round trip, TTL and byte cap"""
+        store = SQLiteResponseStore(str(tmp_path / "cache.db"), ttl=60, max_bytes=10)
+        store.set("a", "12345")
+        store.set("b", "12345")
+        assert store.get("a") == "12345"
+
+        store.set("c", "12345")
+        assert store.get("b") is None
+        assert store.stats()["entries"] == 2
+
+        reopened = SQLiteResponseStore(str(tmp_path / "cache.db"), ttl=60, max_bytes=10)
+        assert reopened.get("c") == "12345"
+
+
+class TestSingleFlight:
+    """Test coalescing of identical in-flight Gemini requests"""
+
+    @pytest.mark.asyncio
+    async def test_identical_requests_share_one_call(self):
+        """Test that concurrent identical requests make one upstream call"""
+        fake = FakeGenaiClient(["Hello!"], delay=0.01)
+        coalescer = SingleFlight()
+        gemini = GeminiClient(genai_client=fake, coalescer=coalescer)
+        history = [{"role": "user", "content": "Hi"}]
+
+        results = await asyncio.gather(*[gemini.generate_response_async(history) for _ in range(3)])
+
+        assert results == ["Hello!"] * 3
+        assert len(fake.models.calls) == 1
+        assert coalescer.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 2}
+
+    @pytest.mark.asyncio
+    async def test_different_requests_are_not_coalesced(self):
+        """Test that different prompts run independently"""
+        fake = FakeGenaiClient(["ok"], delay=0.01)
+        gemini = GeminiClient(genai_client=fake, coalescer=SingleFlight())
+
+        await asyncio.gather(
+            gemini.generate_response_async([{"role": "user", "content": "Hi"}]),
+            gemini.generate_response_async([{"role": "user", "content": "Hello"}]),
+        )
+        assert len(fake.models.calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_errors_propagate_and_are_not_cached(self):
+        """Test that every waiter sees the error and the next call retries upstream"""
+        fake = FakeGenaiClient([], error=RuntimeError("down"), delay=0.01)
+        gemini = GeminiClient(genai_client=fake, coalescer=SingleFlight())
+        history = [{"role": "user", "content": "Hi"}]
+
+        results = await asyncio.gather(
+            *[gemini.generate_response_async(history) for _ in range(2)], return_exceptions=True
+        )
+        assert all("down" in str(r) for r in results)
+        assert len(fake.models.calls) == 1
+
+        with pytest.raises(Exception, match="down"):
+            await gemini.generate_response_async(history)
+        assert len(fake.models.calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_others(self):
+        """Test that one caller going away leaves the shared call running"""
+        fake = FakeGenaiClient(["Hello!"], delay=0.02)
+        gemini = GeminiClient(genai_client=fake, coalescer=SingleFlight())
+        history = [{"role": "user", "content": "Hi"}]
+
+        first = asyncio.create_task(gemini.generate_response_async(history))
+        second = asyncio.create_task(gemini.generate_response_async(history))
+        await asyncio.sleep(0.005)
+        first.cancel()
+
+        assert await second == "Hello!"
+        assert first.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_streams_fan_out(self):
+        """Test that concurrent identical streams share chunks from one upstream stream"""
+        fake = FakeGenaiClient(["Hel", "lo"], delay=0.01)
+        gemini = GeminiClient(genai_client=fake, coalescer=SingleFlight())
+        history = [{"role": "user", "content": "Hi"}]
+
+        async def collect():
+            return [c async for c in gemini.generate_response_stream_async(history)]
+
+        results = await asyncio.gather(collect(), collect())
+
+        assert results == [["Hel", "lo"], ["Hel", "lo"]]
+        assert len(fake.models.calls) == 1
+
+
+class TestResilience:
+    """Test retries, deadlines and the circuit breaker in GeminiClient"""
+
+    @pytest.mark.asyncio
+    async def test_retryable_errors_are_retried(self):
+        """Test that transient upstream errors are retried until the call succeeds"""
+        fake = FakeGenaiClient(["ok"], error=unavailable(), fail_times=2)
+        gemini = make_resilient_client(fake)
+
+        assert await gemini.generate_single_response_async("Hi") == "ok"
+        assert len(fake.models.calls) == 3
+
+    def test_fatal_errors_are_not_retried(self):
+        """Test that a bad request fails immediately with a typed error"""
+        error = genai_errors.ClientError(400, {"error": {"code": 400, "message": "bad", "status": "INVALID_ARGUMENT"}})
+        fake = FakeGenaiClient(["ok"], error=error)
+        gemini = make_resilient_client(fake)
+
+        with pytest.raises(FatalGeminiError) as exc_info:
+            gemini.generate_single_response("Hi")
+        assert exc_info.value.status_code == 400
+        assert len(fake.models.calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_attempts(self):
+        """Test that a persistent outage surfaces as RetryableGeminiError after the last attempt"""
+        fake = FakeGenaiClient(["ok"], error=unavailable())
+        gemini = make_resilient_client(fake, max_attempts=2)
+
+        with pytest.raises(RetryableGeminiError):
+            await gemini.generate_single_response_async("Hi")
+        assert len(fake.models.calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_deadline(self):
+        """Test that a slow upstream call is abandoned at its deadline"""
+        fake = FakeGenaiClient(["ok"], delay=0.5)
+        gemini = make_resilient_client(fake, max_attempts=1, timeout=0.05)
+
+        with pytest.raises(GeminiTimeout):
+            await gemini.generate_single_response_async("Hi")
+
+    @pytest.mark.asyncio
+    async def test_stream_retried_only_before_first_chunk(self):
+        """Test that streams are retried when nothing was yielded yet, and not afterwards"""
+        fake = FakeGenaiClient(["Hel", "lo"], error=unavailable(), fail_times=1)
+        gemini = make_resilient_client(fake)
+        history = [{"role": "user", "content": "Hi"}]
+        assert [c async for c in gemini.generate_response_stream_async(history)] == ["Hel", "lo"]
+        assert len(fake.models.calls) == 2
+
+        fake = FakeGenaiClient(["Hel", "lo"], error=unavailable(), fail_after=1, fail_times=1)
+        gemini = make_resilient_client(fake)
+        chunks = []
+        with pytest.raises(RetryableGeminiError):
+            async for chunk in gemini.generate_response_stream_async(history):
+                chunks.append(chunk)
+        assert chunks == ["Hel"]
+        assert len(fake.models.calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_circuit_breaker_fails_fast(self):
+        """Test that the breaker opens after repeated failures and recovers via a trial call"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        fake = FakeGenaiClient(["ok"], error=unavailable(), fail_times=2)
+        gemini = make_resilient_client(fake, max_attempts=1, breaker=breaker)
+
+        for _ in range(2):
+            with pytest.raises(RetryableGeminiError):
+                await gemini.generate_single_response_async("Hi")
+        with pytest.raises(CircuitOpenError):
+            await gemini.generate_single_response_async("Hi")
+        assert len(fake.models.calls) == 2
+        assert breaker.stats()["state"] == "open"
+
+        breaker.reset_timeout = 0
+        assert await gemini.generate_single_response_async("Hi") == "ok"
+        assert breaker.stats()["state"] == "closed"
@@ -1,8 +1,9 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session
+from datetime import datetime
 
-from data.models import InteractionPayloadCreate, InteractionPayloadUpdate, InteractionFrom
+from data.models import InteractionPayload, InteractionPayloadCreate, InteractionPayloadUpdate, InteractionFrom
 from services.interaction_service import InteractionService
 
 
@@ -75,6 +76,27 @@ class TestInteractionService:
         assert updated_payload.content == "Updated content"
         assert updated_payload.ok is False
 
+    def test_session_payloads_keyset_pages(self, session: Session, sample_interaction_session):
+        """Test that cursors page forwards and backwards exactly, even across equal timestamps"""
+        service = InteractionService()
+        created_at = datetime(2024, 1, 1, 12, 0, 0)
+        session.add_all([
+            InteractionPayload(session_id=sample_interaction_session.id, content=f"m{i}", from_=InteractionFrom.USER, created_at=created_at)
+            for i in range(5)
+        ])
+        session.commit()
+        pages = service.session_payload_pages
+
+        first = service.get_session_payloads(session, sample_interaction_session.id, limit=2)
+        second = service.get_session_payloads(session, sample_interaction_session.id, limit=2, after=pages.cursor(first[-1]))
+        back = service.get_session_payloads(session, sample_interaction_session.id, limit=2, before=pages.cursor(second[0]))
+
+        assert [p.content for p in first] == ["m0", "m1"]
+        assert [p.content for p in second] == ["m2", "m3"]
+        assert [p.id for p in back] == [p.id for p in first]
+        with pytest.raises(ValueError):
+            service.get_session_payloads(session, sample_interaction_session.id, after="not-a-cursor")
+
 
 class TestInteractionPayloadRoutes:
     """Test the interaction payload API routes"""
@@ -129,6 +151,26 @@ class TestInteractionPayloadRoutes:
         assert isinstance(data, list)
         assert len(data) >= 1
 
+    def test_get_payloads_cursor_pagination(self, client: TestClient, sample_interaction_session):
+        """Test paging /api/interaction-payloads/ with X-Next-Cursor until it runs out"""
+        for i in range(5):
+            client.post("/api/interaction-payloads/", json={
+                "session_id": sample_interaction_session.id, "content": f"m{i}", "from": "user"
+            })
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"after": cursor} if cursor else {})}
+            response = client.get("/api/interaction-payloads/", params=params)
+            assert response.status_code == 200
+            seen += [p["content"] for p in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        assert seen == ["m4", "m3", "m2", "m1", "m0"]
+        assert client.get("/api/interaction-payloads/?after=bogus").status_code == 400
+
     def test_update_payload_endpoint(self, client: TestClient, sample_interaction_payload):
         """Test PUT /api/interaction-payloads/{id}"""
         update_data = {
@@ -1,9 +1,14 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlmodel import Session, select
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from data.models import InteractionSessionCreate, InteractionSessionUpdate
-from services.interaction_service import InteractionService
+from data.models import InteractionSessionCreate, InteractionSessionUpdate, InteractionPayload, InteractionFrom
+from services.interaction_service import InteractionService, AsyncInteractionService
+from services.metadata_cache import metadata_cache
 
 
 class TestInteractionService:
@@ -63,6 +68,18 @@ class TestInteractionService:
         assert updated_session.title == "Updated Session"
         assert updated_session.context_summary == "Updated context"
 
+    def test_get_session_cached_until_update(self, session: Session, sample_interaction_session):
+        """Test that repeat lookups hit the metadata cache and an update invalidates it"""
+        service = InteractionService()
+        hits = metadata_cache.stats()["sessions"]["hits"]
+        service.get_session(session, sample_interaction_session.id)
+        service.get_session(session, sample_interaction_session.id)
+        assert metadata_cache.stats()["sessions"]["hits"] == hits + 1
+
+        service.update_session(session, sample_interaction_session.id, InteractionSessionUpdate(title="Renamed"))
+
+        assert service.get_session(session, sample_interaction_session.id).title == "Renamed"
+
     def test_delete_session(self, session: Session, sample_interaction_session):
         """Test deleting an interaction session"""
         service = InteractionService()
@@ -74,6 +91,143 @@ class TestInteractionService:
         sessions = service.get_sessions(session)
         assert not any(s.id == sample_interaction_session.id for s in sessions)
 
+    def test_delete_session_removes_payloads(self, session: Session, sample_interaction_payload):
+        """Test that payloads go with their session and unknown ids report False"""
+        service = InteractionService()
+
+        assert service.delete_session(session, sample_interaction_payload.session_id) is True
+        assert session.exec(select(InteractionPayload)).all() == []
+        assert service.delete_session(session, sample_interaction_payload.session_id) is False
+
+
+class TestAsyncInteractionService:
+    """Test the AsyncInteractionService class (sessions)"""
+
+    @pytest.mark.asyncio
+    async def test_create_and_update_session(self, async_session: AsyncSession):
+        """Test that writes through the async service are committed"""
+        service = AsyncInteractionService()
+        interaction_session = await service.create_session(async_session, InteractionSessionCreate(title="Async"))
+        updated = await service.update_session(
+            async_session, interaction_session.id, InteractionSessionUpdate(title="Renamed")
+        )
+
+        assert updated.title == "Renamed"
+        assert [s.title for s in await service.get_recent_sessions(async_session)] == ["Renamed"]
+
+    @pytest.mark.asyncio
+    async def test_get_session_with_payloads(self, async_session: AsyncSession, sample_interaction_payload):
+        """Test that payloads are loaded eagerly, so they can be read after the call"""
+        service = AsyncInteractionService()
+        interaction_session = await service.get_session_with_payloads(async_session, sample_interaction_payload.session_id)
+
+        assert [p.id for p in interaction_session.payloads] == [sample_interaction_payload.id]
+        assert (await service.get_session_with_payloads(async_session, "missing")) is None
+
+    @pytest.mark.asyncio
+    async def test_purge_session_in_chunks(self, async_session: AsyncSession, session: Session, sample_interaction_session):
+        """Test that a purge smaller than the session still removes every payload"""
+        session.add_all([
+            InteractionPayload(session_id=sample_interaction_session.id, content=f"m{i}", from_=InteractionFrom.USER)
+            for i in range(5)
+        ])
+        session.commit()
+        service = AsyncInteractionService()
+
+        assert await service.purge_session(async_session, sample_interaction_session.id, chunk_size=2) is True
+        assert (await async_session.exec(select(InteractionPayload))).all() == []
+        assert await service.get_session(async_session, sample_interaction_session.id) is None
+
+
+class TestSessionArchiver:
+    """Test cold-storage archival and rehydration of idle sessions"""
+
+    @pytest.fixture
+    def idle_session(self, session: Session, sample_interaction_session):
+        """A session whose three payloads are 60 days old, the last two covered by the summary"""
+        old = datetime.now() - timedelta(days=60)
+        payloads = [
+            InteractionPayload(session_id=sample_interaction_session.id, content=f"m{i}", from_=InteractionFrom.USER, created_at=old + timedelta(minutes=i))
+            for i in range(3)
+        ]
+        session.add_all(payloads)
+        session.commit()
+        sample_interaction_session.summarized_through_id = payloads[1].id
+        session.add(sample_interaction_session)
+        session.commit()
+        return sample_interaction_session
+
+    def test_archives_only_idle_sessions(self, session: Session, session_archiver, idle_session):
+        """Test that idle payloads move to a gzip file and the session is left as a stub"""
+        active = InteractionService().create_session(session, InteractionSessionCreate(title="Active"))
+        session.add(InteractionPayload(session_id=active.id, content="fresh", from_=InteractionFrom.USER))
+        session.commit()
+
+        assert session_archiver.archive_idle() == [idle_session.id]
+
+        session.refresh(idle_session)
+        assert idle_session.archived_at is not None
+        assert Path(idle_session.archive_path).exists()
+        assert [p.content for p in session.exec(select(InteractionPayload)).all()] == ["fresh"]
+        assert session_archiver.archive_idle() == []
+
+    @pytest.mark.asyncio
+    async def test_read_rehydrates(self, session: Session, async_session: AsyncSession, session_archiver, idle_session):
+        """Test that reading an archived session's payloads restores them under their original ids"""
+        original_ids = [p.id for p in InteractionService().get_session_payloads(session, idle_session.id)]
+        watermark = idle_session.summarized_through_id
+        session_archiver.archive_session(idle_session.id)
+        session.refresh(idle_session)
+        archive_path = Path(idle_session.archive_path)
+
+        payloads = await AsyncInteractionService().get_session_payloads(async_session, idle_session.id)
+
+        assert [p.content for p in payloads] == ["m0", "m1", "m2"]
+        assert [p.id for p in payloads] == original_ids
+        session.refresh(idle_session)
+        assert idle_session.archived_at is None
+        assert idle_session.summarized_through_id == watermark
+        assert not archive_path.exists()
+
+    def test_concurrent_rehydration_inserts_once(self, session: Session, session_archiver, idle_session):
+        """Test that two callers rehydrating the same session restore its payloads once"""
+        import threading
+
+        session.add_all([
+            InteractionPayload(session_id=idle_session.id, content=f"old {i}", from_=InteractionFrom.USER, created_at=datetime.now() - timedelta(days=60))
+            for i in range(200)
+        ])
+        session.commit()
+        session_archiver.archive_session(idle_session.id)
+        barrier = threading.Barrier(2)
+        results = []
+
+        def rehydrate():
+            barrier.wait()
+            results.append(session_archiver.rehydrate(idle_session.id))
+
+        threads = [threading.Thread(target=rehydrate) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(results) == [False, True]
+        assert len(session.exec(select(InteractionPayload).where(InteractionPayload.session_id == idle_session.id)).all()) == 203
+
+    def test_routes_rehydrate_and_delete(self, client: TestClient, session: Session, session_archiver, idle_session):
+        """Test chat history rehydrates through a read-only session and delete removes the archive file"""
+        session_archiver.archive_session(idle_session.id)
+
+        history = client.get(f"/api/chat/{idle_session.id}/history").json()
+        assert [m["content"] for m in history["messages"]] == ["m0", "m1", "m2"]
+
+        session_archiver.archive_session(idle_session.id)
+        session.refresh(idle_session)
+        archive_path = Path(idle_session.archive_path)
+        assert client.delete(f"/api/interaction-sessions/{idle_session.id}").status_code == 200
+        assert not archive_path.exists()
+
 
 class TestInteractionSessionRoutes:
     """Test the interaction session API routes"""
@@ -139,6 +293,40 @@ class TestInteractionSessionRoutes:
         
         assert response.status_code == 200
 
+    def test_session_with_payloads_streamed(self, client: TestClient, sample_interaction_session):
+        """Test that ?stream=true returns the session and every payload as NDJSON, oldest first"""
+        for i in range(3):
+            client.post("/api/interaction-payloads/", json={
+                "session_id": sample_interaction_session.id, "content": f"m{i}", "from": "user"
+            })
+        url = f"/api/interaction-sessions/{sample_interaction_session.id}/with-payloads"
+
+        assert "X-Next-Cursor" in client.get(url, params={"limit": 2}).headers
+        lines = [json.loads(line) for line in client.get(url, params={"limit": 2, "stream": True}).text.splitlines()]
+
+        assert lines[0]["id"] == sample_interaction_session.id
+        assert [p["content"] for p in lines[1:]] == ["m0", "m1", "m2"]
+        assert lines[1]["from"] == "user"
+
+    def test_purge_session_endpoint(self, client: TestClient, async_engine, monkeypatch, sample_interaction_payload):
+        """Test DELETE /api/interaction-sessions/{id}?purge=true answers 202 and purges in the background"""
+        from contextlib import asynccontextmanager
+        from api import interaction_routes
+
+        @asynccontextmanager
+        async def session_override():
+            async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+                yield async_session
+
+        monkeypatch.setattr(interaction_routes, "async_session_from_generator", session_override)
+        session_id = sample_interaction_payload.session_id
+
+        response = client.delete(f"/api/interaction-sessions/{session_id}?purge=true")
+
+        assert response.status_code == 202
+        assert client.get(f"/api/interaction-sessions/{session_id}").status_code == 404
+        assert client.delete("/api/interaction-sessions/missing?purge=true").status_code == 404
+
     def test_get_recent_sessions(self, client: TestClient):
         """Test GET /api/interaction-sessions/recent"""
         # Create multiple sessions
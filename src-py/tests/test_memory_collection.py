@@ -1,3 +1,4 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session
@@ -161,6 +162,29 @@ class TestMemoryCollectionRoutes:
         assert "documents" in data
         assert len(data["documents"]) >= 1
 
+    def test_collection_documents_paged_and_streamed(self, client: TestClient, sample_memory_collection):
+        """Test child paging, archived filtering and NDJSON streaming on /with-documents"""
+        collection_id = sample_memory_collection.id
+        ids = [
+            client.post("/api/memory-documents/", json={
+                "chroma_id": f"paged_{i}", "content": f"Document {i}", "collection_id": collection_id
+            }).json()["id"]
+            for i in range(5)
+        ]
+        client.delete(f"/api/memory-documents/{ids[4]}")
+        url = f"/api/memory-collections/{collection_id}/with-documents"
+
+        first = client.get(url, params={"limit": 2})
+        second = client.get(url, params={"limit": 2, "after": first.headers["X-Next-Cursor"]})
+        assert [d["id"] for d in first.json()["documents"] + second.json()["documents"]] == ids[:4]
+        assert len(client.get(url, params={"include_archived": True}).json()["documents"]) == 5
+
+        streamed = client.get(url, params={"limit": 2, "stream": True})
+        assert streamed.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in streamed.text.splitlines()]
+        assert lines[0]["id"] == collection_id and "documents" not in lines[0]
+        assert [d["id"] for d in lines[1:]] == ids[:4]
+
     def test_pagination(self, client: TestClient):
         """Test pagination parameters"""
         # Create multiple collections
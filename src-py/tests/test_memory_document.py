@@ -2,8 +2,11 @@ import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session
 
-from data.models import MemoryDocumentCreate, MemoryDocumentUpdate
+from data.models import IndexStatus, MemoryDocumentCreate, MemoryDocumentUpdate
 from services.memory_document_service import MemoryDocumentService
+from services.metadata_cache import metadata_cache
+from services.vector_index import VectorReconciler
+from tests.fakes import FakeChromaOps
 
 
 class TestMemoryDocumentService:
@@ -90,6 +93,20 @@ class TestMemoryDocumentService:
         assert updated_document.content == "Updated content"
         assert updated_document.updated_at >= original_updated_at
 
+    def test_chroma_id_lookup_invalidated_on_update(self, session: Session, sample_memory_document):
+        """Test that changing a document's chroma_id drops the cached lookup under the old one"""
+        service = MemoryDocumentService()
+        old_chroma_id = sample_memory_document.chroma_id
+        hits = metadata_cache.stats()["documents_by_chroma_id"]["hits"]
+        assert service.get_document_by_chroma_id(session, old_chroma_id) is not None
+        assert service.get_document_by_chroma_id(session, old_chroma_id) is not None
+        assert metadata_cache.stats()["documents_by_chroma_id"]["hits"] == hits + 1
+
+        service.update_document(session, sample_memory_document.id, MemoryDocumentUpdate(chroma_id="moved_chroma"))
+
+        assert service.get_document_by_chroma_id(session, old_chroma_id) is None
+        assert service.get_document_by_chroma_id(session, "moved_chroma").id == sample_memory_document.id
+
     def test_archive_document(self, session: Session, sample_memory_document):
         """Test archiving a memory document"""
         service = MemoryDocumentService()
@@ -114,6 +131,158 @@ class TestMemoryDocumentService:
         assert len(documents) >= 1
         assert any(d.id == sample_memory_document.id for d in documents)
 
+    def test_search_ranks_filters_and_pages(self, session: Session, sample_memory_collection):
+        """Test BM25 ordering, snippets, archived filtering and cursor paging"""
+        service = MemoryDocumentService()
+        contents = [
+            "Rust borrow checker notes",
+            "Rust rust rust: ownership, borrowing and the borrow checker in Rust",
+            "Gardening tips for spring",
+            "A brief mention of rust on old bicycles",
+        ]
+        documents = [
+            service.create_document(session, MemoryDocumentCreate(chroma_id=f"fts_{i}", content=c, collection_id=sample_memory_collection.id))
+            for i, c in enumerate(contents)
+        ]
+        service.archive_document(session, documents[3].id)
+
+        results = service.search_documents(session, "rust")
+        assert [r.id for r in results] == [documents[1].id, documents[0].id]
+        assert "<mark>Rust</mark>" in results[0].snippet
+        assert len(service.search_documents(session, "rust", include_archived=True)) == 3
+        assert service.search_documents(session, "rust", collection_id=sample_memory_collection.id + 1) == []
+
+        first = service.search_documents(session, "rust", limit=1)
+        second = service.search_documents(session, "rust", limit=1, after=service.search_cursor(first[0]))
+        assert [r.id for r in first + second] == [r.id for r in results]
+
+    def test_search_index_follows_updates(self, session: Session, sample_memory_document):
+        """Test that the FTS triggers reindex edited content and tolerate query punctuation"""
+        service = MemoryDocumentService()
+        service.update_document(session, sample_memory_document.id, MemoryDocumentUpdate(content="Entirely new wording"))
+
+        assert service.search_documents(session, "test memory") == []
+        assert [r.id for r in service.search_documents(session, 'new "word*')] == [sample_memory_document.id]
+
+
+class TestVectorReconciler:
+    """Test startup reconciliation of the Chroma store against memory_documents"""
+
+    @pytest.fixture
+    def reconciler(self, session: Session):
+        return VectorReconciler(engine=session.get_bind(), chroma=FakeChromaOps(), batch=2)
+
+    @pytest.fixture
+    def documents(self, session: Session, sample_memory_collection):
+        service = MemoryDocumentService()
+        return [
+            service.create_document(session, MemoryDocumentCreate(
+                chroma_id=f"chroma_{i}", content=f"doc {i}", collection_id=sample_memory_collection.id, metadatas={"n": i}
+            ))
+            for i in range(3)
+        ]
+
+    def test_embeds_only_missing_documents(self, reconciler, documents):
+        """Test that a second pass over an unchanged corpus encodes nothing"""
+        reconciler.reconcile()
+        reconciler.reconcile()
+
+        name = FakeChromaOps.collection_name(documents[0].collection_id)
+        assert sorted(reconciler.chroma.collections[name]) == ["chroma_0", "chroma_1", "chroma_2"]
+        assert reconciler.chroma.embedded == ["doc 0", "doc 1", "doc 2"]
+        assert reconciler.chroma.collections[name]["chroma_0"][1]["n"] == 0
+        assert reconciler.state == "ready"
+
+    def test_reembeds_stale_and_deletes_orphans(self, session: Session, reconciler, documents):
+        """Test that edited rows are re-embedded and vectors without an active row are removed"""
+        service = MemoryDocumentService()
+        name = FakeChromaOps.collection_name(documents[0].collection_id)
+        reconciler.reconcile()
+        service.update_document(session, documents[0].id, MemoryDocumentUpdate(content="doc 0 edited"))
+        service.archive_document(session, documents[1].id)
+        reconciler.chroma.upsert_data(name, ids=["gone"], documents=["gone"])
+        reconciler.chroma.embedded.clear()
+
+        reconciler.reconcile()
+
+        assert reconciler.chroma.embedded == ["doc 0 edited"]
+        assert sorted(reconciler.chroma.collections[name]) == ["chroma_0", "chroma_2"]
+
+
+class TestEmbeddingPipeline:
+    """Test write-behind indexing of documents into Chroma"""
+
+    def create(self, session: Session, collection_id: int, i: int):
+        return MemoryDocumentService().create_document(session, MemoryDocumentCreate(
+            chroma_id=f"chroma_{i}", content=f"doc {i}", collection_id=collection_id
+        ))
+
+    def test_creates_indexed_in_one_batch(self, session: Session, embedding_pipeline, sample_memory_collection, monkeypatch):
+        """Test that documents created together are embedded in one batch and marked indexed"""
+        monkeypatch.setattr(embedding_pipeline, "window", 0.5)
+        batches = embedding_pipeline.batches
+        documents = [self.create(session, sample_memory_collection.id, i) for i in range(3)]
+        assert documents[0].index_status == IndexStatus.PENDING
+
+        embedding_pipeline.flush()
+
+        assert embedding_pipeline.batches == batches + 1
+        assert embedding_pipeline.chroma.embedded == ["doc 0", "doc 1", "doc 2"]
+        for document in documents:
+            session.refresh(document)
+            assert document.index_status == IndexStatus.INDEXED
+
+    def test_failed_embedding_marks_documents(self, session: Session, embedding_pipeline, sample_memory_collection, monkeypatch):
+        """Test that a Chroma error leaves the documents marked failed"""
+        def fail(*args, **kwargs):
+            raise RuntimeError("encoder unavailable")
+
+        monkeypatch.setattr(embedding_pipeline.chroma, "upsert_data", fail)
+        document = self.create(session, sample_memory_collection.id, 0)
+        embedding_pipeline.flush()
+
+        session.refresh(document)
+        assert document.index_status == IndexStatus.FAILED
+
+    def test_moved_and_archived_vectors_removed(self, session: Session, embedding_pipeline, sample_memory_collection):
+        """Test that a changed chroma_id drops the old vector and archiving drops the document's vector"""
+        service = MemoryDocumentService()
+        name = FakeChromaOps.collection_name(sample_memory_collection.id)
+        moved = self.create(session, sample_memory_collection.id, 0)
+        archived = self.create(session, sample_memory_collection.id, 1)
+        embedding_pipeline.flush()
+
+        service.update_document(session, moved.id, MemoryDocumentUpdate(chroma_id="chroma_moved"))
+        service.archive_document(session, archived.id)
+        embedding_pipeline.flush()
+
+        assert sorted(embedding_pipeline.chroma.collections[name]) == ["chroma_moved"]
+
+    def test_metadata_update_hits_embedding_cache(self, session: Session, embedding_pipeline, sample_memory_collection, chroma_client, tmp_path, monkeypatch):
+        """Test that re-indexing a document whose content did not change is served by the embedding cache"""
+        from lib.chroma import CachedEmbeddingFunction, ChromaOps
+        from lib.embedding_cache import EmbeddingCache
+        from lib.embedding_model import EmbeddingModel
+        from tests.test_embeddings import FakeEncoder
+
+        cache = EmbeddingCache(str(tmp_path / "embeddings.db"), max_bytes=1024 * 1024)
+        monkeypatch.setattr("lib.embedding_model.embedding_cache", cache)
+        encoder = FakeEncoder()
+        model = EmbeddingModel("fake-model", factory=lambda name: encoder)
+        monkeypatch.setattr(embedding_pipeline, "_chroma", ChromaOps(client=chroma_client, embedding_function=CachedEmbeddingFunction(model)))
+        document = self.create(session, sample_memory_collection.id, 0)
+        embedding_pipeline.flush()
+
+        MemoryDocumentService().update_document(session, document.id, MemoryDocumentUpdate(metadatas={"tag": "tea"}))
+        embedding_pipeline.flush()
+
+        session.refresh(document)
+        assert document.index_status == IndexStatus.INDEXED
+        assert encoder.calls == [["doc 0"]]
+        assert cache.stats()["hits"] == 1
+        name = ChromaOps.collection_name(sample_memory_collection.id)
+        assert embedding_pipeline.chroma.get_metadatas(name, ["chroma_0"])["chroma_0"]["tag"] == "tea"
+
 
 class TestMemoryDocumentRoutes:
     """Test the memory document API routes"""
@@ -136,6 +305,13 @@ class TestMemoryDocumentRoutes:
         assert data["collection_id"] == sample_memory_collection.id
         assert "id" in data
 
+    def test_index_status_endpoint(self, client: TestClient, embedding_pipeline, sample_memory_document):
+        """Test that a document's index status is part of the API response"""
+        embedding_pipeline.flush()
+        response = client.get(f"/api/memory-documents/{sample_memory_document.id}")
+
+        assert response.json()["index_status"] == "indexed"
+
     def test_get_documents_endpoint(self, client: TestClient, sample_memory_document):
         """Test GET /api/memory-documents/"""
         response = client.get("/api/memory-documents/")
@@ -189,6 +365,8 @@ class TestMemoryDocumentRoutes:
         assert isinstance(data, list)
         # Should find our sample document which contains "test"
         assert any(d["id"] == sample_memory_document.id for d in data)
+        assert "<mark>" in data[0]["snippet"]
+        assert client.get("/api/memory-documents/search?q=test&after=bogus").status_code == 400
 
     def test_update_document_endpoint(self, client: TestClient, sample_memory_document):
         """Test PUT /api/memory-documents/{id}"""
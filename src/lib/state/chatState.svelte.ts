@@ -13,6 +13,7 @@ export interface ChatMessage {
   err?: string; 
   created_at: string;
   isLoading?: boolean; // Used for loading states like "Clara is thinking..."
+  isStreaming?: boolean; // Set once the first AI delta has replaced the loading text
 }
 
 export interface ChatSession {
@@ -154,6 +155,11 @@ export async function sendMessage(content: string): Promise<void> {
 
 
 
+export async function cancelGeneration(): Promise<void> {
+  const { wsState } = await import('./wsState.svelte.js');
+  wsState.cancel();
+}
+
 export async function loadSession(sessionId: string): Promise<void> {
   try {
     chatState.isLoading = true;
@@ -257,6 +263,18 @@ export async function connectWebSocket(sessionId: string): Promise<void> {
         chatState.messages.push(message);
       }
     },
+    onAiDelta: (content) => {
+      // Grow the loading message with streamed text until the final response arrives
+      const loadingIndex = chatState.messages.findIndex(m => m.isLoading === true);
+      if (loadingIndex !== -1) {
+        const loadingMessage = chatState.messages[loadingIndex];
+        chatState.messages[loadingIndex] = {
+          ...loadingMessage,
+          content: loadingMessage.isStreaming ? loadingMessage.content + content : content,
+          isStreaming: true
+        };
+      }
+    },
     onAiResponse: (message) => {
       // Find and replace the loading message with Clara's real response
       const loadingIndex = chatState.messages.findIndex(m => m.isLoading === true);
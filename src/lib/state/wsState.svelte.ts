@@ -8,7 +8,7 @@
 import type { ChatMessage } from './chatState.svelte.js';
 
 interface WebSocketMessage {
-  type: 'user_message' | 'ai_response' | 'error' | 'ping' | 'pong';
+  type: 'user_message' | 'ai_delta' | 'ai_response' | 'cancelled' | 'busy' | 'error' | 'ping' | 'pong';
   content?: string;
   payload_id?: number;
   timestamp?: string;
@@ -28,6 +28,7 @@ class WebSocketState {
   
   // Callbacks for handling different message types
   private onUserMessage?: (message: ChatMessage) => void;
+  private onAiDelta?: (content: string) => void;
   private onAiResponse?: (message: ChatMessage) => void;
   private onError?: (error: string) => void;
 
@@ -40,6 +41,7 @@ class WebSocketState {
     
     // Clear any existing handlers to prevent cross-session messages
     this.onUserMessage = undefined;
+    this.onAiDelta = undefined;
     this.onAiResponse = undefined;
     this.onError = undefined;
     
@@ -69,6 +71,7 @@ class WebSocketState {
     
     // Clear handlers to prevent any lingering callbacks
     this.onUserMessage = undefined;
+    this.onAiDelta = undefined;
     this.onAiResponse = undefined;
     this.onError = undefined;
   }
@@ -91,6 +94,13 @@ class WebSocketState {
     }
   }
 
+  // Stop the reply currently being generated; the server answers with a 'cancelled' frame
+  cancel() {
+    if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+      this.ws.send(JSON.stringify({ type: 'cancel' }));
+    }
+  }
+
   ping() {
     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
       this.ws.send(JSON.stringify({ type: 'ping' }));
@@ -100,10 +110,12 @@ class WebSocketState {
   // Set callback handlers
   setHandlers(handlers: {
     onUserMessage?: (message: ChatMessage) => void;
+    onAiDelta?: (content: string) => void;
     onAiResponse?: (message: ChatMessage) => void;
     onError?: (error: string) => void;
   }) {
     this.onUserMessage = handlers.onUserMessage;
+    this.onAiDelta = handlers.onAiDelta;
     this.onAiResponse = handlers.onAiResponse;
     this.onError = handlers.onError;
   }
@@ -165,6 +177,13 @@ class WebSocketState {
         }
         break;
 
+      case 'ai_delta':
+        // Partial AI text - the final ai_response carries the persisted message
+        if (message.content && this.onAiDelta) {
+          this.onAiDelta(message.content);
+        }
+        break;
+
       case 'ai_response':
         if (message.content && message.timestamp && this.onAiResponse) {
           // Only process if we have a valid payload_id from the server
@@ -184,6 +203,29 @@ class WebSocketState {
         }
         break;
 
+      case 'cancelled':
+        // The partial reply is persisted as a failed payload; show it in place of the loading message
+        if (message.payload_id && message.timestamp && this.onAiResponse) {
+          this.onAiResponse({
+            id: message.payload_id,
+            content: message.content || '',
+            from: 'model',
+            ok: false,
+            err: 'Generation cancelled',
+            created_at: message.timestamp
+          });
+        } else if (this.onError) {
+          this.onError('Generation cancelled');
+        }
+        break;
+
+      case 'busy':
+        // Rejected by admission control; nothing was stored, so the user can simply resend
+        if (this.onError) {
+          this.onError(message.message || 'Clara is busy, please try again shortly');
+        }
+        break;
+
       case 'error':
         const errorMsg = message.message || 'Unknown error occurred';
         console.error('Server error:', errorMsg);